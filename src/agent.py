@@ -1,5 +1,10 @@
-from dataclasses import dataclass
-from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import hashlib
+import json
 
 import pandas as pd
 from groq import Groq
@@ -11,22 +16,45 @@ from .prompts import (
     build_clinical_prompt,
     build_clinical_prompt_improved,
     case_to_free_text,
+    EvidencePack,
+    pack_evidence,
+)
+from .retriever import RetrieverBase
+from .decomposer import DECOMPOSER_MODEL, decompose_case_query
+from .fusion import retrieve_multi_aspect, retrieve_multi_aspect_with_main
+from . import evaluation
+from .evaluation import JUDGE_MODEL, calibrate_relevance_proxy, evaluate_system
+from .llm import chat_completion, get_llm_cache
+from .checkpoint import CheckpointLog, checkpoint_key
+from .config import (
+    SPECULATIVE_RETRIEVAL,
+    PIPELINED_EXPERIMENT,
+    EXPERIMENT_CHECKPOINT,
+    EXPERIMENT_CHECKPOINT_PATH,
+    RESUME_EXPERIMENT,
+    JUDGE_MODE,
+    RELEVANCE_PROXY,
+    RELEVANCE_PROXY_SAMPLE_FRACTION,
+    RELEVANCE_PROXY_MIN_SAMPLE,
+    RELEVANCE_PROXY_NEIGHBOURS,
+    RELEVANCE_PROXY_MIN_AGREEMENT,
+    PACK_EVIDENCE,
+    EVIDENCE_TOKEN_BUDGET,
 )
-from .retriever import VetRetriever
-from .decomposer import decompose_case_query
-from .fusion import retrieve_multi_aspect
-from .evaluation import evaluate_system
+
+GENERATOR_MODEL = "llama-3.3-70b-versatile"
 
 
 def generate_answer_with_groq(
     client: Groq,
     system_prompt: str,
     user_prompt: str,
-    model: str = "llama-3.3-70b-versatile",
+    model: str = GENERATOR_MODEL,
     temperature: float = 0.2,
     max_tokens: int = 1200,
 ) -> str:
-    resp = client.chat.completions.create(
+    answer = chat_completion(
+        client,
         model=model,
         temperature=temperature,
         max_tokens=max_tokens,
@@ -35,61 +63,114 @@ def generate_answer_with_groq(
             {"role": "user", "content": user_prompt},
         ],
     )
-    return resp.choices[0].message.content.strip()
+    return answer.strip()
+
+
+def answer_baseline(
+    client: Groq,
+    case: ClinicalCase,
+    query_str: str,
+    evidence_df: pd.DataFrame,
+    pack: Optional[EvidencePack] = None,
+) -> str:
+    user_prompt = build_clinical_prompt(case, query_str, evidence_df, pack)
+    return generate_answer_with_groq(client, SYSTEM_PROMPT, user_prompt)
 
 
 def rag_answer_case_baseline(
     client: Groq,
-    retriever: VetRetriever,
+    retriever: RetrieverBase,
     case: ClinicalCase,
 ) -> Dict[str, Any]:
     query_str = build_case_query(case)
     evidence_df = retriever.retrieve_with_rerank(query_str)
-    user_prompt = build_clinical_prompt(case, query_str, evidence_df)
-    answer = generate_answer_with_groq(client, SYSTEM_PROMPT, user_prompt)
+    pack = pack_evidence(evidence_df)
+    answer = answer_baseline(client, case, query_str, evidence_df, pack)
     return {
         "case": case,
         "query": query_str,
         "evidence": evidence_df,
+        "evidence_pack": pack,
         "answer": answer,
     }
 
 
+def decompose_and_retrieve(
+    client: Groq,
+    retriever: RetrieverBase,
+    main_query: str,
+) -> Tuple[List[str], pd.DataFrame]:
+    """
+    decompose_case_query + retrieve_multi_aspect with the main query
+    retrieved in a background thread while the decomposition LLM call is
+    in flight (its result is used when the decomposition falls back to,
+    or repeats, the main query). The new sub-queries are then retrieved
+    in one batch. Returns the same (sub_queries, evidence_df).
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        main = pool.submit(retriever.retrieve_with_rerank, main_query)
+        sub_queries = decompose_case_query(client, main_query)
+        evidence_df = retrieve_multi_aspect_with_main(retriever, main_query, main.result(), sub_queries)
+    return sub_queries, evidence_df
+
+
+def answer_improved(
+    client: Groq,
+    case: ClinicalCase,
+    main_query: str,
+    sub_queries: List[str],
+    evidence_df: pd.DataFrame,
+    pack: Optional[EvidencePack] = None,
+) -> str:
+    user_prompt = build_clinical_prompt_improved(case, main_query, sub_queries, evidence_df, pack)
+    return generate_answer_with_groq(client, SYSTEM_PROMPT, user_prompt)
+
+
 def rag_answer_case_improved(
     client: Groq,
-    retriever: VetRetriever,
+    retriever: RetrieverBase,
     case: ClinicalCase,
+    speculative: bool = SPECULATIVE_RETRIEVAL,
 ) -> Dict[str, Any]:
     main_query = build_case_query(case)
-    sub_queries = decompose_case_query(client, main_query)
-    evidence_df = retrieve_multi_aspect(retriever, sub_queries)
-    user_prompt = build_clinical_prompt_improved(case, main_query, sub_queries, evidence_df)
-    answer = generate_answer_with_groq(client, SYSTEM_PROMPT, user_prompt)
+    if speculative:
+        sub_queries, evidence_df = decompose_and_retrieve(client, retriever, main_query)
+    else:
+        sub_queries = decompose_case_query(client, main_query)
+        evidence_df = retrieve_multi_aspect(retriever, sub_queries)
+    pack = pack_evidence(evidence_df)
+    answer = answer_improved(client, case, main_query, sub_queries, evidence_df, pack)
     return {
         "case": case,
         "query": main_query,
         "sub_queries": sub_queries,
         "evidence": evidence_df,
+        "evidence_pack": pack,
         "answer": answer,
     }
 
 
+GPT_ONLY_SYSTEM_PROMPT = (
+    "You are a veterinary clinician. Answer based ONLY on your own general knowledge. "
+    "You do NOT have access to any external documents. If unsure, say so."
+)
+
+
+def answer_gpt_only(client: Groq, case_text: str) -> str:
+    user_prompt = f"Clinical case:\n{case_text}\n\nTask: Provide a structured clinical reasoning summary."
+    return generate_answer_with_groq(
+        client,
+        GPT_ONLY_SYSTEM_PROMPT,
+        user_prompt,
+    )
+
+
 def gpt_only_answer_case(client: Groq, case: ClinicalCase) -> Dict[str, Any]:
     """
     GPT-only baseline: no retrieval, only LLM prior.
     """
     case_text = case_to_free_text(case)
-    system_prompt = (
-        "You are a veterinary clinician. Answer based ONLY on your own general knowledge. "
-        "You do NOT have access to any external documents. If unsure, say so."
-    )
-    user_prompt = f"Clinical case:\n{case_text}\n\nTask: Provide a structured clinical reasoning summary."
-
-    answer = generate_answer_with_groq(
-        client,
-        system_prompt,
-        user_prompt,
-    )
+    answer = answer_gpt_only(client, case_text)
     return {
         "case": case,
         "query": case_text,
@@ -105,14 +186,44 @@ class EvalCase:
     gold_answer: str
 
 
+def eval_row(ec: EvalCase, system_name: str, out: Dict[str, Any]) -> Dict[str, Any]:
+    ev_df = out.get("evidence", pd.DataFrame())
+    pack = out.get("evidence_pack")
+    # Judge the passages the generator was shown
+    if pack is not None:
+        evidence_texts = list(pack.texts)
+    else:
+        evidence_texts = ev_df["text"].tolist() if not ev_df.empty else []
+    return {
+        "case_id": ec.case_id,
+        "system": system_name,
+        "query": out["query"],
+        "answer": out["answer"],
+        "evidence_texts": evidence_texts,
+        "gold_answer": ec.gold_answer,
+        # prompt tokens spent on evidence, and saved by packing it
+        "evidence_tokens": pack.tokens if pack else None,
+        "evidence_tokens_saved": pack.tokens_saved if pack else None,
+    }
+
+
 def build_eval_df_for_system(
     client: Groq,
-    retriever: VetRetriever,
+    retriever: RetrieverBase,
     eval_cases: List[EvalCase],
     system_name: str,
+    checkpoint: Optional[CheckpointLog] = None,
 ) -> pd.DataFrame:
+    """
+    With a checkpoint log, each case's row is appended as soon as it is
+    answered and cases already in the log are not answered again.
+    """
     rows = []
     for ec in eval_cases:
+        key = checkpoint_key(system_name, ec.case_id, "generate")
+        if checkpoint is not None and key in checkpoint:
+            rows.append(checkpoint.get(key))
+            continue
         if system_name == "baseline":
             out = rag_answer_case_baseline(client, retriever, ec.case)
         elif system_name == "improved":
@@ -122,17 +233,9 @@ def build_eval_df_for_system(
         else:
             raise ValueError(f"Unknown system_name={system_name}")
 
-        ev_df = out.get("evidence", pd.DataFrame())
-        evidence_texts = ev_df["text"].tolist() if not ev_df.empty else []
-
-        rows.append({
-            "case_id": ec.case_id,
-            "system": system_name,
-            "query": out["query"],
-            "answer": out["answer"],
-            "evidence_texts": evidence_texts,
-            "gold_answer": ec.gold_answer,
-        })
+        rows.append(eval_row(ec, system_name, out))
+        if checkpoint is not None:
+            checkpoint.put(key, rows[-1])
     return pd.DataFrame(rows)
 
 
@@ -329,31 +432,157 @@ def build_default_eval_cases() -> List[EvalCase]:
     ]
 
 
-def run_full_experiment(client: Groq, retriever: VetRetriever):
+SYSTEM_NAMES = ("baseline", "improved", "gpt_only")
+
+
+def experiment_fingerprint(eval_cases: List[EvalCase], relevance_proxy: bool = RELEVANCE_PROXY) -> Dict[str, Any]:
+    """
+    Settings the logged results of run_full_experiment depend on; a
+    checkpoint written with a different fingerprint is not resumed.
+    """
+    prompts = [
+        SYSTEM_PROMPT,
+        GPT_ONLY_SYSTEM_PROMPT,
+        evaluation.CORRECTNESS_RUBRIC,
+        evaluation.HALLUCINATION_SYSTEM_PROMPT,
+        evaluation.EVIDENCE_RELEVANCE_SYSTEM_PROMPT,
+        evaluation.EVIDENCE_RELEVANCE_BATCH_SYSTEM_PROMPT,
+    ]
+    cases = [dict(asdict(ec.case), case_id=ec.case_id, gold_answer=ec.gold_answer) for ec in eval_cases]
+    return {
+        "models": {"generator": GENERATOR_MODEL, "decomposer": DECOMPOSER_MODEL, "judge": JUDGE_MODEL},
+        "judge_mode": JUDGE_MODE,
+        "relevance_proxy": [
+            RELEVANCE_PROXY_SAMPLE_FRACTION, RELEVANCE_PROXY_MIN_SAMPLE,
+            RELEVANCE_PROXY_NEIGHBOURS, RELEVANCE_PROXY_MIN_AGREEMENT,
+        ] if relevance_proxy else None,
+        "evidence_packing": [PACK_EVIDENCE, EVIDENCE_TOKEN_BUDGET],
+        "prompts_sha256": hashlib.sha256(json.dumps(prompts).encode("utf-8")).hexdigest(),
+        "eval_cases_sha256": hashlib.sha256(json.dumps(cases, sort_keys=True).encode("utf-8")).hexdigest(),
+    }
+
+
+def run_full_experiment(
+    client: Groq,
+    retriever: RetrieverBase,
+    pipelined: bool = PIPELINED_EXPERIMENT,
+    resume: bool = RESUME_EXPERIMENT,
+    relevance_proxy: bool = RELEVANCE_PROXY,
+):
     """
     Run all three systems (baseline / improved / GPT-only)
     on the default evaluation set, compute metrics, and return
     evaluation DataFrames and aggregate scores.
+    pipelined=True runs everything as one task graph (see pipeline.py).
+    With EXPERIMENT_CHECKPOINT, progress is logged to
+    EXPERIMENT_CHECKPOINT_PATH; resume=True skips the work an interrupted
+    run with the same experiment_fingerprint already finished.
+    relevance_proxy=True grades evidence relevance with the calibrated
+    cross-encoder where it agrees with the LLM judge (see evaluation.py).
     """
     eval_cases = build_default_eval_cases()
 
-    print("Running Baseline RAG...")
-    df_baseline = build_eval_df_for_system(client, retriever, eval_cases, "baseline")
-
-    print("Running Improved RAG...")
-    df_improved = build_eval_df_for_system(client, retriever, eval_cases, "improved")
-
-    print("Running GPT-only...")
-    df_gptonly = build_eval_df_for_system(client, retriever, eval_cases, "gpt_only")
-
-    print("Evaluating Baseline...")
-    df_baseline_eval = evaluate_system(client, df_baseline)
-
-    print("Evaluating Improved...")
-    df_improved_eval = evaluate_system(client, df_improved)
-
-    print("Evaluating GPT-only...")
-    df_gpt_eval = evaluate_system(client, df_gptonly)
+    checkpoint = None
+    if EXPERIMENT_CHECKPOINT:
+        path = Path(__file__).resolve().parent.parent / EXPERIMENT_CHECKPOINT_PATH
+        checkpoint = CheckpointLog(
+            str(path), resume=resume, fingerprint=experiment_fingerprint(eval_cases, relevance_proxy)
+        )
+        if checkpoint.stale:
+            print(f"Not resuming from {path}: it was written with other experiment settings")
+        if checkpoint.resumed:
+            print(f"Resuming from {path}: {checkpoint.resumed} completed steps")
+
+    try:
+        if pipelined:
+            from .pipeline import run_experiment_pipelined
+
+            evals = run_experiment_pipelined(
+                client, retriever, eval_cases, checkpoint=checkpoint,
+                relevance_proxy=relevance_proxy, judge_mode=JUDGE_MODE,
+            )
+            df_baseline_eval, df_improved_eval, df_gpt_eval = (evals[name] for name in SYSTEM_NAMES)
+        else:
+            print("Running Baseline RAG...")
+            df_baseline = build_eval_df_for_system(client, retriever, eval_cases, "baseline", checkpoint)
+
+            print("Running Improved RAG...")
+            df_improved = build_eval_df_for_system(client, retriever, eval_cases, "improved", checkpoint)
+
+            print("Running GPT-only...")
+            df_gptonly = build_eval_df_for_system(client, retriever, eval_cases, "gpt_only", checkpoint)
+
+            proxy = None
+            if relevance_proxy:
+                print("Calibrating relevance proxy...")
+                proxy = calibrate_relevance_proxy(
+                    client, retriever.relevance_scores, [df_baseline, df_improved], checkpoint=checkpoint
+                )
+
+            print("Evaluating Baseline...")
+            df_baseline_eval = evaluate_system(
+                client, df_baseline, checkpoint=checkpoint, mode=JUDGE_MODE, relevance_proxy=proxy
+            )
+
+            print("Evaluating Improved...")
+            df_improved_eval = evaluate_system(
+                client, df_improved, checkpoint=checkpoint, mode=JUDGE_MODE, relevance_proxy=proxy
+            )
+
+            print("Evaluating GPT-only...")
+            df_gpt_eval = evaluate_system(client, df_gptonly, checkpoint=checkpoint, mode=JUDGE_MODE)
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+    return summarize_experiment(retriever, df_baseline_eval, df_improved_eval, df_gpt_eval)
+
+
+def summarize_experiment(
+    retriever: RetrieverBase,
+    df_baseline_eval: pd.DataFrame,
+    df_improved_eval: pd.DataFrame,
+    df_gpt_eval: pd.DataFrame,
+):
+    print(f"\nLLM cache: {get_llm_cache().stats()}")
+    print(f"Retriever caches: {retriever.cache_stats()}")
+
+    print("\nEvidence prompt tokens saved by packing, per case:")
+    for name, df in (("Baseline", df_baseline_eval), ("Improved", df_improved_eval)):
+        saved = df[["case_id", "evidence_tokens", "evidence_tokens_saved"]].dropna()
+        cases = ", ".join(
+            f"{r.case_id} {int(r.evidence_tokens_saved)}/{int(r.evidence_tokens + r.evidence_tokens_saved)}"
+            for r in saved.itertuples()
+        )
+        print(f"  {name}: {cases}")
+
+    print(f"\nJudge LLM calls and tokens per case, {JUDGE_MODE} mode / full mode:")
+    for name, df in (("Baseline", df_baseline_eval), ("Improved", df_improved_eval), ("GPT-only", df_gpt_eval)):
+        cost = df[["case_id", "judge_llm_calls", "judge_tokens", "full_judge_llm_calls", "full_judge_tokens"]].dropna()
+        if cost.empty:
+            continue
+        cases = ", ".join(
+            f"{r.case_id} {int(r.judge_llm_calls)}/{int(r.full_judge_llm_calls)} calls "
+            f"{int(r.judge_tokens)}/{int(r.full_judge_tokens)} tokens"
+            for r in cost.itertuples()
+        )
+        saved = 1 - cost["judge_tokens"].sum() / max(cost["full_judge_tokens"].sum(), 1)
+        print(f"  {name}: {cases}")
+        print(
+            f"    mean {cost['judge_llm_calls'].mean():.1f}/{cost['full_judge_llm_calls'].mean():.1f} calls, "
+            f"{cost['judge_tokens'].mean():.0f}/{cost['full_judge_tokens'].mean():.0f} tokens "
+            f"({saved:.0%} fewer tokens)"
+        )
+
+    graded = [
+        (name, df["relevance_proxy_passages"].dropna(), df["evidence_texts"])
+        for name, df in (("Baseline", df_baseline_eval), ("Improved", df_improved_eval))
+    ]
+    if any(proxy.sum() for _, proxy, _ in graded):
+        print("\nEvidence passages graded by the relevance proxy instead of the LLM:")
+        for name, proxy, evidence in graded:
+            passages = sum(min(len(ev), 3) for ev in evidence if isinstance(ev, list))
+            print(f"  {name}: {int(proxy.sum())}/{passages}")
 
     print("\n=== BASELINE ===")
     print(df_baseline_eval.mean(numeric_only=True))
@@ -0,0 +1,796 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import argparse
+import hashlib
+import json
+import subprocess
+import time
+
+import numpy as np
+import pandas as pd
+import faiss
+
+from .config import FAISS_INDEX_TYPE, FAISS_NPROBE, FAISS_EF_SEARCH, DENSE_RESCORE_FACTOR
+from .embeddings import (
+    FAISS_INDEX_TYPES,
+    EMBEDDING_STORAGES,
+    build_faiss_index,
+    search_params,
+    is_compressed_index,
+)
+from .fusion import retrieve_multi_aspect
+from .models import INFERENCE_BACKENDS, get_model, model_info, set_inference_threads
+from .retriever import VetRetriever, build_bm25, tokenize
+from .tagger import DEFAULT_TAG_VOCABULARY, Tagger, tag_chunks
+
+
+# ----- synthetic data -----
+
+def synthetic_embeddings(
+    n: int,
+    dim: int = 384,
+    n_clusters: int = 256,
+    noise: float = 0.35,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Clustered unit vectors, a rough stand-in for sentence embeddings
+    (topics = clusters, chunks = noisy points around them).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    assign = rng.integers(0, n_clusters, size=n)
+    embs = centers[assign] + noise * rng.standard_normal((n, dim)).astype("float32")
+    embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+    return embs
+
+
+SPECIES = ["dog", "cat", "horse", "cow", "sheep", "goat", "pig", "rabbit", "ferret", "parrot"]
+SIGNS = [
+    "vomiting", "diarrhea", "lethargy", "anorexia", "fever", "cough", "dyspnea",
+    "polyuria", "polydipsia", "pruritus", "lameness", "seizures", "ataxia",
+    "jaundice", "weight", "loss", "nasal", "discharge", "respiratory", "dehydration", "tachycardia", "anemia", "pain",
+]
+CONDITIONS = [
+    "parvovirus", "pancreatitis", "hyperthyroidism", "diabetes", "mellitus",
+    "chronic", "kidney", "disease", "renal", "failure", "hepatic", "lipidosis",
+    "gastric", "dilatation", "volvulus", "pyometra", "otitis", "dermatitis",
+    "mastitis", "laminitis", "colic", "bloat", "heartworm", "leptospirosis",
+    "ehrlichiosis", "toxoplasmosis", "hypoadrenocorticism", "cushing",
+    "osteoarthritis", "urolithiasis", "cystitis", "endocarditis", "cardiomyopathy",
+]
+TREATMENTS = [
+    "meloxicam", "carprofen", "amoxicillin", "clavulanate", "doxycycline",
+    "enrofloxacin", "metronidazole", "maropitant", "ondansetron", "furosemide",
+    "insulin", "methimazole", "prednisolone", "dexamethasone", "ivermectin",
+    "fluid", "therapy", "surgery", "analgesia", "dose", "mg", "kg", "daily",
+    "intravenous", "subcutaneous", "oral", "monitor", "serum", "glucose",
+]
+FILLER = [
+    "the", "of", "and", "in", "to", "a", "is", "with", "for", "may", "be",
+    "are", "or", "as", "patients", "clinical", "signs", "diagnosis", "treatment",
+    "cases", "blood", "test", "animals", "common", "usually", "should", "after",
+]
+
+
+def synthetic_corpus(
+    n_chunks: int,
+    words_per_chunk: int = 120,
+    n_rare_terms: int = 20_000,
+    chunks_per_page: int = 4,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Veterinary-looking chunk dicts (same keys as build_chunks).
+    Words are drawn Zipf-style from a small clinical vocabulary plus a
+    long tail of rare terms, which gives BM25 realistic posting lengths.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = np.array(
+        FILLER + SPECIES + SIGNS + CONDITIONS + TREATMENTS
+        + [f"term{i}" for i in range(n_rare_terms)]
+    )
+    probs = 1.0 / np.arange(1, len(vocab) + 1) ** 1.05
+    probs /= probs.sum()
+
+    docs: List[Dict[str, Any]] = []
+    block = 10_000
+    for start in range(0, n_chunks, block):
+        stop = min(start + block, n_chunks)
+        words = vocab[rng.choice(len(vocab), size=(stop - start, words_per_chunk), p=probs)]
+        species = rng.integers(0, len(SPECIES), size=stop - start)
+        for row, doc_id in enumerate(range(start, stop)):
+            text = SPECIES[species[row]] + " " + " ".join(words[row])
+            docs.append({
+                "doc_id": doc_id,
+                "page": doc_id // chunks_per_page + 1,
+                "text": text,
+            })
+    return tag_chunks(docs)
+
+
+def synthetic_queries(n: int, seed: int = 0) -> List[str]:
+    rng = np.random.default_rng(seed)
+    return [
+        f"{rng.choice(SPECIES)} with {rng.choice(SIGNS)} and {rng.choice(SIGNS)}: "
+        f"{rng.choice(CONDITIONS)} {rng.choice(TREATMENTS)}"
+        for _ in range(n)
+    ]
+
+
+class HashingEmbedder:
+    """
+    Offline stand-in for SentenceTransformer: hashed bag of words,
+    L2-normalised. Only the encode() signature used by VetRetriever.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for tok in tokenize(text):
+                h = int.from_bytes(hashlib.blake2b(tok.encode(), digest_size=8).digest(), "little")
+                out[row, h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.where(norms == 0, 1.0, norms)
+        return out
+
+
+class LexicalReranker:
+    """
+    Offline stand-in for CrossEncoder: query-term overlap per pair.
+    """
+
+    def predict(self, pairs: List[List[str]], **kwargs) -> np.ndarray:
+        scores = np.empty(len(pairs), dtype="float32")
+        for i, (query, text) in enumerate(pairs):
+            q = set(tokenize(query))
+            scores[i] = len(q.intersection(tokenize(text))) / max(len(q), 1)
+        return scores
+
+
+def _percentile_ms(latencies: Sequence[float], q: float) -> float:
+    return float(np.percentile(np.asarray(latencies) * 1000.0, q))
+
+
+# ----- ANN indexes -----
+
+def benchmark_ann(
+    embs: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    index_types: Sequence[str] = FAISS_INDEX_TYPES,
+    nprobe: int = FAISS_NPROBE,
+    ef_search: int = FAISS_EF_SEARCH,
+    storage: str = "float32",
+    rescore_factor: int = DENSE_RESCORE_FACTOR,
+) -> pd.DataFrame:
+    """
+    Build each index type over `embs` and compare it with the exact flat
+    index: recall@k, single-query p50/p99 latency, build time and
+    serialized size (a proxy for memory footprint).
+    Lossy indexes (SQ / PQ) are timed with the retriever's exact
+    rescoring of rescore_factor x k hits included.
+    """
+    exact = build_faiss_index(embs, index_type="flat", storage="float32")
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for index_type in index_types:
+        t0 = time.perf_counter()
+        if index_type == "flat" and storage == "float32":
+            index = exact
+        else:
+            index = build_faiss_index(embs, index_type=index_type, storage=storage)
+        build_s = time.perf_counter() - t0
+        params = search_params(index, nprobe=nprobe, ef_search=ef_search)
+        fetch = k * rescore_factor if is_compressed_index(index) else k
+
+        latencies: List[float] = []
+        found = np.full_like(truth, -1)
+        for i in range(len(queries)):
+            t0 = time.perf_counter()
+            _, idx = index.search(queries[i:i + 1], fetch, params=params)
+            row_idx = idx[0]
+            if fetch > k:
+                row_idx = row_idx[row_idx >= 0]
+                exact_scores = embs[row_idx] @ queries[i]
+                row_idx = row_idx[np.argsort(-exact_scores, kind="stable")]
+            latencies.append(time.perf_counter() - t0)
+            found[i, :len(row_idx[:k])] = row_idx[:k]
+
+        hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+        rows.append({
+            "index_type": index_type,
+            "storage": storage,
+            "num_vectors": int(index.ntotal),
+            "build_s": round(build_s, 3),
+            f"recall@{k}": hits / truth.size,
+            "p50_ms": _percentile_ms(latencies, 50),
+            "p99_ms": _percentile_ms(latencies, 99),
+            "memory_mb": len(faiss.serialize_index(index)) / 2 ** 20,
+        })
+    return pd.DataFrame(rows)
+
+
+def _run_ann(args: argparse.Namespace) -> pd.DataFrame:
+    embs = synthetic_embeddings(args.num_vectors, args.dim, seed=args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = embs[rng.integers(0, len(embs), size=args.num_queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return benchmark_ann(
+        embs, queries, k=args.k, index_types=args.index_types,
+        nprobe=args.nprobe, ef_search=args.ef_search, storage=args.storage,
+    )
+
+
+# ----- retrieval stages -----
+
+RETRIEVAL_STAGES = [
+    "query_encode",
+    "faiss_search",
+    "bm25_scoring",
+    "fuse_normalise",
+    "rerank",
+    "retrieve_with_rerank",
+    "retrieve_multi_aspect",
+]
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _timed(fn: Callable[[], Any]):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def time_retrieval_stages(
+    retriever: VetRetriever,
+    queries: List[str],
+    k_dense: int = 80,
+    k_bm25: int = 80,
+    alpha: float = 0.5,
+    top_k_candidates: int = 30,
+    top_k_final: int = 5,
+    sub_queries_per_case: int = 3,
+) -> Dict[str, List[float]]:
+    """
+    Per-query latency (seconds) of each VetRetriever stage, run one query
+    at a time in the same order as retrieve_many, plus the end-to-end
+    retrieve_with_rerank and retrieve_multi_aspect calls.
+    """
+    timings: Dict[str, List[float]] = {stage: [] for stage in RETRIEVAL_STAGES}
+    params = search_params(retriever.faiss_index, nprobe=retriever.nprobe, ef_search=retriever.ef_search)
+    k = min(k_dense, retriever.faiss_index.ntotal)
+
+    for query in queries:
+        q_emb, dt = _timed(lambda: retriever.query_embedder.encode(
+            [query], normalize_embeddings=True
+        ).astype("float32"))
+        timings["query_encode"].append(dt)
+
+        (scores, idx), dt = _timed(lambda: retriever.faiss_index.search(q_emb, k, params=params))
+        timings["faiss_search"].append(dt)
+        dense_hits = (idx[0].astype(np.int64), scores[0].astype(np.float64))
+
+        bm25_hits, dt = _timed(lambda: retriever.bm25.top_k(tokenize(query), k_bm25))
+        timings["bm25_scoring"].append(dt)
+
+        cand, dt = _timed(lambda: retriever._fuse_candidates(
+            dense_hits, bm25_hits, alpha, top_k_candidates
+        ))
+        timings["fuse_normalise"].append(dt)
+
+        _, dt = _timed(lambda: retriever.rerank_with_bge(query, cand, top_k=top_k_final))
+        timings["rerank"].append(dt)
+
+        _, dt = _timed(lambda: retriever.retrieve_with_rerank(
+            query, k_dense=k_dense, k_bm25=k_bm25, alpha=alpha,
+            top_k_candidates=top_k_candidates, top_k_final=top_k_final,
+        ))
+        timings["retrieve_with_rerank"].append(dt)
+
+    # Multi-aspect: group consecutive queries into sub-query sets.
+    for start in range(0, len(queries), sub_queries_per_case):
+        sub_queries = queries[start:start + sub_queries_per_case]
+        _, dt = _timed(lambda: retrieve_multi_aspect(
+            retriever, sub_queries, k_dense=k_dense, k_bm25=k_bm25, alpha=alpha,
+            top_k_candidates=top_k_candidates, top_k_final=top_k_final,
+        ))
+        timings["retrieve_multi_aspect"].append(dt)
+    return timings
+
+
+def benchmark_retrieval(
+    sizes: Sequence[int],
+    num_queries: int = 50,
+    dim: int = 384,
+    index_type: str = FAISS_INDEX_TYPE,
+    real_models: bool = False,
+    warmup: int = 3,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Build a synthetic corpus of each size and time every retrieval stage.
+    real_models=True uses the shared production embedder / cross-encoder
+    from models.py (needs the Hugging Face weights); otherwise the offline stand-ins are used,
+    so model stages measure harness overhead rather than inference.
+    """
+    if real_models:
+        query_embedder, reranker = None, None
+    else:
+        query_embedder, reranker = HashingEmbedder(dim), LexicalReranker()
+    queries = synthetic_queries(num_queries + warmup, seed=seed + 1)
+    commit = _git_commit()
+
+    rows = []
+    for n in sizes:
+        t0 = time.perf_counter()
+        docs = synthetic_corpus(n, seed=seed)
+        corpus_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        bm25 = build_bm25([d["text"] for d in docs])
+        bm25_build_s = time.perf_counter() - t0
+
+        embs = synthetic_embeddings(n, dim, seed=seed)
+        t0 = time.perf_counter()
+        faiss_index = build_faiss_index(embs, index_type=index_type)
+        faiss_build_s = time.perf_counter() - t0
+
+        retriever = VetRetriever(
+            docs, embs, faiss_index, bm25=bm25,
+            query_embedder=query_embedder, reranker=reranker,
+            # Time the models themselves, not cache hits on repeated queries.
+            query_cache_size=0, rerank_cache_size=0,
+        )
+        if real_models and retriever.query_embedder.get_sentence_embedding_dimension() != dim:
+            raise ValueError("--dim must match the embedding model dimension")
+
+        time_retrieval_stages(retriever, queries[:warmup])
+        timings = time_retrieval_stages(retriever, queries[warmup:])
+        print(
+            f"[benchmark] {n} chunks: corpus {corpus_s:.1f}s, "
+            f"bm25 build {bm25_build_s:.1f}s, faiss build {faiss_build_s:.1f}s"
+        )
+
+        for stage in RETRIEVAL_STAGES:
+            latencies = timings[stage]
+            rows.append({
+                "commit": commit,
+                "num_chunks": n,
+                "index_type": index_type,
+                "models": "real" if real_models else "synthetic",
+                "stage": stage,
+                "calls": len(latencies),
+                "mean_ms": float(np.mean(latencies) * 1000.0),
+                "p50_ms": _percentile_ms(latencies, 50),
+                "p95_ms": _percentile_ms(latencies, 95),
+                "p99_ms": _percentile_ms(latencies, 99),
+            })
+        del retriever, docs, embs, faiss_index, bm25
+    return pd.DataFrame(rows)
+
+
+def _run_retrieval(args: argparse.Namespace) -> pd.DataFrame:
+    return benchmark_retrieval(
+        args.sizes, num_queries=args.num_queries, dim=args.dim,
+        index_type=args.index_type, real_models=args.real_models,
+        warmup=args.warmup, seed=args.seed,
+    )
+
+
+# ----- model inference backends -----
+
+def _spearman(a: np.ndarray, b: np.ndarray) -> float:
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    ra -= ra.mean()
+    rb -= rb.mean()
+    denom = np.sqrt((ra ** 2).sum() * (rb ** 2).sum())
+    return float((ra * rb).sum() / denom) if denom else 1.0
+
+
+def _overlap_at_k(a: np.ndarray, b: np.ndarray, k: int) -> float:
+    top_a = set(np.argsort(-a)[:k].tolist())
+    top_b = set(np.argsort(-b)[:k].tolist())
+    return len(top_a & top_b) / k
+
+
+def benchmark_inference(
+    backends: Sequence[str] = INFERENCE_BACKENDS,
+    num_texts: int = 512,
+    num_queries: int = 50,
+    candidates_per_query: int = 30,
+    batch_size: int = 32,
+    k: int = 5,
+    threads: Optional[int] = None,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Compare inference backends for the embedder and the cross-encoder on
+    synthetic chunks: batch throughput, single-query latency (one query
+    encode / one query's candidate set reranked), weight size, and
+    agreement with the first backend (cosine of embeddings, Spearman
+    of rerank scores, top-k overlap of the induced rankings).
+    """
+    set_inference_threads(threads)
+    texts = [d["text"] for d in synthetic_corpus(num_texts, seed=seed)]
+    queries = synthetic_queries(num_queries, seed=seed + 1)
+    rng = np.random.default_rng(seed)
+    cand_idx = [rng.choice(num_texts, size=candidates_per_query, replace=False) for _ in queries]
+
+    reference: Dict[str, Any] = {}
+    rows = []
+    for backend in backends:
+        embedder = get_model("embedder", backend)
+        reranker = get_model("reranker", backend)
+        embedder.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+
+        # Embedder
+        t0 = time.perf_counter()
+        doc_embs = embedder.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        throughput = len(texts) / (time.perf_counter() - t0)
+        latencies, q_embs = [], []
+        for q in queries:
+            emb, dt = _timed(lambda: embedder.encode([q], normalize_embeddings=True))
+            latencies.append(dt)
+            q_embs.append(emb[0])
+        q_embs = np.asarray(q_embs)
+        sims = q_embs @ doc_embs.T
+
+        row = {
+            "model": "embedder",
+            "backend": backend,
+            "throughput_per_s": throughput,
+            "p50_ms": _percentile_ms(latencies, 50),
+            "p99_ms": _percentile_ms(latencies, 99),
+            "weights_mb": model_info()[("embedder", backend)].param_mb,
+        }
+        if "embedder" in reference:
+            ref_docs, ref_sims = reference["embedder"]
+            row["agreement"] = float(np.mean(np.sum(ref_docs * doc_embs, axis=1)))
+            row[f"overlap@{k}"] = float(np.mean([
+                _overlap_at_k(r, c, k) for r, c in zip(ref_sims, sims)
+            ]))
+        else:
+            reference["embedder"] = (doc_embs, sims)
+        rows.append(row)
+
+        # Cross-encoder
+        pairs = [[q, texts[i]] for q, idx in zip(queries, cand_idx) for i in idx]
+        t0 = time.perf_counter()
+        scores = np.asarray(reranker.predict(pairs, batch_size=batch_size))
+        throughput = len(pairs) / (time.perf_counter() - t0)
+        latencies = []
+        for q, idx in zip(queries, cand_idx):
+            _, dt = _timed(lambda: reranker.predict([[q, texts[i]] for i in idx], batch_size=batch_size))
+            latencies.append(dt)
+        scores = scores.reshape(len(queries), candidates_per_query)
+
+        row = {
+            "model": "reranker",
+            "backend": backend,
+            "throughput_per_s": throughput,
+            "p50_ms": _percentile_ms(latencies, 50),
+            "p99_ms": _percentile_ms(latencies, 99),
+            "weights_mb": model_info()[("reranker", backend)].param_mb,
+        }
+        if "reranker" in reference:
+            ref_scores = reference["reranker"]
+            row["agreement"] = float(np.mean([_spearman(r, c) for r, c in zip(ref_scores, scores)]))
+            row[f"overlap@{k}"] = float(np.mean([
+                _overlap_at_k(r, c, k) for r, c in zip(ref_scores, scores)
+            ]))
+        else:
+            reference["reranker"] = scores
+        rows.append(row)
+    return pd.DataFrame(rows).sort_values(["model", "backend"], kind="stable").reset_index(drop=True)
+
+
+def _run_inference(args: argparse.Namespace) -> pd.DataFrame:
+    return benchmark_inference(
+        args.backends, num_texts=args.num_texts, num_queries=args.num_queries,
+        batch_size=args.batch_size, threads=args.threads, seed=args.seed,
+    )
+
+
+# ----- adaptive reranking -----
+
+def _ndcg_at_k(reference: Sequence[int], found: Sequence[int], k: int) -> float:
+    """
+    NDCG of `found` against the `reference` ranking (gain k - rank).
+    """
+    gain = {doc: k - rank for rank, doc in enumerate(list(reference)[:k])}
+    dcg = sum(gain.get(doc, 0) / np.log2(rank + 2) for rank, doc in enumerate(list(found)[:k]))
+    ideal = sum((k - rank) / np.log2(rank + 2) for rank in range(min(k, len(gain))))
+    return dcg / ideal if ideal else 1.0
+
+
+def benchmark_adaptive_rerank(
+    retriever: VetRetriever,
+    queries: List[str],
+    top_k_candidates: int = 30,
+    top_k_final: int = 5,
+    stage_sizes: Sequence[int] = (5, 10),
+    margins: Sequence[float] = (0.0, 0.5, 1.0, 2.0),
+) -> pd.DataFrame:
+    """
+    Cross-encoder pairs scored by the cascaded reranker vs full reranking
+    of every candidate, and how much the final top-k moves (overlap,
+    exact match, NDCG with the full ranking as reference).
+    The rerank cache is bypassed so every pair counts.
+    """
+    saved_cache, retriever.rerank_cache = retriever.rerank_cache, None
+    try:
+        candidate_sets = retriever.hybrid_candidates_many(
+            queries, top_k=top_k_candidates, as_frame=False
+        )
+        start = retriever.rerank_pairs_scored
+        full = retriever.retrieve_many(
+            queries, top_k_candidates=top_k_candidates,
+            top_k_final=top_k_final, as_frame=False, adaptive=False,
+        )
+        full_pairs = retriever.rerank_pairs_scored - start
+        reference = [c.doc_idx.tolist() for c in full]
+
+        rows = []
+        for stage_size in stage_sizes:
+            for margin in margins:
+                start = retriever.rerank_pairs_scored
+                t0 = time.perf_counter()
+                adaptive = retriever._cascade_rerank(
+                    queries, candidate_sets, top_k_final,
+                    stage_size=stage_size, margin=margin,
+                )
+                elapsed = time.perf_counter() - t0
+                pairs = retriever.rerank_pairs_scored - start
+                found = [c.doc_idx.tolist() for c in adaptive]
+                rows.append({
+                    "stage_size": stage_size,
+                    "margin": margin,
+                    "pairs_full": full_pairs,
+                    "pairs_adaptive": pairs,
+                    "pairs_saved_pct": 100.0 * (1 - pairs / full_pairs) if full_pairs else 0.0,
+                    f"overlap@{top_k_final}": float(np.mean([
+                        len(set(r) & set(f)) / max(len(r), 1) for r, f in zip(reference, found)
+                    ])),
+                    "same_ranking_pct": 100.0 * float(np.mean([r == f for r, f in zip(reference, found)])),
+                    f"ndcg@{top_k_final}": float(np.mean([
+                        _ndcg_at_k(r, f, top_k_final) for r, f in zip(reference, found)
+                    ])),
+                    "rerank_s": elapsed,
+                })
+    finally:
+        retriever.rerank_cache = saved_cache
+    return pd.DataFrame(rows)
+
+
+def _run_rerank(args: argparse.Namespace) -> pd.DataFrame:
+    if args.eval_set:
+        # Real index and models, queries of the default evaluation cases.
+        from .agent import build_default_eval_cases
+        from .prompts import build_case_query
+        from .run import build_retriever
+
+        retriever = build_retriever()
+        queries = [build_case_query(c.case) for c in build_default_eval_cases()]
+    else:
+        docs = synthetic_corpus(args.num_chunks, seed=args.seed)
+        embs = synthetic_embeddings(len(docs), args.dim, seed=args.seed)
+        retriever = VetRetriever(
+            docs, embs, build_faiss_index(embs, index_type="flat"),
+            query_embedder=HashingEmbedder(args.dim), reranker=LexicalReranker(),
+        )
+        queries = synthetic_queries(args.num_queries, seed=args.seed + 1)
+    return benchmark_adaptive_rerank(
+        retriever, queries,
+        top_k_candidates=args.top_k_candidates, top_k_final=args.top_k_final,
+        stage_sizes=args.stage_sizes, margins=args.margins,
+    )
+
+
+# ----- tagging -----
+
+def synthetic_tag_vocabulary(
+    n_labels: int,
+    terms_per_label: int = 8,
+    n_rare_terms: int = 20_000,
+    seed: int = 0,
+) -> Dict[str, List[str]]:
+    """
+    DEFAULT_TAG_VOCABULARY padded to n_labels with labels whose terms are
+    words (or word stems) of the synthetic corpus, so they do match.
+    """
+    rng = np.random.default_rng(seed)
+    words = SIGNS + CONDITIONS + TREATMENTS + [f"term{i}" for i in range(n_rare_terms)]
+    vocabulary = dict(list(DEFAULT_TAG_VOCABULARY.items())[:n_labels])
+    for j in range(len(vocabulary), n_labels):
+        picks = rng.choice(len(words), size=terms_per_label, replace=False)
+        vocabulary[f"label{j}"] = [words[i][:max(4, len(words[i]) - 2)] for i in picks]
+    return vocabulary
+
+
+def _substring_tags(vocabulary: Dict[str, List[str]], texts: Sequence[str]) -> np.ndarray:
+    """
+    The old approach scaled up: lowercase each text and test every term
+    with `in` (cost grows with the number of terms).
+    """
+    n_words = max(1, (len(vocabulary) + 63) // 64)
+    bits = np.zeros((len(texts), n_words), dtype=np.uint64)
+    labels = list(vocabulary.items())
+    for row, text in enumerate(texts):
+        t = text.lower()
+        for j, (_, terms) in enumerate(labels):
+            if any(term in t for term in terms):
+                bits[row, j // 64] |= np.uint64(1) << np.uint64(j % 64)
+    return bits
+
+
+def benchmark_tagger(
+    texts: List[str],
+    label_counts: Sequence[int] = (2, 100, 500),
+    terms_per_label: int = 8,
+    batch_size: int = 1024,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Chunks/s and MB/s of the substring chain vs the compiled automaton
+    (per text, and batched), for growing vocabularies. `agree` is the
+    fraction of chunks whose label bitset equals the substring chain's.
+    """
+    megabytes = sum(len(t) for t in texts) / 1e6
+    rows = []
+    for n_labels in label_counts:
+        vocabulary = synthetic_tag_vocabulary(n_labels, terms_per_label, seed=seed)
+        n_terms = sum(len(terms) for terms in vocabulary.values())
+        tagger, build_s = _timed(lambda: Tagger(vocabulary))
+        reference, ref_s = _timed(lambda: _substring_tags(vocabulary, texts))
+        methods = [
+            ("substring", reference, ref_s),
+            ("automaton", *_timed(lambda: np.stack([tagger.tag_text(t) for t in texts]))),
+            ("automaton_batch", *_timed(lambda: tagger.tag_batch(texts, batch_size=batch_size))),
+        ]
+        for method, bits, seconds in methods:
+            rows.append({
+                "labels": n_labels,
+                "terms": n_terms,
+                "states": tagger.num_states,
+                "method": method,
+                "chunks": len(texts),
+                "seconds": seconds,
+                "chunks_per_s": len(texts) / seconds,
+                "mb_per_s": megabytes / seconds,
+                "build_ms": build_s * 1000.0 if method != "substring" else 0.0,
+                "agree": float(np.mean(np.all(bits == reference, axis=1))),
+            })
+    return pd.DataFrame(rows)
+
+
+def _run_tagger(args: argparse.Namespace) -> pd.DataFrame:
+    docs = synthetic_corpus(args.num_chunks, seed=args.seed)
+    return benchmark_tagger(
+        [d["text"] for d in docs], label_counts=args.labels,
+        terms_per_label=args.terms_per_label, batch_size=args.batch_size, seed=args.seed,
+    )
+
+
+def compare_results(
+    baseline: List[Dict[str, Any]],
+    current: List[Dict[str, Any]],
+    metric: str = "p50_ms",
+    threshold: float = 1.10,
+) -> pd.DataFrame:
+    """
+    Join two `retrieval` result files on (num_chunks, stage) and flag
+    stages whose metric grew by more than `threshold` (ratio).
+    """
+    keys = ["num_chunks", "stage"]
+    old = pd.DataFrame(baseline)[keys + [metric]]
+    new = pd.DataFrame(current)[keys + [metric]]
+    merged = old.merge(new, on=keys, suffixes=("_baseline", "_current"))
+    merged["ratio"] = merged[f"{metric}_current"] / merged[f"{metric}_baseline"]
+    merged["regression"] = merged["ratio"] > threshold
+    return merged
+
+
+def _run_compare(args: argparse.Namespace) -> pd.DataFrame:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    return compare_results(baseline, current, metric=args.metric, threshold=args.threshold)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="VetRAG offline benchmarks")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ann = sub.add_parser("ann", help="FAISS index types: recall@k vs flat, latency, memory")
+    ann.add_argument("--num-vectors", type=int, default=100_000)
+    ann.add_argument("--dim", type=int, default=384)
+    ann.add_argument("--num-queries", type=int, default=500)
+    ann.add_argument("--k", type=int, default=10)
+    ann.add_argument("--index-types", nargs="+", default=list(FAISS_INDEX_TYPES))
+    ann.add_argument("--nprobe", type=int, default=FAISS_NPROBE)
+    ann.add_argument("--ef-search", type=int, default=FAISS_EF_SEARCH)
+    ann.add_argument("--storage", default="float32", choices=EMBEDDING_STORAGES)
+    ann.add_argument("--seed", type=int, default=0)
+    ann.set_defaults(run=_run_ann)
+
+    retrieval = sub.add_parser("retrieval", help="per-stage VetRetriever latency on synthetic corpora")
+    retrieval.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    retrieval.add_argument("--num-queries", type=int, default=50)
+    retrieval.add_argument("--dim", type=int, default=384)
+    retrieval.add_argument("--index-type", default=FAISS_INDEX_TYPE, choices=FAISS_INDEX_TYPES)
+    retrieval.add_argument("--real-models", action="store_true",
+                           help="use the production embedder and cross-encoder")
+    retrieval.add_argument("--warmup", type=int, default=3)
+    retrieval.add_argument("--seed", type=int, default=0)
+    retrieval.set_defaults(run=_run_retrieval)
+
+    inference = sub.add_parser("inference", help="fp32 vs int8 models: throughput, latency, agreement")
+    inference.add_argument("--backends", nargs="+", default=list(INFERENCE_BACKENDS), choices=INFERENCE_BACKENDS)
+    inference.add_argument("--num-texts", type=int, default=512)
+    inference.add_argument("--num-queries", type=int, default=50)
+    inference.add_argument("--batch-size", type=int, default=32)
+    inference.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    inference.add_argument("--seed", type=int, default=0)
+    inference.set_defaults(run=_run_inference)
+
+    rerank = sub.add_parser("rerank", help="adaptive cascaded reranking: pairs saved vs ranking change")
+    rerank.add_argument("--eval-set", action="store_true",
+                        help="use the real index, models and default evaluation cases")
+    rerank.add_argument("--num-chunks", type=int, default=10_000)
+    rerank.add_argument("--num-queries", type=int, default=50)
+    rerank.add_argument("--dim", type=int, default=384)
+    rerank.add_argument("--top-k-candidates", type=int, default=30)
+    rerank.add_argument("--top-k-final", type=int, default=5)
+    rerank.add_argument("--stage-sizes", type=int, nargs="+", default=[5, 10])
+    rerank.add_argument("--margins", type=float, nargs="+", default=[0.0, 0.5, 1.0, 2.0])
+    rerank.add_argument("--seed", type=int, default=0)
+    rerank.set_defaults(run=_run_rerank)
+
+    tagger = sub.add_parser("tagger", help="chunk tagging throughput: substring chain vs automaton")
+    tagger.add_argument("--num-chunks", type=int, default=20_000)
+    tagger.add_argument("--labels", type=int, nargs="+", default=[2, 100, 500])
+    tagger.add_argument("--terms-per-label", type=int, default=8)
+    tagger.add_argument("--batch-size", type=int, default=1024)
+    tagger.add_argument("--seed", type=int, default=0)
+    tagger.set_defaults(run=_run_tagger)
+
+    compare = sub.add_parser("compare", help="compare two `retrieval` JSON result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--metric", default="p50_ms")
+    compare.add_argument("--threshold", type=float, default=1.10)
+    compare.set_defaults(run=_run_compare)
+
+    args = parser.parse_args(argv)
+    results = args.run(args)
+    print(results.to_string(index=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results.to_dict(orient="records"), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,594 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import math
+import threading
+import numpy as np
+
+# The two newest posting segments are merged while the newer one holds at
+# least this share of the older one's postings (log-structured merging).
+MERGE_RATIO = 0.5
+
+Segment = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]  # (terms, indptr, post_docs, post_tfs)
+
+
+def _csr(terms: np.ndarray, docs: np.ndarray, tfs: np.ndarray) -> Segment:
+    """
+    Segment from parallel posting arrays, over the terms present only.
+    Postings are listed in increasing doc order, so a stable sort by term
+    keeps each posting list sorted by doc.
+    """
+    if not len(terms):
+        return (np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+    order = np.argsort(terms, kind="stable")
+    terms = terms[order]
+    starts = np.flatnonzero(np.concatenate([[True], terms[1:] != terms[:-1]]))
+    indptr = np.append(starts, len(terms)).astype(np.int64)
+    return terms[starts], indptr, docs[order], tfs[order]
+
+
+def _build_segment(
+    corpus_tokens: List[List[str]],
+    vocab: Dict[str, int],
+    terms: List[str],
+    first_doc: int,
+) -> Tuple[Segment, np.ndarray]:
+    """
+    Postings for a batch of documents (rows first_doc, first_doc + 1, ...).
+    New terms are appended to `vocab` / `terms` in order of first appearance.
+    Returns (segment, doc lengths); np.diff(indptr) is the document
+    frequency of each of the segment's terms.
+    """
+    term_ids: List[int] = []
+    doc_ids: List[int] = []
+    tfs: List[int] = []
+    doc_len = np.zeros(len(corpus_tokens), dtype=np.int64)
+    for offset, tokens in enumerate(corpus_tokens):
+        doc_len[offset] = len(tokens)
+        freqs: Dict[str, int] = {}
+        for tok in tokens:
+            freqs[tok] = freqs.get(tok, 0) + 1
+        for tok, tf in freqs.items():
+            t = vocab.get(tok)
+            if t is None:
+                t = vocab[tok] = len(terms)
+                terms.append(tok)
+            term_ids.append(t)
+            doc_ids.append(first_doc + offset)
+            tfs.append(tf)
+    segment = _csr(
+        np.asarray(term_ids, dtype=np.int64),
+        np.asarray(doc_ids, dtype=np.int32),
+        np.asarray(tfs, dtype=np.int32),
+    )
+    return segment, doc_len
+
+
+def _grow(buf: np.ndarray, n: int) -> np.ndarray:
+    """
+    buf with room for at least n entries (capacity doubles, new entries 0).
+    """
+    if n <= len(buf):
+        return buf
+    out = np.zeros(max(n, 2 * len(buf)), dtype=buf.dtype)
+    out[:len(buf)] = buf
+    return out
+
+
+# Per-thread top_k score accumulator and "seen" flags, kept at zero / False
+# between queries so a query only resets the entries it touched.
+_scratch = threading.local()
+
+
+def _scratch_buffers(n: int) -> Tuple[np.ndarray, np.ndarray]:
+    acc = getattr(_scratch, "acc", None)
+    if acc is None or len(acc) < n:
+        size = max(n, 2 * len(acc)) if acc is not None else n
+        _scratch.acc = np.zeros(size)
+        _scratch.seen = np.zeros(size, dtype=bool)
+    return _scratch.acc, _scratch.seen
+
+
+def _average_idf(df: np.ndarray, corpus_size: int) -> float:
+    """
+    Mean raw idf over terms with df > 0, bit-identical to the average of
+    BM25Okapi._calc_idf: math.log per distinct df value, summed in term
+    order. Terms whose documents were all removed no longer count.
+    """
+    df = df[df > 0]
+    if not len(df):
+        return 0.0
+    values, inverse = np.unique(df, return_inverse=True)
+    raw = np.array([math.log(corpus_size - f + 0.5) - math.log(f + 0.5) for f in values.tolist()])
+    return float(np.cumsum(raw[inverse])[-1] / len(df))
+
+
+@dataclass
+class CollectionStats:
+    """
+    BM25 statistics of several indexes' live documents taken together,
+    kept current by the indexes scoring with it (see
+    BM25Index.set_collection_stats).
+    """
+    epsilon: float = 0.25
+    df: Dict[str, int] = field(default_factory=dict)
+    corpus_size: int = 0
+    total_len: int = 0
+
+    def __post_init__(self):
+        self._average_idf: Optional[float] = None
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / self.corpus_size if self.corpus_size else 0.0
+
+    @property
+    def average_idf(self) -> float:
+        if self._average_idf is None:
+            df = np.fromiter(self.df.values(), dtype=np.int64, count=len(self.df))
+            self._average_idf = _average_idf(df, self.corpus_size)
+        return self._average_idf
+
+    def idf(self, term: str) -> float:
+        df = self.df.get(term, 0)
+        if df == 0:
+            return 0.0
+        value = math.log(self.corpus_size - df + 0.5) - math.log(df + 0.5)
+        return value if value >= 0 else self.epsilon * self.average_idf
+
+    def update(self, terms: Iterable[str], df: Iterable[int], docs: int, length: int) -> None:
+        """
+        Add (or, with negative counts, remove) documents: `docs` documents
+        of `length` tokens in total, with document frequency df[i] of terms[i].
+        """
+        for term, n in zip(terms, df):
+            self.df[term] = self.df.get(term, 0) + int(n)
+        self.corpus_size += docs
+        self.total_len += length
+        self._average_idf = None
+
+    def add_index(self, index: "BM25Index", sign: int = 1) -> None:
+        """
+        Add an index's live documents (sign=-1 removes them again).
+        """
+        df = index.df
+        present = np.flatnonzero(df).tolist()
+        terms = [index._terms[t] for t in present]
+        self.update(terms, (sign * df[present]).tolist(), sign * index.corpus_size, sign * index._total_len)
+        if sign < 0:
+            for term in terms:
+                if self.df[term] == 0:
+                    del self.df[term]
+
+
+def collection_stats(indexes: Sequence["BM25Index"]) -> CollectionStats:
+    """
+    Statistics the indexes would have as one index over the concatenation
+    of their documents (in the given order).
+    """
+    stats = CollectionStats(indexes[0].epsilon if indexes else 0.25)
+    for index in indexes:
+        stats.add_index(index)
+    return stats
+
+
+class BM25Index:
+    """
+    Inverted-index BM25 (Okapi variant, same formula and idf floor as
+    rank_bm25.BM25Okapi).
+
+    Postings are stored CSR-style in segments, each over its own terms:
+    - terms: sorted term ids present in the segment
+    - indptr[i]:indptr[i+1] is the slice of terms[i] in post_docs / post_tfs
+    - post_docs: doc indices (ascending within each term)
+    - post_tfs: term frequencies
+    Document frequencies, live document count and total length are kept
+    current; idf and length norms are derived for the query's own terms
+    and postings, so a query only touches the postings of its terms.
+    Per-term score upper bounds are kept for a reference avgdl and scaled
+    to the current one (see _merge_bounds).
+
+    Documents added later go into new segments, merged log-structured
+    (MERGE_RATIO); removed documents are masked out until their segment
+    is merged. Document indices are never reused.
+    """
+
+    def __init__(
+        self,
+        corpus_tokens: List[List[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocab: Dict[str, int] = {}
+        self._terms: List[str] = []
+        self.collection: Optional[CollectionStats] = None
+        self.segments: List[Segment] = []
+        self._n_rows = 0
+        self._doc_len = np.zeros(0, dtype=np.int64)
+        self._live = np.zeros(0, dtype=bool)
+        self._df = np.zeros(0, dtype=np.int64)
+        self.corpus_size = 0
+        self._total_len = 0
+        self._average_idf: Optional[float] = None
+        self._tf_bound = np.zeros(0, dtype=np.float64)
+        self._bound_avgdl = 0.0
+        self.add_documents(corpus_tokens)
+
+    @property
+    def num_rows(self) -> int:
+        """Number of document slots, including removed ones."""
+        return self._n_rows
+
+    @property
+    def doc_len(self) -> np.ndarray:
+        return self._doc_len[:self._n_rows]
+
+    @property
+    def live(self) -> np.ndarray:
+        return self._live[:self._n_rows]
+
+    @property
+    def df(self) -> np.ndarray:
+        return self._df[:len(self._terms)]
+
+    @property
+    def _has_removed(self) -> bool:
+        return self.corpus_size < self._n_rows
+
+    @property
+    def avgdl(self) -> float:
+        if self.collection is not None:
+            # Statistics of the whole multi-index collection, so scores are
+            # comparable with (and equal to) one index over all documents.
+            return self.collection.avgdl
+        return self._total_len / self.corpus_size if self.corpus_size else 0.0
+
+    @property
+    def average_idf(self) -> float:
+        """
+        Mean raw idf, the floor for negative idf values. Computed over the
+        vocabulary on first use after the documents change.
+        """
+        if self.collection is not None:
+            return self.collection.average_idf
+        if self._average_idf is None:
+            self._average_idf = _average_idf(self.df, self.corpus_size)
+        return self._average_idf
+
+    def _idf(self, t: int) -> float:
+        if self.collection is not None:
+            return self.collection.idf(self._terms[t])
+        df = int(self._df[t])
+        if df == 0:
+            return 0.0
+        value = math.log(self.corpus_size - df + 0.5) - math.log(df + 0.5)
+        return value if value >= 0 else self.epsilon * self.average_idf
+
+    def _norm(self, docs: np.ndarray, avgdl: Optional[float] = None) -> np.ndarray:
+        avgdl = self.avgdl if avgdl is None else avgdl
+        if avgdl == 0:
+            return np.zeros(len(docs))  # empty collection
+        return self.k1 * (1 - self.b + self.b * self._doc_len[docs] / avgdl)
+
+    def set_collection_stats(self, stats: Optional[CollectionStats]) -> None:
+        """
+        Score with statistics shared across several indexes (see
+        collection_stats), or with this index's own again if stats is None.
+        The index's own documents must already be counted in `stats`; later
+        additions and removals update it.
+        """
+        self.collection = stats
+
+    # ----- score bounds -----
+
+    def _merge_bounds(self, segment: Segment) -> None:
+        """
+        Raise the per-term bounds of tf * (k1 + 1) / (tf + norm) to cover a
+        segment's postings. Bounds hold for the reference avgdl A0 and
+        scale to any avgdl A by max(1, A / A0), because every term of the
+        denominator shrinks at most by A0 / A. Removed documents keep their
+        (stale, still valid) bounds. A0 = 0 means norm 0: the bound k1 + 1,
+        valid for every avgdl.
+        """
+        self._tf_bound = _grow(self._tf_bound, len(self._terms))
+        seg_terms, indptr, post_docs, post_tfs = segment
+        if not len(post_docs):
+            return
+        avgdl = self.avgdl
+        if self._bound_avgdl == 0:
+            self._bound_avgdl = avgdl
+        contrib = post_tfs * (self.k1 + 1) / (post_tfs + self._norm(post_docs, avgdl))
+        seg_max = np.maximum.reduceat(contrib, indptr[:-1])
+        if avgdl > 0:
+            seg_max *= max(1.0, self._bound_avgdl / avgdl)
+        self._tf_bound[seg_terms] = np.maximum(self._tf_bound[seg_terms], seg_max)
+
+    def _term_bound(self, t: int) -> float:
+        """
+        Upper bound of one occurrence's contribution of term t.
+        """
+        scale = max(1.0, self.avgdl / self._bound_avgdl) if self._bound_avgdl > 0 else 1.0
+        return self._idf(t) * self._tf_bound[t] * scale
+
+    # ----- incremental updates -----
+
+    def add_documents(self, corpus_tokens: List[List[str]]) -> np.ndarray:
+        """
+        Index new documents as a new segment; returns their row indices.
+        Cost is proportional to the new postings: statistics change only
+        for the new documents' terms, and segment merges cost amortised
+        O(log n) per posting.
+        """
+        first = self._n_rows
+        segment, doc_len = _build_segment(corpus_tokens, self.vocab, self._terms, first)
+        n = first + len(doc_len)
+        self._doc_len = _grow(self._doc_len, n)
+        self._doc_len[first:n] = doc_len
+        self._live = _grow(self._live, n)
+        self._live[first:n] = True
+        self._n_rows = n
+        seg_df = np.diff(segment[1])
+        self._df = _grow(self._df, len(self._terms))
+        self._df[segment[0]] += seg_df
+        self.corpus_size += len(doc_len)
+        self._total_len += int(doc_len.sum())
+        self._average_idf = None
+        if self.collection is not None:
+            self.collection.update(
+                [self._terms[t] for t in segment[0].tolist()], seg_df.tolist(), len(doc_len), int(doc_len.sum())
+            )
+        self._merge_bounds(segment)
+        self.segments.append(segment)
+        while len(self.segments) > 1 and (
+            len(self.segments[-1][2]) >= MERGE_RATIO * len(self.segments[-2][2])
+        ):
+            self.segments[-2:] = [self._merge(self.segments[-2:])]
+        return np.arange(first, n)
+
+    def remove_documents(self, rows: List[int], corpus_tokens: List[List[str]]) -> None:
+        """
+        Mark rows as removed. `corpus_tokens` are the tokens of those rows,
+        used to update document frequencies without scanning the postings.
+        """
+        removed: Dict[str, int] = {}
+        n_docs = 0
+        length = 0
+        for row, tokens in zip(rows, corpus_tokens):
+            if not self._live[row]:
+                continue
+            self._live[row] = False
+            n_docs += 1
+            length += int(self._doc_len[row])
+            for tok in set(tokens):
+                self._df[self.vocab[tok]] -= 1
+                removed[tok] = removed.get(tok, 0) - 1
+        self.corpus_size -= n_docs
+        self._total_len -= length
+        self._average_idf = None
+        if self.collection is not None:
+            self.collection.update(removed, removed.values(), -n_docs, -length)
+
+    def _merge(self, segments: List[Segment]) -> Segment:
+        """
+        One segment with the postings of consecutive segments, without
+        those of removed documents.
+        """
+        terms = np.concatenate([np.repeat(seg[0], np.diff(seg[1])) for seg in segments])
+        docs = np.concatenate([seg[2] for seg in segments])
+        tfs = np.concatenate([seg[3] for seg in segments])
+        keep = self._live[docs]
+        return _csr(terms[keep], docs[keep], tfs[keep])
+
+    def compact(self) -> None:
+        """
+        Merge all segments into one, drop postings of removed documents and
+        recompute the score bounds for the current avgdl.
+        """
+        self.segments = [self._merge(self.segments)]
+        self._tf_bound = np.zeros(len(self._terms), dtype=np.float64)
+        self._bound_avgdl = 0.0
+        self._merge_bounds(self.segments[0])
+
+    # ----- scoring -----
+
+    def _postings(self, t: int) -> Tuple[np.ndarray, np.ndarray]:
+        parts = []
+        for seg_terms, indptr, post_docs, post_tfs in self.segments:
+            i = np.searchsorted(seg_terms, t)
+            if i < len(seg_terms) and seg_terms[i] == t:
+                lo, hi = indptr[i], indptr[i + 1]
+                parts.append((post_docs[lo:hi], post_tfs[lo:hi]))
+        if len(parts) == 1:
+            docs, tfs = parts[0]
+        elif parts:
+            docs = np.concatenate([p[0] for p in parts])
+            tfs = np.concatenate([p[1] for p in parts])
+        else:
+            docs, tfs = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        if self._has_removed:
+            keep = self._live[docs]
+            docs, tfs = docs[keep], tfs[keep]
+        return docs, tfs
+
+    def _term_scores(self, t: int) -> Tuple[np.ndarray, np.ndarray]:
+        docs, tfs = self._postings(t)
+        return docs, self._idf(t) * (tfs * (self.k1 + 1) / (tfs + self._norm(docs)))
+
+    def _term_ids(self, tokens: List[str]) -> List[int]:
+        return [self.vocab[tok] for tok in tokens if tok in self.vocab]
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        """
+        Scores for every document row (removed rows score 0);
+        identical to BM25Okapi.get_scores over the live documents.
+        """
+        scores = np.zeros(self.num_rows)
+        for t in self._term_ids(tokens):
+            docs, contrib = self._term_scores(t)
+            scores[docs] += contrib
+        return scores
+
+    def _exact_scores(self, term_ids: List[int], cand: np.ndarray) -> np.ndarray:
+        """
+        Exact scores for the (sorted) candidate docs, adding term
+        contributions in query order like get_scores does.
+        """
+        scores = np.zeros(len(cand))
+        for t in term_ids:
+            docs, tfs = self._postings(t)
+            if not len(docs):
+                continue
+            pos = np.searchsorted(docs, cand)
+            pos_clipped = np.minimum(pos, len(docs) - 1)
+            hit = docs[pos_clipped] == cand
+            tf = np.where(hit, tfs[pos_clipped], 0)
+            scores += self._idf(t) * (tf * (self.k1 + 1) / (tf + self._norm(cand)))
+        return scores
+
+    @staticmethod
+    def _select_top_k(doc_idx: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k by score (ties broken by higher doc index) using argpartition
+        instead of a full sort.
+        """
+        if len(scores) > k:
+            kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+            above = np.flatnonzero(scores > kth)
+            tie = np.flatnonzero(scores == kth)
+            tie = tie[np.argsort(doc_idx[tie])[::-1][:k - len(above)]]
+            sel = np.concatenate([above, tie])
+            doc_idx, scores = doc_idx[sel], scores[sel]
+        order = np.lexsort((-doc_idx, -scores))
+        return doc_idx[order], scores[order]
+
+    def top_k(
+        self, tokens: List[str], k: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k (doc indices, scores) with MaxScore dynamic pruning.
+
+        Query terms are processed in decreasing order of their score upper
+        bound. Once the bounds of the remaining terms cannot lift an unseen
+        document above the current k-th best partial score, no new
+        candidates are admitted; survivors are then scored exactly. Partial
+        scores go to a reused per-thread buffer of which only the read
+        postings' entries are reset, so a query costs O(postings read).
+        Documents that match no query term score 0 and fill the tail (highest
+        doc index first) when fewer than k documents match.
+
+        mask (bool per row) restricts the search to a partition: postings
+        outside it are dropped as they are read, so k hits come from the
+        partition whenever it has k live documents.
+        """
+        k = min(k, self.corpus_size)
+        term_ids = self._term_ids(tokens)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        weights: Dict[int, int] = {}
+        for t in term_ids:
+            weights[t] = weights.get(t, 0) + 1
+        uniq = list(weights)
+        if any(self._idf(t) < 0 for t in uniq):
+            # Negative contributions break the pruning bounds.
+            scores = self.get_scores(tokens)
+            allowed = self.live if mask is None else self.live & mask
+            rows = np.flatnonzero(allowed)
+            return self._select_top_k(rows, scores[rows], min(k, len(rows)))
+
+        bounds = np.array([weights[t] * self._term_bound(t) for t in uniq])
+        order = np.argsort(-bounds, kind="stable")
+        # remaining[i] = sum of bounds of the terms not yet processed after step i
+        remaining = np.concatenate([np.cumsum(bounds[order][::-1])[::-1], [0.0]])[1:]
+
+        acc, seen = _scratch_buffers(self.num_rows)
+        matched = np.zeros(0, dtype=np.int64)
+        try:
+            threshold = -np.inf
+            rest = 0.0
+            for step, pos in enumerate(order):
+                t = uniq[pos]
+                docs, contrib = self._term_scores(t)
+                if mask is not None:
+                    keep = mask[docs]
+                    docs, contrib = docs[keep], contrib[keep]
+                new = docs[~seen[docs]]
+                seen[new] = True
+                matched = np.concatenate([matched, new])
+                acc[docs] += weights[t] * contrib
+                if len(matched) >= k:
+                    threshold = np.partition(acc[matched], len(matched) - k)[len(matched) - k]
+                rest = remaining[step]
+                if rest < threshold * (1 - 1e-9):
+                    # Remaining terms cannot admit new documents.
+                    break
+            cand = matched
+            if np.isfinite(threshold):
+                # Partial score plus every unprocessed bound is an upper bound.
+                cand = cand[acc[cand] + rest >= threshold * (1 - 1e-9)]
+        finally:
+            acc[matched] = 0.0
+            seen[matched] = False
+        cand = np.sort(cand)
+        cand_scores = self._exact_scores(term_ids, cand)
+
+        if len(cand) < k:
+            # Fewer than k matches: pad with zero-score docs. Only possible
+            # when nothing was pruned, so cand holds every matching doc.
+            unmatched = self.live.copy() if mask is None else self.live & mask
+            unmatched[cand] = False
+            pad = np.flatnonzero(unmatched)[::-1][:k - len(cand)]
+            cand = np.concatenate([cand, pad])
+            cand_scores = np.concatenate([cand_scores, np.zeros(len(pad))])
+            k = len(cand)
+        return self._select_top_k(cand, cand_scores, k)
+
+    # ----- persistence -----
+
+    def save(self, path: str) -> None:
+        if len(self.segments) > 1:
+            self.compact()
+        seg_terms, indptr, post_docs, post_tfs = self.segments[0]
+        # On disk, indptr spans the whole vocabulary.
+        counts = np.zeros(len(self._terms), dtype=np.int64)
+        counts[seg_terms] = np.diff(indptr)
+        np.savez(
+            path,
+            terms=np.array(self._terms, dtype=str),
+            indptr=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            post_docs=post_docs,
+            post_tfs=post_tfs,
+            doc_len=self.doc_len,
+            live=self.live,
+            df=self.df,
+            params=np.array([self.k1, self.b, self.epsilon]),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        data = np.load(path)
+        index = cls.__new__(cls)
+        index.k1, index.b, index.epsilon = data["params"].tolist()
+        index._terms = data["terms"].tolist()
+        index.vocab = {term: i for i, term in enumerate(index._terms)}
+        counts = np.diff(data["indptr"])
+        seg_terms = np.flatnonzero(counts)
+        indptr = np.concatenate([[0], np.cumsum(counts[seg_terms])]).astype(np.int64)
+        index.segments = [(seg_terms, indptr, data["post_docs"], data["post_tfs"])]
+        index._doc_len = data["doc_len"].astype(np.int64)
+        index._live = data["live"].astype(bool)
+        index._n_rows = len(index._doc_len)
+        index._df = data["df"].astype(np.int64)
+        index.corpus_size = int(index._live.sum())
+        index._total_len = int(index._doc_len[index._live].sum())
+        index._average_idf = None
+        index.collection = None
+        index._tf_bound = np.zeros(len(index._terms), dtype=np.float64)
+        index._bound_avgdl = 0.0
+        index._merge_bounds(index.segments[0])
+        return index
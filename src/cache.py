@@ -0,0 +1,219 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU with optional TTL and hit/miss counters.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl_seconds is not None:
+                if time.time() - item[0] > self.ttl_seconds:
+                    del self._data[key]
+                    item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, (_, value) in self._data.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class DiskCache:
+    """
+    Persistent string -> JSON value store in a single SQLite file,
+    with TTL and a maximum entry count (least recently used rows are
+    evicted first).
+
+    Reads do not write: access times of hits are buffered and written in
+    one transaction before the next eviction, or every `access_batch`
+    hits. Expired rows are skipped on read and deleted on eviction.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_entries: int = 100_000,
+        ttl_seconds: Optional[float] = None,
+        access_batch: int = 256,
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.access_batch = access_batch
+        self._accessed: Dict[str, float] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                return None
+            self._accessed[key] = now
+            if len(self._accessed) >= self.access_batch:
+                self._flush_accessed()
+                self._conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._accessed.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def flush(self) -> None:
+        """
+        Write buffered access times.
+        """
+        with self._lock:
+            self._flush_accessed()
+            self._conn.commit()
+
+    def _flush_accessed(self) -> None:
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE cache SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def _evict(self) -> None:
+        # LRU order needs the buffered access times.
+        self._flush_accessed()
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM cache WHERE created < ?", (time.time() - self.ttl_seconds,)
+            )
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._accessed.clear()
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+
+class TieredCache:
+    """
+    In-memory LRU in front of an optional DiskCache.
+    Disk hits are promoted into memory.
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_hits": self.hits - self.disk_hits,
+            "disk_hits": self.disk_hits,
+            "memory_size": len(self.memory),
+            "disk_size": len(self.disk) if self.disk is not None else 0,
+        }
@@ -0,0 +1,118 @@
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+def checkpoint_key(system: str, case_id: str, stage: str) -> str:
+    return f"{system}/{case_id}/{stage}"
+
+
+def to_jsonable(value: Any) -> Any:
+    """
+    JSON-compatible form of a task result: DataFrames (e.g. evidence with
+    doc ids and scores) are stored column-wise, containers recursively.
+    """
+    if isinstance(value, pd.DataFrame):
+        return {"__frame__": value.to_dict(orient="split")}
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def from_jsonable(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "__frame__" in value:
+            frame = value["__frame__"]
+            return pd.DataFrame(frame["data"], index=frame["index"], columns=frame["columns"])
+        return {k: from_jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [from_jsonable(v) for v in value]
+    return value
+
+
+class CheckpointLog:
+    """
+    Append-only JSONL log of finished work: one {"key", "value"} record per
+    line, flushed as soon as it is written, so a crash loses at most the
+    calls in flight. Keys name one stage of one case, e.g.
+    "improved/cat_uri/generate"; the last record for a key wins.
+
+    resume=True loads the existing log so completed work can be skipped;
+    otherwise an existing log is moved aside to <name>.prev.jsonl.
+
+    `fingerprint` (JSON-compatible settings the results depend on) is
+    written as the log's first line. A log written with another
+    fingerprint, or without one, is not resumed: it is moved aside too.
+    """
+
+    def __init__(self, path: str, resume: bool = False, fingerprint: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.records: Dict[str, Any] = {}
+        self.fingerprint = None if fingerprint is None else json.loads(json.dumps(fingerprint))
+        self.stale = False  # resume was refused on a fingerprint mismatch
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            if resume:
+                self._load()
+            if not resume or self.stale:
+                self.records = {}
+                self.path.replace(self.path.with_name(self.path.stem + ".prev.jsonl"))
+        self.resumed = len(self.records)
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() and not self._ends_with_newline():
+            self._file.write("\n")  # don't append to a torn line
+        if not self._file.tell() and self.fingerprint is not None:
+            self._file.write(json.dumps({"fingerprint": self.fingerprint}, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, 2)
+            return f.read(1) == b"\n"
+
+    def _load(self) -> None:
+        logged = None
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line from an interrupted run
+                if "fingerprint" in record:
+                    logged = record["fingerprint"]
+                    continue
+                self.records[record["key"]] = record["value"]
+        self.stale = self.fingerprint is not None and logged != self.fingerprint
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self.records:
+            return default
+        return from_jsonable(self.records[key])
+
+    def put(self, key: str, value: Any) -> None:
+        payload = to_jsonable(value)
+        line = json.dumps({"key": key, "value": payload}, ensure_ascii=False)
+        with self._lock:
+            self.records[key] = payload
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
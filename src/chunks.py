@@ -1,5 +1,18 @@
-from typing import List, Dict, Any
-from .config import TA_MODE, TA_MAX_PAGES, TA_MAX_CHUNKS
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+import os
+import re
+
+from .config import (
+    TA_MODE,
+    TA_MAX_PAGES,
+    TA_MAX_CHUNKS,
+    INGEST_WORKERS,
+    INGEST_PAGES_PER_TASK,
+    TAG_BATCH_SIZE,
+)
+from .tagger import get_tagger, tag_chunks
 from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
@@ -7,43 +20,96 @@ CHUNK_SIZE = 800
 CHUNK_OVERLAP = 150
 
 
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """
+    Worker task: extract text for pages [start, stop).
+    Each worker opens its own reader; PdfReader objects are not picklable.
+    """
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_pdf_pages(
+    pdf_path: str,
+    workers: Optional[int] = INGEST_WORKERS,
+    pages_per_task: int = INGEST_PAGES_PER_TASK,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield {"page", "text"} dicts in page order.
+    Page ranges are extracted across a process pool; at most 2 * workers
+    ranges are in flight, so memory does not grow with the book size.
+    """
+    num_pages = len(PdfReader(pdf_path).pages)
+    if TA_MODE:
+        num_pages = min(num_pages, TA_MAX_PAGES)
+    ranges = [
+        (start, min(start + pages_per_task, num_pages))
+        for start in range(0, num_pages, pages_per_task)
+    ]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(ranges) <= 1:
+        for start, stop in ranges:
+            for offset, text in enumerate(_extract_page_range(pdf_path, start, stop)):
+                yield {"page": start + offset + 1, "text": text}
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        max_in_flight = 2 * workers
+        pending = deque()
+        next_range = 0
+        while pending or next_range < len(ranges):
+            while next_range < len(ranges) and len(pending) < max_in_flight:
+                start, stop = ranges[next_range]
+                pending.append((start, pool.submit(_extract_page_range, pdf_path, start, stop)))
+                next_range += 1
+            start, fut = pending.popleft()
+            for offset, text in enumerate(fut.result()):
+                yield {"page": start + offset + 1, "text": text}
+
+
 def load_pdf_text(pdf_path: str) -> List[Dict[str, Any]]:
     """
     Read PDF and return a list of dicts:
     - page: 1-based page number
     - text: raw page text
     """
-    reader = PdfReader(pdf_path)
-    pages = []
-    for i, page in enumerate(reader.pages):
-        if TA_MODE and i >= TA_MAX_PAGES:
-            break
-        pages.append({
-            "page": i + 1,
-            "text": page.extract_text() or ""
-        })
-    return pages
+    return list(iter_pdf_pages(pdf_path))
 
 
 def simple_tag_from_text(text: str) -> str:
     """
-    Very simple rule-based tagging.
+    Single coarse tag of one text (respiratory / gastrointestinal / general
+    with the default vocabulary). Ingestion tags whole batches with
+    tagger.tag_chunks instead, which also sets the multi-label "tags".
+    """
+    tagger = get_tagger()
+    return tagger.primary_tag(tagger.tag_text(text))
+
+
+SPECIES_TERMS = {
+    "cat": {"cat", "cats", "feline", "felines", "kitten", "kittens"},
+    "dog": {"dog", "dogs", "canine", "canines", "puppy", "puppies"},
+}
+
+
+def simple_species_from_text(text: str) -> List[str]:
+    """
+    Species a chunk mentions by name (empty list: none in particular).
     """
-    t = text.lower()
-    if "respiratory" in t or "nasal" in t:
-        return "respiratory"
-    if "gastro" in t or "vomit" in t or "diarrhea" in t:
-        return "gastrointestinal"
-    return "general"
+    words = set(re.findall(r"[a-z]+", text.lower()))
+    return [species for species, terms in SPECIES_TERMS.items() if words & terms]
 
 
-def build_chunks(pages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def iter_chunks(pages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
     """
-    Split PDF pages into overlapping chunks with metadata:
+    Split PDF pages into overlapping chunks with metadata, lazily:
     - doc_id (int)
     - page (int)
     - text (str)
     - tag (str)
+    - tags (List[str])
+    Chunks are tagged TAG_BATCH_SIZE at a time (see tagger.tag_chunks).
     """
     splitter = RecursiveCharacterTextSplitter(
         separators=["\n\n", "\n", ".", " "],
@@ -51,21 +117,36 @@ def build_chunks(pages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         chunk_overlap=CHUNK_OVERLAP,
     )
 
-    docs: List[Dict[str, Any]] = []
-    doc_id = 0
-    for page_info in pages:
-        page_num = page_info["page"]
-        page_text = page_info["text"]
-        if not page_text.strip():
-            continue
-        for chunk in splitter.split_text(page_text):
-            docs.append({
-                "doc_id": doc_id,
-                "page": page_num,
-                "text": chunk,
-                "tag": simple_tag_from_text(chunk),
-            })
-            doc_id += 1
-            if TA_MODE and len(docs) >= TA_MAX_CHUNKS:
-                return docs
-    return docs
+    def untagged() -> Iterator[Dict[str, Any]]:
+        doc_id = 0
+        for page_info in pages:
+            page_num = page_info["page"]
+            page_text = page_info["text"]
+            if not page_text.strip():
+                continue
+            for chunk in splitter.split_text(page_text):
+                yield {"doc_id": doc_id, "page": page_num, "text": chunk}
+                doc_id += 1
+                if TA_MODE and doc_id >= TA_MAX_CHUNKS:
+                    return
+
+    batch: List[Dict[str, Any]] = []
+    for chunk in untagged():
+        batch.append(chunk)
+        if len(batch) == TAG_BATCH_SIZE:
+            yield from tag_chunks(batch)
+            batch = []
+    if batch:
+        yield from tag_chunks(batch)
+
+
+def build_chunks(pages: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Split PDF pages into overlapping chunks with metadata:
+    - doc_id (int)
+    - page (int)
+    - text (str)
+    - tag (str)
+    - tags (List[str])
+    """
+    return list(iter_chunks(pages))
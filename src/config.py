@@ -9,3 +9,226 @@ TA_MODE = True   #Default True for grading
 TA_MAX_PAGES = 10
 TA_MAX_CHUNKS = 50
 TA_MAX_EMBED = 50
+
+# ===============================
+# Index cache
+# ===============================
+
+# Reuse chunks / embeddings / FAISS / BM25 built by a previous run.
+# The cache is keyed by the PDF content and chunking/model parameters,
+# so it is rebuilt automatically when any of them change.
+USE_INDEX_CACHE = True
+INDEX_CACHE_DIR = "data/index_cache"
+
+# ===============================
+# Groq API budget
+# ===============================
+
+# Shared by every Groq call (one API key). Defaults follow the free tier;
+# raise them on a paid plan.
+GROQ_REQUESTS_PER_MINUTE = 30
+GROQ_TOKENS_PER_MINUTE = 20000
+LLM_MAX_RETRIES = 5
+LLM_BACKOFF_SECONDS = 1.0
+
+# Concurrent judge calls in evaluation.evaluate_system
+EVAL_MAX_WORKERS = 8
+
+# ===============================
+# LLM response cache
+# ===============================
+
+# Re-running the experiment reuses cached Groq responses instead of
+# paying for every round trip again. Delete the file to start fresh.
+LLM_CACHE_ENABLED = True
+# Also cache temperature > 0 calls (answer generation, decomposition).
+# Off by default: cached samples would repeat identically across runs.
+LLM_CACHE_SAMPLING_CALLS = False
+LLM_CACHE_PATH = "data/llm_cache.sqlite"
+LLM_CACHE_MAX_MEMORY = 4096
+LLM_CACHE_MAX_DISK = 200_000
+LLM_CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+# ===============================
+# Dense index (FAISS)
+# ===============================
+
+# "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw".
+# Approximate indexes only pay off for very large corpora.
+FAISS_INDEX_TYPE = "flat"
+FAISS_NLIST = 1024          # IVF lists (clamped for small corpora)
+FAISS_PQ_M = 48             # PQ sub-quantizers (must divide the embedding dim)
+FAISS_PQ_NBITS = 8
+FAISS_HNSW_M = 32           # HNSW graph degree
+# Vector codes inside flat / IVF-Flat / HNSW indexes: "float32" (exact),
+# "float16" (2x smaller) or "int8" (scalar-quantized, 4x smaller).
+# Compressed indexes over-fetch DENSE_RESCORE_FACTOR x k hits and rescore
+# them exactly against the memory-mapped float32 embeddings.
+EMBEDDING_STORAGE = "float32"
+DENSE_RESCORE_FACTOR = 4
+# Query-time accuracy/latency knobs
+FAISS_NPROBE = 16
+FAISS_EF_SEARCH = 64
+
+# ===============================
+# Ingestion
+# ===============================
+
+INGEST_WORKERS = None          # PDF extraction processes (None = all CPUs)
+INGEST_PAGES_PER_TASK = 16     # pages per extraction task
+EMBED_BATCH_SIZE = 256         # chunks per embedding batch
+
+# ===============================
+# Models
+# ===============================
+
+# Load the embedder and reranker in parallel when the pipeline starts
+# (False = load each one on first use).
+PRELOAD_MODELS = True
+
+# CPU inference backend for both models: "fp32" or "int8"
+# (dynamic int8 quantization of the Linear layers; faster on CPU,
+# slightly different scores - compare with `python -m src.benchmark inference`).
+INFERENCE_BACKEND = "fp32"
+INFERENCE_THREADS = None       # torch intra-op threads (None = torch default)
+
+# ===============================
+# Retriever caches
+# ===============================
+
+# LRU caches inside VetRetriever (0 disables):
+# query string -> embedding, and (query, doc_id) -> cross-encoder score.
+QUERY_EMBED_CACHE_SIZE = 4096
+RERANK_CACHE_SIZE = 100_000
+# Save both caches next to the index cache at the end of a run
+# and load them on the next start.
+PERSIST_RETRIEVER_CACHES = True
+
+# ===============================
+# Adaptive reranking
+# ===============================
+
+# Cascade: rerank hybrid candidates ADAPTIVE_RERANK_STAGE at a time (best
+# hybrid score first) and stop once no remaining candidate can reach the
+# current top results, assuming its rerank score is at most the best seen
+# so far + ADAPTIVE_RERANK_MARGIN (cross-encoder logit units).
+ADAPTIVE_RERANK = False
+ADAPTIVE_RERANK_STAGE = 10
+ADAPTIVE_RERANK_MARGIN = 1.0
+
+# ===============================
+# HTTP server (python -m src.server)
+# ===============================
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+# Concurrent queries are coalesced into one retrieval batch of at most
+# SERVER_MAX_BATCH_SIZE, waiting at most SERVER_MAX_WAIT_MS for stragglers.
+SERVER_MAX_BATCH_SIZE = 16
+SERVER_MAX_WAIT_MS = 5.0
+SERVER_IO_WORKERS = 16         # threads for concurrent Groq calls
+SERVER_MAX_BODY_BYTES = 1 << 20  # larger request bodies get 413
+
+# ===============================
+# Improved pipeline
+# ===============================
+
+# Retrieve the main case query while the decomposition LLM call is in
+# flight, then the new sub-queries in one batch. The evidence is the same
+# as without it; the early result is only used when the decomposition
+# falls back to (or repeats) the main query.
+SPECULATIVE_RETRIEVAL = False
+
+# ===============================
+# Pipelined experiment
+# ===============================
+
+# Run run_full_experiment as one task graph: every case's retrieval,
+# generation and judging of all three systems, as soon as its inputs exist.
+PIPELINED_EXPERIMENT = True
+# Retrieval / reranking tasks (torch already uses several threads per call)
+PIPELINE_CPU_WORKERS = 1
+# Concurrent Groq calls (decomposition, generation, judging)
+PIPELINE_IO_WORKERS = 16
+
+# ===============================
+# Experiment checkpoints
+# ===============================
+
+# Append every finished retrieval, answer and judge call of
+# run_full_experiment to EXPERIMENT_CHECKPOINT_PATH (relative to the
+# project root).
+EXPERIMENT_CHECKPOINT = False
+EXPERIMENT_CHECKPOINT_PATH = "data/checkpoints/experiment.jsonl"
+# Resume from the checkpoint of an interrupted run, skipping completed work.
+# Otherwise a new run moves the old file aside to <name>.prev.jsonl. A log
+# written with other models, judge, packing or eval cases is not resumed.
+RESUME_EXPERIMENT = False
+
+# ===============================
+# Evidence packing
+# ===============================
+
+# Merge overlapping / adjacent chunks of the same page and drop repeated
+# text before evidence goes into a generation prompt, then fill at most
+# EVIDENCE_TOKEN_BUDGET tokens in score order. False: every row, as is.
+PACK_EVIDENCE = True
+EVIDENCE_TOKEN_BUDGET = 2000
+
+# ===============================
+# Corpus
+# ===============================
+
+# PDFs to serve as one corpus, one shard (FAISS + BM25 index) per file,
+# paths relative to the project root. None: data/databook.pdf only.
+CORPUS_PDFS = None
+# Threads searching the shards of a query batch in parallel
+CORPUS_SEARCH_WORKERS = 4
+# Query embedding / rerank caches of a multi-PDF corpus (see
+# PERSIST_RETRIEVER_CACHES); each shard keeps its index in INDEX_CACHE_DIR.
+CORPUS_CACHE_DIR = "data/index_cache/corpus"
+
+# ===============================
+# Filtered search
+# ===============================
+
+# A filtered dense search scans partitions of at most this many chunks
+# exactly (reading only their embeddings); larger ones go through FAISS
+# with an ID selector.
+FILTER_EXACT_MAX_ROWS = 4096
+
+# ===============================
+# Tagging
+# ===============================
+
+# JSON file {label: [terms, ...]} for the chunk tagger (tagger.py); terms
+# match as case-insensitive substrings. None: the built-in vocabulary.
+TAG_VOCABULARY_PATH = None
+# Chunks tagged together in one vectorised pass
+TAG_BATCH_SIZE = 1024
+
+# ===============================
+# Judging
+# ===============================
+
+# "full": median of three correctness grades, one relevance call per
+# evidence passage. "efficient": a third correctness grade only when the
+# first two disagree, and all passages of an answer scored in one call.
+JUDGE_MODE = "full"
+
+# ===============================
+# Relevance proxy
+# ===============================
+
+# Grade evidence relevance with the reranker's cross-encoder instead of one
+# LLM call per passage. The cross-encoder is calibrated against the LLM's
+# 0–5 rubric on a sample spread over its score range:
+# RELEVANCE_PROXY_SAMPLE_FRACTION of the evidence passages, but at least
+# RELEVANCE_PROXY_MIN_SAMPLE. A passage still goes to the LLM if fewer than
+# RELEVANCE_PROXY_MIN_AGREEMENT of the RELEVANCE_PROXY_NEIGHBOURS calibration
+# passages closest in score got the grade the proxy predicts.
+RELEVANCE_PROXY = False
+RELEVANCE_PROXY_SAMPLE_FRACTION = 0.25
+RELEVANCE_PROXY_MIN_SAMPLE = 12
+RELEVANCE_PROXY_NEIGHBOURS = 5
+RELEVANCE_PROXY_MIN_AGREEMENT = 0.8
@@ -0,0 +1,402 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sentence_transformers import SentenceTransformer, CrossEncoder
+
+from .bm25 import CollectionStats
+from .chunks import iter_pdf_pages, iter_chunks
+from .config import (
+    USE_INDEX_CACHE,
+    INDEX_CACHE_DIR,
+    PERSIST_RETRIEVER_CACHES,
+    FAISS_NPROBE,
+    FAISS_EF_SEARCH,
+    QUERY_EMBED_CACHE_SIZE,
+    RERANK_CACHE_SIZE,
+    CORPUS_SEARCH_WORKERS,
+    CORPUS_CACHE_DIR,
+)
+from .embeddings import embed_chunk_stream, build_faiss_index
+from .index_store import (
+    index_params,
+    index_dir_for,
+    load_index,
+    save_index,
+    load_embeddings,
+)
+from .retriever import RetrieverBase, VetRetriever, SearchFilter, Hits, build_bm25
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def load_source_retriever(
+    pdf_path: str,
+    use_index_cache: bool = USE_INDEX_CACHE,
+    writable_index: bool = False,
+    source: Optional[str] = None,
+) -> VetRetriever:
+    """
+    Retriever over one PDF: loaded from the index cache when possible,
+    otherwise built (and cached). With `source`, every chunk is labelled
+    with it.
+    """
+    artifact = None
+    if use_index_cache:
+        params = index_params(pdf_path)
+        index_dir = index_dir_for(params, BASE_DIR / INDEX_CACHE_DIR)
+        artifact = load_index(index_dir, params, writable=writable_index)
+
+    if artifact is not None:
+        print(f"Loaded cached index from {index_dir}")
+        docs, embs, faiss_index, bm25 = (
+            artifact.docs, artifact.embs, artifact.faiss_index, artifact.bm25
+        )
+        print(f"  {len(docs)} chunks, {embs.shape[0]} embeddings.")
+    else:
+        # PDF pages -> chunks -> embedding batches, streamed end to end
+        print(f"Loading {pdf_path}, building chunks and BGE embeddings...")
+        docs, embs = embed_chunk_stream(iter_chunks(iter_pdf_pages(pdf_path)))
+        print(f"  Built {len(docs)} chunks, {embs.shape[0]} embeddings.")
+
+        print("Building FAISS index...")
+        faiss_index = build_faiss_index(embs)
+
+        print("Building BM25 index...")
+        bm25 = build_bm25([d["text"] for d in docs])
+
+        if use_index_cache:
+            print(f"Saving index to {index_dir}")
+            save_index(index_dir, params, docs, embs, faiss_index, bm25)
+            # Serve from the memory-mapped copy instead of the in-RAM matrix.
+            embs = load_embeddings(index_dir)
+
+    if source is not None:
+        for d in docs:
+            d.setdefault("source", source)
+
+    print("Initializing retriever...")
+    retriever = VetRetriever(docs, embs, faiss_index, bm25=bm25)
+
+    if artifact is not None and artifact.deltas:
+        print(f"  Replaying {len(artifact.deltas)} index update(s)...")
+        for delta in artifact.deltas:
+            retriever.add_documents(delta.added, embs=delta.embs, persist=False)
+            retriever.remove_documents(delta.removed, persist=False)
+    if use_index_cache:
+        # add_documents / remove_documents now persist their changes
+        retriever.store_dir = index_dir
+        if PERSIST_RETRIEVER_CACHES and retriever.load_caches():
+            print(f"  Loaded retriever caches: {retriever.cache_stats()}")
+    return retriever
+
+
+@dataclass
+class Shard:
+    source: str
+    retriever: VetRetriever
+    pdf_path: Optional[str] = None
+    # Global doc_id of each shard row (set by CorpusManager)
+    doc_ids: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+
+    @property
+    def key(self) -> str:
+        """
+        Names the shard's index across runs: its index cache directory
+        (PDF content + chunking parameters) when it has one.
+        """
+        store_dir = self.retriever.store_dir
+        return Path(store_dir).name if store_dir is not None else self.source
+
+
+class CorpusManager(RetrieverBase):
+    """
+    Retriever over several sources, each a shard with its own FAISS and
+    BM25 index that can be loaded or dropped on its own.
+
+    Queries are encoded once and searched on all shards in parallel; the
+    per-shard top-k lists are merged into one global top-k before fusion
+    and reranking, which run once as in VetRetriever. Dense scores are
+    cosine similarities and BM25 uses collection-wide statistics (see
+    bm25.CollectionStats), so scores from different shards are comparable.
+
+    Global doc_ids are handed out in order and never reused: a shard's
+    rows get the next free ids when it is added and when it grows, and
+    the ids of a dropped shard stay retired. Docs keep the shard's own id
+    as "shard_doc_id" and their "source".
+    """
+
+    def __init__(
+        self,
+        shards: Iterable[Shard] = (),
+        nprobe: int = FAISS_NPROBE,
+        ef_search: int = FAISS_EF_SEARCH,
+        query_embedder: Optional[SentenceTransformer] = None,
+        reranker: Optional[CrossEncoder] = None,
+        query_cache_size: int = QUERY_EMBED_CACHE_SIZE,
+        rerank_cache_size: int = RERANK_CACHE_SIZE,
+        search_workers: int = CORPUS_SEARCH_WORKERS,
+    ):
+        super().__init__(nprobe, ef_search, query_embedder, reranker, query_cache_size, rerank_cache_size)
+        self.shards: Dict[str, Shard] = {}
+        # BM25 statistics of all shards, kept current by the shards' indexes
+        self.bm25_stats = CollectionStats()
+        self._pool = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="shard")
+        for shard in shards:
+            self.add_shard(shard)
+
+    # ----- shards -----
+
+    def add_shard(self, shard: Shard) -> Shard:
+        if shard.source in self.shards:
+            raise ValueError(f"Source {shard.source!r} is already loaded")
+        self.shards[shard.source] = shard
+        shard.doc_ids = np.zeros(0, dtype=np.int64)
+        self._append_docs(shard, shard.retriever.docs)
+        bm25 = shard.retriever.bm25
+        self.bm25_stats.add_index(bm25)
+        bm25.set_collection_stats(self.bm25_stats)
+        return shard
+
+    def load_source(
+        self,
+        pdf_path: str,
+        source: Optional[str] = None,
+        use_index_cache: bool = USE_INDEX_CACHE,
+        writable_index: bool = False,
+    ) -> Shard:
+        """
+        Load (or build) the index of one PDF and add it as a shard;
+        `source` defaults to the file name without extension.
+        """
+        source = source or Path(pdf_path).stem
+        if source in self.shards:
+            raise ValueError(f"Source {source!r} is already loaded")
+        retriever = load_source_retriever(pdf_path, use_index_cache, writable_index, source=source)
+        return self.add_shard(Shard(source, retriever, pdf_path=str(pdf_path)))
+
+    def drop_shard(self, source: str) -> Shard:
+        """
+        Stop searching `source`; its index files are left untouched and
+        its global doc_ids are not reused (adding it again assigns new ones).
+        """
+        shard = self.shards.pop(source)
+        bm25 = shard.retriever.bm25
+        bm25.set_collection_stats(None)
+        self.bm25_stats.add_index(bm25, sign=-1)
+        for doc_id in shard.doc_ids.tolist():
+            self.docs[doc_id] = None
+            self.texts[doc_id] = None
+        return shard
+
+    def _append_docs(self, shard: Shard, docs: List[Dict[str, Any]]) -> None:
+        """
+        Add a shard's new docs to the global docs view under the next free
+        global doc_ids.
+        """
+        first = len(self.docs)
+        for offset, d in enumerate(docs):
+            self.docs.append(dict(d, doc_id=first + offset, shard_doc_id=d["doc_id"], source=shard.source))
+            self.texts.append(d["text"])
+        shard.doc_ids = np.concatenate([shard.doc_ids, np.arange(first, len(self.docs))])
+
+    def _shard_of(self, doc_id: int) -> Tuple[Shard, int]:
+        """
+        (shard, shard_doc_id) of a global doc_id.
+        """
+        d = self.docs[doc_id] if 0 <= doc_id < len(self.docs) else None
+        if d is None:
+            raise KeyError(doc_id)
+        return self.shards[d["source"]], d["shard_doc_id"]
+
+    # ----- incremental updates -----
+
+    def add_documents(
+        self,
+        chunks: List[Dict[str, Any]],
+        embs: Optional[np.ndarray] = None,
+        source: Optional[str] = None,
+        persist: bool = True,
+    ) -> List[int]:
+        """
+        Append chunks to the shard of `source` (may be omitted when only
+        one shard is loaded); returns their global doc_ids.
+        """
+        if source is None:
+            if len(self.shards) != 1:
+                raise ValueError("source is required when several shards are loaded")
+            source = next(iter(self.shards))
+        if source not in self.shards:
+            raise KeyError(f"Unknown source {source!r}; load it with load_source first")
+        shard = self.shards[source]
+        rows = shard.retriever.add_documents(chunks, embs=embs, source=source, persist=persist)
+        self._append_docs(shard, [shard.retriever.docs[r] for r in rows])
+        return shard.doc_ids[rows].tolist()
+
+    def remove_documents(
+        self,
+        doc_ids: Optional[List[int]] = None,
+        source: Optional[str] = None,
+        persist: bool = True,
+    ) -> List[int]:
+        """
+        Remove documents by global doc_id and/or every document of a source
+        (the shard stays loaded); returns the removed global doc_ids.
+        """
+        by_shard: Dict[str, List[int]] = {}
+        for doc_id in doc_ids or []:
+            shard, row = self._shard_of(doc_id)
+            by_shard.setdefault(shard.source, []).append(row)
+        if source is not None:
+            shard = self.shards[source]
+            by_shard.setdefault(source, []).extend(np.flatnonzero(shard.retriever.bm25.live).tolist())
+
+        removed = []
+        for name, rows in by_shard.items():
+            shard = self.shards[name]
+            removed += shard.doc_ids[shard.retriever.remove_documents(rows, persist=persist)].tolist()
+        return sorted(removed)
+
+    # ----- caches -----
+
+    def _doc_keys(self, doc_ids: np.ndarray) -> Dict[str, np.ndarray]:
+        # Global doc_ids depend on the load order: save (shard key,
+        # shard_doc_id) instead. Docs of dropped shards are saved as ("", -1).
+        docs = [self.docs[i] for i in doc_ids.tolist()]
+        return {
+            "rerank_shards": np.array(
+                [self.shards[d["source"]].key if d is not None else "" for d in docs], dtype=str
+            ),
+            "rerank_doc_ids": np.array(
+                [d["shard_doc_id"] if d is not None else -1 for d in docs], dtype=np.int64
+            ),
+        }
+
+    def _doc_ids_from_keys(self, data: Any) -> np.ndarray:
+        doc_ids = np.full(len(data["rerank_doc_ids"]), -1, dtype=np.int64)
+        if "rerank_shards" not in data:
+            return doc_ids
+        shards = {shard.key: shard for shard in self.shards.values()}
+        for i, (key, row) in enumerate(zip(data["rerank_shards"].tolist(), data["rerank_doc_ids"].tolist())):
+            shard = shards.get(key)
+            if shard is not None and 0 <= row < len(shard.doc_ids):
+                doc_ids[i] = shard.doc_ids[row]
+        return doc_ids
+
+    # ----- fan-out search -----
+
+    @staticmethod
+    def _merge_hits(shards: List[Shard], per_shard: List[List[Hits]], k: int) -> List[Hits]:
+        """
+        Global top-k per query from the shards' top-k lists, in global
+        doc_ids. Ties go to the higher doc index, as in BM25Index.top_k.
+        """
+        merged = []
+        for q in range(len(per_shard[0])):
+            idx = np.concatenate([shard.doc_ids[hits[q][0]] for shard, hits in zip(shards, per_shard)])
+            scores = np.concatenate([hits[q][1] for hits in per_shard])
+            order = np.lexsort((-idx, -scores))[:k]
+            merged.append((idx[order].astype(np.int64), scores[order].astype(np.float64)))
+        return merged
+
+    def _shards_for(self, filters: Optional[SearchFilter]) -> List[Shard]:
+        # A source filter prunes whole shards before any search.
+        shards = list(self.shards.values())
+        if filters is not None and filters.sources is not None:
+            shards = [s for s in shards if s.source in filters.sources]
+        return shards
+
+    @staticmethod
+    def _shard_filters(filters: Optional[SearchFilter]) -> Optional[SearchFilter]:
+        # The source constraint is applied by _shards_for: a shard's docs
+        # need not carry "source" (e.g. shards built without one).
+        if filters is None:
+            return None
+        filters = replace(filters, sources=None)
+        return None if filters == SearchFilter() else filters
+
+    def filter_mask(self, filters: SearchFilter) -> np.ndarray:
+        mask = np.zeros(len(self.docs), dtype=bool)
+        shard_filters = self._shard_filters(filters)
+        for shard in self._shards_for(filters):
+            if shard_filters is None:
+                mask[shard.doc_ids] = shard.retriever.bm25.live
+            else:
+                mask[shard.doc_ids] = shard.retriever.filter_mask(shard_filters)
+        return mask
+
+    def _dense_hits_many(
+        self,
+        queries: List[str],
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Hits]:
+        if not queries:
+            return []
+        shards = self._shards_for(filters)
+        if not shards:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0)) for _ in queries]
+        q_embs = self._encode_queries(queries)
+        shard_filters = self._shard_filters(filters)
+        per_shard = list(self._pool.map(
+            lambda shard: shard.retriever._dense_hits_for_embeddings(
+                q_embs, k, nprobe or self.nprobe, ef_search or self.ef_search, shard_filters
+            ),
+            shards,
+        ))
+        return self._merge_hits(shards, per_shard, k)
+
+    def _bm25_hits_many(
+        self, queries: List[str], k: int, filters: Optional[SearchFilter] = None
+    ) -> List[Hits]:
+        if not queries:
+            return []
+        shards = self._shards_for(filters)
+        if not shards:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0)) for _ in queries]
+        shard_filters = self._shard_filters(filters)
+        per_shard = list(self._pool.map(
+            lambda shard: shard.retriever._bm25_hits_many(queries, k, shard_filters),
+            shards,
+        ))
+        return self._merge_hits(shards, per_shard, k)
+
+    def shard_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            s.source: {
+                "docs": int(s.retriever.bm25.corpus_size),
+                "pdf_path": s.pdf_path,
+            }
+            for s in self.shards.values()
+        }
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+def build_corpus(
+    pdf_paths: Iterable[str],
+    use_index_cache: bool = USE_INDEX_CACHE,
+    writable_index: bool = False,
+) -> CorpusManager:
+    """
+    CorpusManager with one shard per PDF (relative paths are taken from
+    the project root), named after the file.
+    """
+    corpus = CorpusManager()
+    for pdf_path in pdf_paths:
+        path = Path(pdf_path)
+        if not path.is_absolute():
+            path = BASE_DIR / path
+        corpus.load_source(str(path), use_index_cache=use_index_cache, writable_index=writable_index)
+    print(f"Corpus: {corpus.shard_stats()}")
+    if use_index_cache:
+        corpus.store_dir = BASE_DIR / CORPUS_CACHE_DIR
+        corpus.store_dir.mkdir(parents=True, exist_ok=True)
+        if PERSIST_RETRIEVER_CACHES and corpus.load_caches():
+            print(f"  Loaded retriever caches: {corpus.cache_stats()}")
+    return corpus
@@ -1,42 +1,71 @@
-from typing import List
+from typing import Dict, Iterator, List
 import re
 
 from groq import Groq
 
+from .llm import chat_completion, stream_chat_lines
+
+DECOMPOSER_MODEL = "llama-3.3-70b-versatile"
+
+
+def _decompose_messages(main_query: str) -> List[Dict[str, str]]:
+    system = (
+        "You are an information retrieval expert for veterinary clinical cases. "
+        "Decompose a single complex clinical query into 2–4 focused English sub-queries."
+    )
+    user = f"Original query:\n{main_query}\n\nWrite 2–4 focused sub-queries, one per line."
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+
+def _clean_sub_query(line: str) -> str:
+    return re.sub(r"^[-*\d\.\)\s]+", "", line.strip()).strip()
+
 
 def decompose_case_query(
     client: Groq,
     main_query: str,
-    model: str = "llama-3.3-70b-versatile",
+    model: str = DECOMPOSER_MODEL,
 ) -> List[str]:
     """
     Use LLM to decompose the main clinical query into 2–4 focused sub-queries.
     """
-    system = (
-        "You are an information retrieval expert for veterinary clinical cases. "
-        "Decompose a single complex clinical query into 2–4 focused English sub-queries."
-    )
-    user = f"Original query:\n{main_query}\n\nWrite 2–4 focused sub-queries, one per line."
-
-    resp = client.chat.completions.create(
+    raw = chat_completion(
+        client,
         model=model,
         temperature=0.2,
         max_tokens=512,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
+        messages=_decompose_messages(main_query),
     )
 
-    raw = resp.choices[0].message.content or ""
     sub_queries: List[str] = []
     for line in raw.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        line = re.sub(r"^[-*\d\.\)\s]+", "", line).strip()
+        line = _clean_sub_query(line)
         if line:
             sub_queries.append(line)
     if not sub_queries:
         sub_queries = [main_query]
     return sub_queries
+
+
+def iter_sub_queries(
+    client: Groq,
+    main_query: str,
+    model: str = DECOMPOSER_MODEL,
+) -> Iterator[str]:
+    """
+    Streaming decompose_case_query: yields each sub-query as soon as its
+    line has been generated. Yields nothing if the LLM returned none.
+    """
+    for line in stream_chat_lines(
+        client,
+        model=model,
+        temperature=0.2,
+        max_tokens=512,
+        messages=_decompose_messages(main_query),
+    ):
+        line = _clean_sub_query(line)
+        if line:
+            yield line
@@ -1,30 +1,241 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import faiss
-from .config import TA_MODE, TA_MAX_EMBED
+from tqdm import tqdm
+from .config import (
+    TA_MODE,
+    TA_MAX_EMBED,
+    EMBED_BATCH_SIZE,
+    FAISS_INDEX_TYPE,
+    FAISS_NLIST,
+    FAISS_PQ_M,
+    FAISS_PQ_NBITS,
+    FAISS_HNSW_M,
+    EMBEDDING_STORAGE,
+)
 
+from .models import BGE_MODEL_NAME, get_embedder
 
-BGE_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+FAISS_INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+EMBEDDING_STORAGES = ("float32", "float16", "int8")
+_SQ_CODES = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8"}
 
 
 
-def build_bge_embeddings(docs: List[Dict[str, Any]]) -> np.ndarray:
-    texts = [d["text"] for d in docs]
-    if TA_MODE:
-        texts = texts[:TA_MAX_EMBED]
-    bge_embedder = SentenceTransformer(BGE_MODEL_NAME)
-    embs = bge_embedder.encode(
-        texts,
+def build_bge_embeddings(docs: List[Dict[str, Any]], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    _, embs = embed_chunk_stream(docs, batch_size=batch_size)
+    return embs
+
+
+def iter_embedding_batches(
+    docs: Iterable[Dict[str, Any]],
+    embedder: SentenceTransformer,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+    """
+    Group a (possibly lazy) stream of chunks into fixed-size batches and
+    yield (batch_docs, batch_embeddings).
+    """
+    batch: List[Dict[str, Any]] = []
+    for d in docs:
+        batch.append(d)
+        if len(batch) == batch_size:
+            yield batch, _encode(embedder, batch)
+            batch = []
+    if batch:
+        yield batch, _encode(embedder, batch)
+
+
+def _encode(embedder: SentenceTransformer, batch: List[Dict[str, Any]]) -> np.ndarray:
+    return embedder.encode(
+        [d["text"] for d in batch],
         normalize_embeddings=True,
-        show_progress_bar=True
+        show_progress_bar=False,
     ).astype("float32")
-    return embs
 
 
-def build_faiss_index(embs: np.ndarray) -> faiss.Index:
-    dim = embs.shape[1]
-    index = faiss.IndexFlatIP(dim)
+def embed_chunk_stream(
+    docs: Iterable[Dict[str, Any]],
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Consume a chunk stream (e.g. iter_chunks(iter_pdf_pages(...))) and embed
+    it batch by batch, so page text and per-batch model activations never
+    exist for the whole book at once. Embeddings are written into a
+    growing float32 buffer. In TA mode only the first TA_MAX_EMBED chunks
+    are embedded; the rest are still collected.
+    Returns (docs, embeddings).
+    """
+    max_embed = TA_MAX_EMBED if TA_MODE else None
+    bge_embedder = get_embedder()
+    dim = bge_embedder.get_sentence_embedding_dimension()
+
+    all_docs: List[Dict[str, Any]] = []
+    buffer = np.empty((0, dim), dtype="float32")
+    n = 0
+
+    def to_embed(stream):
+        for d in stream:
+            all_docs.append(d)
+            if max_embed is None or len(all_docs) <= max_embed:
+                yield d
+
+    progress = tqdm(unit="chunk", desc="Embedding")
+    for batch, embs in iter_embedding_batches(to_embed(docs), bge_embedder, batch_size):
+        if n + len(embs) > len(buffer):
+            grown = np.empty((max(2 * len(buffer), n + len(embs)), dim), dtype="float32")
+            grown[:n] = buffer[:n]
+            buffer = grown
+        buffer[n:n + len(embs)] = embs
+        n += len(embs)
+        progress.update(len(batch))
+    progress.close()
+    return all_docs, buffer[:n].copy()
+
+
+def _largest_divisor_at_most(n: int, limit: int) -> int:
+    for m in range(min(n, limit), 0, -1):
+        if n % m == 0:
+            return m
+    return 1
+
+
+def faiss_factory_string(
+    n: int,
+    dim: int,
+    index_type: str = FAISS_INDEX_TYPE,
+    nlist: int = FAISS_NLIST,
+    pq_m: int = FAISS_PQ_M,
+    pq_nbits: int = FAISS_PQ_NBITS,
+    hnsw_m: int = FAISS_HNSW_M,
+    storage: str = EMBEDDING_STORAGE,
+) -> str:
+    """
+    faiss.index_factory description for `index_type`, with the number of
+    IVF lists and PQ sub-quantizers clamped to what `n` vectors of
+    dimension `dim` can train. `storage` selects the vector codes of
+    the non-PQ types (Flat, SQfp16 or SQ8).
+    """
+    if index_type not in FAISS_INDEX_TYPES:
+        raise ValueError(f"Unknown index_type={index_type}, expected one of {FAISS_INDEX_TYPES}")
+    if storage not in EMBEDDING_STORAGES:
+        raise ValueError(f"Unknown storage={storage}, expected one of {EMBEDDING_STORAGES}")
+    codes = _SQ_CODES[storage]
+    if index_type == "flat":
+        return codes
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}" if codes == "Flat" else f"HNSW{hnsw_m},{codes}"
+    # k-means wants ~39 training points per centroid
+    nlist = max(1, min(nlist, n // 39))
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},{codes}"
+    if n < 2 ** pq_nbits:
+        # Too few vectors to train the PQ codebooks; fall back to IVF-Flat.
+        return f"IVF{nlist},{codes}"
+    return f"IVF{nlist},PQ{_largest_divisor_at_most(dim, pq_m)}x{pq_nbits}"
+
+
+def build_faiss_index(
+    embs: np.ndarray,
+    index_type: str = FAISS_INDEX_TYPE,
+    nlist: int = FAISS_NLIST,
+    pq_m: int = FAISS_PQ_M,
+    pq_nbits: int = FAISS_PQ_NBITS,
+    hnsw_m: int = FAISS_HNSW_M,
+    storage: str = EMBEDDING_STORAGE,
+) -> faiss.Index:
+    """
+    Inner-product index over normalised embeddings:
+    - flat: exact brute-force scan (IndexFlatIP)
+    - ivf_flat / ivf_pq: inverted lists trained on `embs` (PQ-compressed for ivf_pq)
+    - hnsw: graph index, no training
+    With storage="float16" / "int8" the flat, IVF-Flat and HNSW vectors
+    are held as scalar-quantized codes instead of float32.
+    """
+    n, dim = embs.shape
+    description = faiss_factory_string(n, dim, index_type, nlist, pq_m, pq_nbits, hnsw_m, storage)
+    index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(embs)
     index.add(embs)
     return index
+
+
+def search_params(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    sel: Optional[faiss.IDSelector] = None,
+) -> Optional[faiss.SearchParameters]:
+    """
+    Per-query search parameters for IVF (nprobe) or HNSW (efSearch) indexes,
+    passed to index.search(..., params=...) so the shared index is not mutated.
+    `sel` restricts the search to the selected ids (any index type); the
+    caller must keep it alive until the search returns.
+    Returns None when there is nothing to set.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if isinstance(ivf, faiss.IndexIVF) and (nprobe is not None or sel is not None):
+        return faiss.SearchParametersIVF(nprobe=nprobe or ivf.nprobe, sel=sel)
+    if isinstance(index, faiss.IndexHNSW) and (ef_search is not None or sel is not None):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or index.hnsw.efSearch, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def is_compressed_index(index: faiss.Index) -> bool:
+    """
+    True if the index stores lossy vector codes (scalar quantizer or PQ),
+    i.e. its scores should be rescored against the float32 embeddings.
+    """
+    # Keep `index` referenced: downcast wrappers do not own the C++ object.
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    ivf = faiss.try_extract_index_ivf(base)
+    if ivf is not None:
+        return not isinstance(faiss.downcast_index(ivf), faiss.IndexIVFFlat)
+    return not isinstance(base, faiss.IndexFlat)
+
+
+def is_read_only_index(index: faiss.Index) -> bool:
+    """
+    True for IVF indexes loaded memory-mapped (IO_FLAG_MMAP | IO_FLAG_READ_ONLY),
+    which cannot be modified in place.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return False
+    invlists = faiss.downcast_InvertedLists(ivf.invlists)
+    return isinstance(invlists, faiss.OnDiskInvertedLists) and invlists.read_only
+
+
+def add_to_faiss_index(index: faiss.Index, embs: np.ndarray, ids: np.ndarray) -> None:
+    """
+    Append vectors labelled with their doc rows. IVF indexes store the ids
+    explicitly; flat and HNSW indexes label by insertion order, so `ids`
+    must continue their current numbering.
+    """
+    if faiss.try_extract_index_ivf(index) is not None:
+        index.add_with_ids(embs, ids.astype("int64"))
+        return
+    if len(ids) and ids[0] != index.ntotal:
+        raise ValueError(
+            f"FAISS index holds {index.ntotal} vectors; new ids must start there, got {ids[0]}"
+        )
+    index.add(embs)
+
+
+def remove_from_faiss_index(index: faiss.Index, ids: np.ndarray) -> bool:
+    """
+    Physically remove vectors where the index supports it without
+    renumbering (IVF). Returns False otherwise; callers then mask the ids
+    at search time.
+    """
+    if faiss.try_extract_index_ivf(index) is None:
+        return False
+    index.remove_ids(faiss.IDSelectorBatch(ids.astype("int64")))
+    return True
@@ -1,11 +1,44 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
+import json
 import re
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from groq import Groq
 
+from .checkpoint import CheckpointLog, checkpoint_key
+from .config import (
+    EVAL_MAX_WORKERS,
+    JUDGE_MODE,
+    RELEVANCE_PROXY_MIN_AGREEMENT,
+    RELEVANCE_PROXY_SAMPLE_FRACTION,
+)
+from .llm import Usage, approx_tokens, chat_completion, prompt_tokens, track_usage
+from .relevance_proxy import (
+    RelevanceCalibration,
+    RelevanceProxy,
+    calibration_sample,
+    calibration_sample_size,
+)
+
+JUDGE_MODEL = "llama-3.1-8b-instant"
+JUDGE_MODES = ("full", "efficient")
+
+# Metric columns evaluate_system adds to every row.
+JUDGE_COLUMNS = (
+    "correctness_score",
+    "hallucination_score",
+    "evidence_relevance",
+    "judge_llm_calls",
+    "judge_tokens",
+    "full_judge_llm_calls",
+    "full_judge_tokens",
+    "relevance_proxy_passages",
+)
+
 CORRECTNESS_RUBRIC = """
 You are a strict evaluator of correctness in veterinary QA.
 
@@ -50,14 +83,42 @@ Return ONLY:
 score: <integer>
 """
 
+EVIDENCE_RELEVANCE_BATCH_SYSTEM_PROMPT = """
+You are a senior veterinary clinician evaluating information relevance for clinical question answering.
+
+You are given several numbered evidence passages. Assess each one independently:
+does it provide clinically meaningful support to answer the question?
+
+Scoring rubric (0–5):
+0 = irrelevant
+1 = weakly related, not clinically useful
+2 = somewhat related but generic
+3 = helpful but incomplete
+4 = clinically meaningful and helpful
+5 = directly answers the question
+
+Return ONLY a JSON object with one integer score per passage, in passage order:
+{"scores": [<integer>, ...]}
+"""
+
+
+def check_judge_mode(mode: str) -> None:
+    if mode not in JUDGE_MODES:
+        raise ValueError(f"Unknown judge mode={mode}, expected one of {JUDGE_MODES}")
+
 
 def judge_correctness_once(
     client: Groq,
     question: str,
     answer: str,
     gold: str,
-    model: str = "llama-3.1-8b-instant",
+    model: str = JUDGE_MODEL,
+    sample: int = 0,
 ) -> int:
+    """
+    One correctness grade. `sample` numbers repeated draws so each one
+    is cached separately.
+    """
     user_prompt = f"""
 Question:
 {question}
@@ -68,32 +129,45 @@ System answer:
 Gold answer:
 {gold}
 """
-    resp = client.chat.completions.create(
+    raw = chat_completion(
+        client,
         model=model,
         temperature=0,
         messages=[
             {"role": "system", "content": CORRECTNESS_RUBRIC},
             {"role": "user", "content": user_prompt},
         ],
-    )
-    raw = (resp.choices[0].message.content or "").strip()
+        cache_tag=f"sample-{sample}",
+    ).strip()
     grade = raw[0].upper() if raw else "C"
     mapping = {"A": 10, "B": 8, "C": 6, "D": 3, "F": 0}
     return mapping.get(grade, 6)
 
 
+def _median_grade(scores: List[int]) -> float:
+    # Three draws, or two that agree
+    return float(sorted(scores)[len(scores) // 2])
+
+
 def judge_correctness(
     client: Groq,
     question: str,
     answer: str,
     gold: str,
-    model: str = "llama-3.1-8b-instant",
+    model: str = JUDGE_MODEL,
+    early_stop: bool = False,
 ) -> float:
+    """
+    Median of three grades. early_stop=True skips the third grade when
+    the first two agree.
+    """
     scores = [
-        judge_correctness_once(client, question, answer, gold, model)
-        for _ in range(3)
+        judge_correctness_once(client, question, answer, gold, model, sample=i)
+        for i in range(2)
     ]
-    return float(sorted(scores)[1])  # median
+    if not (early_stop and scores[0] == scores[1]):
+        scores.append(judge_correctness_once(client, question, answer, gold, model, sample=2))
+    return _median_grade(scores)
 
 
 def judge_hallucination_score(
@@ -101,7 +175,7 @@ def judge_hallucination_score(
     query: str,
     evidences: List[str],
     answer: str,
-    model: str = "llama-3.1-8b-instant",
+    model: str = JUDGE_MODEL,
 ) -> int:
     ev_text = "\n---\n".join(evidences)
     user_prompt = f"""
@@ -114,7 +188,8 @@ Evidence:
 Answer:
 {answer}
 """
-    resp = client.chat.completions.create(
+    out = chat_completion(
+        client,
         model=model,
         temperature=0,
         messages=[
@@ -122,71 +197,431 @@ Answer:
             {"role": "user", "content": user_prompt},
         ],
     )
-    out = resp.choices[0].message.content or ""
     m = re.search(r"score\s*:\s*([0-9]+)", out)
     return int(m.group(1)) if m else 5
 
 
+def _relevance_messages(query: str, evidence: str) -> List[Dict[str, str]]:
+    user_prompt = f"""
+Query:
+{query}
+
+Evidence:
+{evidence}
+"""
+    return [
+        {"role": "system", "content": EVIDENCE_RELEVANCE_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
 def judge_evidence_relevance(
     client: Groq,
     query: str,
     evidence: str,
-    model: str = "llama-3.1-8b-instant",
+    model: str = JUDGE_MODEL,
 ) -> int:
+    out = chat_completion(
+        client,
+        model=model,
+        temperature=0,
+        messages=_relevance_messages(query, evidence),
+    )
+    m = re.search(r"score\s*:\s*([0-5])", out)
+    return int(m.group(1)) if m else 2
+
+
+def _parse_relevance_scores(raw: str, n: int) -> List[int]:
+    """
+    n scores from a {"scores": [...]} reply; bare digits if the JSON is
+    broken. Missing or out-of-range scores fall back to 2, as in
+    judge_evidence_relevance.
+    """
+    try:
+        scores = json.loads(raw).get("scores")
+    except (ValueError, AttributeError):
+        scores = None
+    if not isinstance(scores, list):
+        scores = re.findall(r"\b([0-5])\b", raw)
+    out = []
+    for i in range(n):
+        try:
+            score = int(scores[i])
+        except (IndexError, TypeError, ValueError):
+            score = 2
+        out.append(score if 0 <= score <= 5 else 2)
+    return out
+
+
+def judge_evidence_relevance_batch(
+    client: Groq,
+    query: str,
+    evidences: List[str],
+    model: str = JUDGE_MODEL,
+) -> List[int]:
+    """
+    Relevance of every passage in one JSON-mode call, in passage order.
+    """
+    passages = "\n\n".join(f"[{i}]\n{evidence}" for i, evidence in enumerate(evidences, start=1))
     user_prompt = f"""
 Query:
 {query}
 
-Evidence:
-{evidence}
+Evidence passages ({len(evidences)}):
+{passages}
 """
-    resp = client.chat.completions.create(
+    out = chat_completion(
+        client,
         model=model,
         temperature=0,
         messages=[
-            {"role": "system", "content": EVIDENCE_RELEVANCE_SYSTEM_PROMPT},
+            {"role": "system", "content": EVIDENCE_RELEVANCE_BATCH_SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt},
         ],
+        response_format={"type": "json_object"},
     )
-    out = resp.choices[0].message.content or ""
-    m = re.search(r"score\s*:\s*([0-5])", out)
-    return int(m.group(1)) if m else 2
+    return _parse_relevance_scores(out, len(evidences))
 
 
-def evaluate_system(
+def _evidence_list(evidence_texts: Any) -> List[str]:
+    if not evidence_texts:
+        return []
+    return evidence_texts if isinstance(evidence_texts, list) else [evidence_texts]
+
+
+def judge_calls(
     client: Groq,
-    df: pd.DataFrame,
-    model: str = "llama-3.1-8b-instant",
-) -> pd.DataFrame:
-    correctness_scores = []
-    hallucination_scores = []
-    relevance_scores = []
+    query: str,
+    answer: str,
+    gold: str,
+    evidence_texts: Any,
+    model: str = JUDGE_MODEL,
+    mode: str = JUDGE_MODE,
+    with_relevance: bool = True,
+) -> List[Tuple[str, int, Callable[[], Any]]]:
+    """
+    The independent judge calls for one answer, as (kind, slot, call).
+    "full" mode: three correctness draws, plus hallucination and
+    per-passage relevance for the top 3 evidence passages if there is
+    any evidence. "efficient" mode: two correctness draws (see
+    followup_judge_calls) and one batched relevance call instead.
+    with_relevance=False leaves out relevance (see proxy_relevance_calls).
+    """
+    check_judge_mode(mode)
+    n_grades = 3 if mode == "full" else 2
+    calls: List[Tuple[str, int, Callable[[], Any]]] = [
+        ("correctness", j, partial(judge_correctness_once, client, query, answer, gold, model, j))
+        for j in range(n_grades)
+    ]
+    ev_list = _evidence_list(evidence_texts)
+    if not ev_list:
+        return calls
+    calls.append(
+        ("hallucination", 0, partial(judge_hallucination_score, client, query, ev_list[:3], answer, model))
+    )
+    if not with_relevance:
+        return calls
+    if mode == "efficient":
+        calls.append(
+            ("relevance_batch", 0, partial(judge_evidence_relevance_batch, client, query, ev_list[:3], model))
+        )
+        return calls
+    for j, evidence in enumerate(ev_list[:3]):
+        calls.append(("relevance", j, partial(judge_evidence_relevance, client, query, evidence, model)))
+    return calls
+
 
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        q = str(row["query"])
-        ans = str(row["answer"])
-        gold = str(row["gold_answer"])
-        evs = row["evidence_texts"]
+def followup_judge_calls(
+    client: Groq,
+    query: str,
+    answer: str,
+    gold: str,
+    results: Dict[Tuple[str, int], Any],
+    model: str = JUDGE_MODEL,
+    mode: str = JUDGE_MODE,
+) -> List[Tuple[str, int, Callable[[], Any]]]:
+    """
+    Judge calls that depend on the judge_calls results: in "efficient"
+    mode, the third correctness draw when the first two disagree.
+    """
+    check_judge_mode(mode)
+    grades = [_unpack(results[("correctness", j)])[0] for j in range(2) if ("correctness", j) in results]
+    if mode == "full" or len(grades) < 2 or grades[0] == grades[1]:
+        return []
+    return [("correctness", 2, partial(judge_correctness_once, client, query, answer, gold, model, 2))]
 
-        correctness_scores.append(judge_correctness(client, q, ans, gold, model))
 
-        if not evs:
-            hallucination_scores.append(10.0)
-            relevance_scores.append(None)
+def proxy_relevance_calls(
+    client: Groq,
+    proxy: RelevanceProxy,
+    system: str,
+    case_id: str,
+    query: str,
+    evidence_texts: Any,
+    model: str = JUDGE_MODEL,
+) -> List[Tuple[str, int, Callable[[], Any]]]:
+    """
+    Relevance calls for the top 3 evidence passages of one answer with
+    a calibrated proxy: ("relevance_proxy", j) returning the proxy grade
+    where it is confident, otherwise the LLM call ("relevance", j).
+    Passages of the calibration sample (proxy.sample_results) are left out.
+    """
+    sampled = proxy.sample_results(system, case_id)
+    calls: List[Tuple[str, int, Callable[[], Any]]] = []
+    for j, evidence in enumerate(_evidence_list(evidence_texts)[:3]):
+        if ("relevance", j) in sampled:
             continue
+        grade = proxy.grade(system, case_id, j)
+        if grade is not None:
+            calls.append(("relevance_proxy", j, lambda grade=grade: grade))
+        else:
+            calls.append(("relevance", j, partial(judge_evidence_relevance, client, query, evidence, model)))
+    return calls
 
-        ev_list = evs if isinstance(evs, list) else [evs]
-        hallucination_scores.append(
-            judge_hallucination_score(client, q, ev_list[:3], ans, model)
+
+def calibrate_relevance_proxy(
+    client: Groq,
+    scorer: Callable[[List[Tuple[str, str]]], np.ndarray],
+    dfs: Sequence[pd.DataFrame],
+    model: str = JUDGE_MODEL,
+    sample_fraction: float = RELEVANCE_PROXY_SAMPLE_FRACTION,
+    min_agreement: float = RELEVANCE_PROXY_MIN_AGREEMENT,
+    max_workers: int = EVAL_MAX_WORKERS,
+    checkpoint: Optional[CheckpointLog] = None,
+) -> RelevanceProxy:
+    """
+    Score the top 3 evidence passages of every row (rows need "system"
+    and "case_id") with scorer, a cross-encoder over (query, passage)
+    pairs, e.g. VetRetriever.relevance_scores. Then grade a sample spread
+    over the score range (see calibration_sample_size) with the LLM judge (concurrently, checkpointed
+    under the same keys as evaluate_system's relevance calls), fit the
+    calibration on it, and print its leave-one-out agreement.
+    """
+    slots = []
+    for df in dfs:
+        for _, row in df.iterrows():
+            for j, evidence in enumerate(_evidence_list(row["evidence_texts"])[:3]):
+                key = RelevanceProxy.slot_key(row["system"], row["case_id"], j)
+                slots.append((key, str(row["query"]), evidence))
+    ce_scores = np.asarray(scorer([(query, evidence) for _, query, evidence in slots]), dtype=np.float64)
+    picks = calibration_sample(ce_scores, calibration_sample_size(len(slots), sample_fraction))
+
+    sample: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for i in picks:
+            key, query, evidence = slots[i]
+            if checkpoint is not None and key in checkpoint:
+                sample[key] = checkpoint.get(key)
+                continue
+            call = partial(judge_evidence_relevance, client, query, evidence, model)
+            futures[pool.submit(metered(call))] = key
+        error = None
+        for fut in tqdm(as_completed(futures), total=len(futures)):
+            key = futures[fut]
+            try:
+                sample[key] = fut.result()
+            except Exception as err:
+                error = error or err
+                continue
+            if checkpoint is not None:
+                checkpoint.put(key, sample[key])
+        if error is not None:
+            raise error
+
+    calibration = RelevanceCalibration(
+        [float(ce_scores[i]) for i in picks],
+        [int(_unpack(sample[slots[i][0]])[0]) for i in picks],
+    )
+    proxy = RelevanceProxy(
+        calibration,
+        {key: float(score) for (key, _, _), score in zip(slots, ce_scores)},
+        sample,
+        min_agreement,
+    )
+    print(f"Relevance proxy calibrated on {len(sample)} of {len(slots)} evidence passages")
+    stats = calibration.agreement_stats(min_agreement)
+    if "exact" in stats:
+        spearman = "n/a" if stats["spearman"] is None else f"{stats['spearman']:.2f}"
+        accepted_exact = "n/a" if stats["accepted_exact"] is None else f"{stats['accepted_exact']:.0%}"
+        print(
+            f"  leave-one-out vs LLM: exact {stats['exact']:.0%}, within 1 grade {stats['within_1']:.0%}, "
+            f"MAE {stats['mae']:.2f}, Spearman {spearman}; proxy grades {stats['accepted']:.0%} "
+            f"itself, exact on those: {accepted_exact}"
         )
-        rel = [
-            judge_evidence_relevance(client, q, evidence, model)
-            for evidence in ev_list[:3]
-        ]
-        relevance_scores.append(float(np.mean(rel)))
+    return proxy
+
+
+def metered(call: Callable[[], Any]) -> Callable[[], List[Any]]:
+    """
+    Wrap a judge call to return [score, usage dict] with the LLM calls
+    and tokens it spent.
+    """
+    def run() -> List[Any]:
+        with track_usage() as usage:
+            score = call()
+        return [score, usage.as_dict()]
+    return run
+
+
+def _unpack(result: Any) -> Tuple[Any, Optional[Usage]]:
+    """
+    (score, usage) of a metered judge result. Bare scores (checkpoints
+    written before usage was recorded) have no usage.
+    """
+    if isinstance(result, (list, tuple)) and len(result) == 2 and isinstance(result[1], dict):
+        return result[0], Usage(**result[1])
+    return result, None
+
+
+def full_mode_usage(query: str, evidence_texts: Any, usage: Dict[Tuple[str, int], Usage]) -> Usage:
+    """
+    Calls and tokens "full" mode spends on an answer, from the usage of
+    the calls actually made in either mode: a skipped third correctness
+    draw costs as much as the first (same prompt), and a batched or
+    proxy relevance grade stands for one call per passage it covers.
+    """
+    total = Usage()
+    for (kind, _), used in usage.items():
+        if kind not in ("relevance_batch", "relevance_proxy"):
+            total.add(used)
+    grades = [usage[key] for key in sorted(usage) if key[0] == "correctness"]
+    for _ in range(len(grades), 3 if grades else 0):
+        total.add(Usage(1, 0, grades[0].tokens))
+    passages = _evidence_list(evidence_texts)[:3]
+    estimated = [j for kind, j in usage if kind == "relevance_proxy"]
+    if ("relevance_batch", 0) in usage:
+        estimated = list(range(len(passages)))
+    for j in estimated:
+        messages = _relevance_messages(query, passages[j])
+        total.add(Usage(1, 0, prompt_tokens(messages) + approx_tokens("score: 2")))
+    return total
+
+
+def combine_judge_scores(
+    results: Dict[Tuple[str, int], Any],
+    query: str = "",
+    evidence_texts: Any = None,
+) -> Dict[str, Any]:
+    """
+    Metric columns (JUDGE_COLUMNS) for one answer from its judge call
+    results, keyed by (kind, slot). Besides the scores: the judge's LLM
+    calls and tokens for this answer, what "full" mode spends on it, and
+    how many passages the relevance proxy graded.
+    """
+    scores, usage = {}, {}
+    for key, result in results.items():
+        scores[key], used = _unpack(result)
+        if used is not None:
+            usage[key] = used
+    relevance = [scores[key] for key in sorted(scores) if key[0] in ("relevance", "relevance_proxy")]
+    relevance += scores.get(("relevance_batch", 0), [])
+    proxy_graded = sum(1 for kind, _ in scores if kind == "relevance_proxy")
+    grades = [scores[("correctness", j)] for j in range(3) if ("correctness", j) in scores]
+
+    spent = Usage()
+    for used in usage.values():
+        spent.add(used)
+    full = full_mode_usage(query, evidence_texts, usage)
+    known = bool(usage)
+    return {
+        "correctness_score": _median_grade(grades),
+        "hallucination_score": scores.get(("hallucination", 0), 10.0),
+        "evidence_relevance": float(np.mean(relevance)) if relevance else None,
+        "judge_llm_calls": spent.calls if known else None,
+        "judge_tokens": spent.tokens if known else None,
+        "full_judge_llm_calls": full.calls if known else None,
+        "full_judge_tokens": full.tokens if known else None,
+        "relevance_proxy_passages": proxy_graded if relevance else None,
+    }
+
+
+def _run_judge_calls(
+    pool: ThreadPoolExecutor,
+    df: pd.DataFrame,
+    calls_per_row: List[List[Tuple[str, int, Callable[[], Any]]]],
+    results: List[Dict[Tuple[str, int], Any]],
+    checkpoint: Optional[CheckpointLog],
+) -> None:
+    futures = {}
+    for pos, calls in enumerate(calls_per_row):
+        row = df.iloc[pos]
+        for kind, j, call in calls:
+            key = None
+            if checkpoint is not None:
+                key = checkpoint_key(row["system"], row["case_id"], f"judge-{kind}-{j}")
+                if key in checkpoint:
+                    results[pos][(kind, j)] = checkpoint.get(key)
+                    continue
+            futures[pool.submit(metered(call))] = (pos, kind, j, key)
+    if not futures:
+        return
+
+    error = None
+    for fut in tqdm(as_completed(futures), total=len(futures)):
+        pos, kind, j, key = futures[fut]
+        try:
+            results[pos][(kind, j)] = fut.result()
+        except Exception as err:
+            # Keep collecting (and checkpointing) the other calls.
+            error = error or err
+            continue
+        if key is not None:
+            checkpoint.put(key, results[pos][(kind, j)])
+    if error is not None:
+        raise error
+
+
+def evaluate_system(
+    client: Groq,
+    df: pd.DataFrame,
+    model: str = JUDGE_MODEL,
+    max_workers: int = EVAL_MAX_WORKERS,
+    checkpoint: Optional[CheckpointLog] = None,
+    mode: str = JUDGE_MODE,
+    relevance_proxy: Optional[RelevanceProxy] = None,
+) -> pd.DataFrame:
+    """
+    Judge every row with independent LLM calls issued concurrently
+    (bounded thread pool, shared Groq rate limit, retry with backoff),
+    then with the follow-up calls those results call for ("efficient"
+    mode: third correctness draws). Scores are collected by row position,
+    so the output order and values do not depend on completion order.
+    With a checkpoint log (rows need "system" and "case_id"), each score
+    is appended as soon as it arrives and logged scores are not redone.
+    With a relevance_proxy (see calibrate_relevance_proxy), evidence
+    relevance comes from proxy_relevance_calls instead of judge_calls.
+    """
+    check_judge_mode(mode)
+    results: List[Dict[Tuple[str, int], Any]] = [{} for _ in range(len(df))]
+    texts = [
+        (str(row["query"]), str(row["answer"]), str(row["gold_answer"]))
+        for _, row in df.iterrows()
+    ]
+    calls = [
+        judge_calls(client, *text, evidence, model, mode, with_relevance=relevance_proxy is None)
+        for text, evidence in zip(texts, df["evidence_texts"])
+    ]
+    if relevance_proxy is not None:
+        for pos, (_, row) in enumerate(df.iterrows()):
+            results[pos].update(relevance_proxy.sample_results(row["system"], row["case_id"]))
+            calls[pos] += proxy_relevance_calls(
+                client, relevance_proxy, row["system"], row["case_id"],
+                texts[pos][0], row["evidence_texts"], model,
+            )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        _run_judge_calls(pool, df, calls, results, checkpoint)
+        _run_judge_calls(pool, df, [
+            followup_judge_calls(client, *text, row_results, model, mode)
+            for text, row_results in zip(texts, results)
+        ], results, checkpoint)
 
     out = df.copy()
-    out["correctness_score"] = correctness_scores
-    out["hallucination_score"] = hallucination_scores
-    out["evidence_relevance"] = relevance_scores
+    columns = [
+        combine_judge_scores(row_results, text[0], evidence)
+        for row_results, text, evidence in zip(results, texts, df["evidence_texts"])
+    ]
+    for name in JUDGE_COLUMNS:
+        out[name] = [col[name] for col in columns]
     return out
@@ -2,28 +2,19 @@ from typing import List
 
 import pandas as pd
 
-from .retriever import VetRetriever
+from .retriever import RetrieverBase, normalize_query
 
 
-def retrieve_multi_aspect(
-    retriever: VetRetriever,
+def merge_sub_query_results(
     sub_queries: List[str],
-    k_dense: int = 80,
-    k_bm25: int = 80,
-    alpha: float = 0.5,
-    top_k_candidates: int = 30,
-    top_k_final: int = 5,
+    per_query: List[pd.DataFrame],
 ) -> pd.DataFrame:
+    """
+    Tag each sub-query's reranked rows, drop duplicate chunks and sort by
+    combined_score.
+    """
     all_rows = []
-    for sq in sub_queries:
-        reranked = retriever.retrieve_with_rerank(
-            sq,
-            k_dense=k_dense,
-            k_bm25=k_bm25,
-            alpha=alpha,
-            top_k_candidates=top_k_candidates,
-            top_k_final=top_k_final,
-        )
+    for sq, reranked in zip(sub_queries, per_query):
         if reranked.empty:
             continue
         reranked = reranked.copy()
@@ -35,3 +26,69 @@ def retrieve_multi_aspect(
     merged = merged.drop_duplicates(subset=["doc_id", "page", "text"])
     merged = merged.sort_values("combined_score", ascending=False)
     return merged.reset_index(drop=True)
+
+
+def new_sub_queries(main_query: str, sub_queries: List[str]) -> List[str]:
+    """
+    Sub-queries that differ from the main query and from each other
+    (compared after normalisation).
+    """
+    seen = {normalize_query(main_query)}
+    new = []
+    for sq in sub_queries:
+        key = normalize_query(sq)
+        if key not in seen:
+            seen.add(key)
+            new.append(sq)
+    return new
+
+
+def merge_with_main_query(
+    main_query: str,
+    main_result: pd.DataFrame,
+    sub_queries: List[str],
+    new_results: List[pd.DataFrame],
+) -> pd.DataFrame:
+    """
+    merge_sub_query_results(sub_queries, ...) when the main query was
+    retrieved separately: sub-queries equal to the main query take
+    main_result, the others new_results (in new_sub_queries order).
+    The main query's evidence is only merged if it is a sub-query.
+    """
+    by_key = dict(zip(map(normalize_query, new_sub_queries(main_query, sub_queries)), new_results))
+    by_key[normalize_query(main_query)] = main_result
+    return merge_sub_query_results(sub_queries, [by_key[normalize_query(sq)] for sq in sub_queries])
+
+
+def retrieve_multi_aspect_with_main(
+    retriever: RetrieverBase,
+    main_query: str,
+    main_result: pd.DataFrame,
+    sub_queries: List[str],
+) -> pd.DataFrame:
+    """
+    Same evidence as retrieve_multi_aspect(retriever, sub_queries), reusing
+    the main query's result; the new sub-queries are retrieved in one batch.
+    """
+    new_results = retriever.retrieve_many(new_sub_queries(main_query, sub_queries))
+    return merge_with_main_query(main_query, main_result, sub_queries, new_results)
+
+
+def retrieve_multi_aspect(
+    retriever: RetrieverBase,
+    sub_queries: List[str],
+    k_dense: int = 80,
+    k_bm25: int = 80,
+    alpha: float = 0.5,
+    top_k_candidates: int = 30,
+    top_k_final: int = 5,
+) -> pd.DataFrame:
+    per_query = retriever.retrieve_many(
+        sub_queries,
+        k_dense=k_dense,
+        k_bm25=k_bm25,
+        alpha=alpha,
+        top_k_candidates=top_k_candidates,
+        top_k_final=top_k_final,
+    )
+    return merge_sub_query_results(sub_queries, per_query)
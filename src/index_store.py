@@ -0,0 +1,209 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import hashlib
+import json
+import shutil
+
+import numpy as np
+import faiss
+
+from .bm25 import BM25Index
+from .config import (
+    TA_MODE,
+    TA_MAX_PAGES,
+    TA_MAX_CHUNKS,
+    TA_MAX_EMBED,
+    FAISS_INDEX_TYPE,
+    FAISS_NLIST,
+    FAISS_PQ_M,
+    FAISS_PQ_NBITS,
+    FAISS_HNSW_M,
+    EMBEDDING_STORAGE,
+    INFERENCE_BACKEND,
+    TAG_VOCABULARY_PATH,
+)
+from .chunks import CHUNK_SIZE, CHUNK_OVERLAP
+from .embeddings import BGE_MODEL_NAME
+
+# Bump whenever the on-disk layout below changes.
+INDEX_FORMAT_VERSION = 2
+
+MANIFEST_FILE = "manifest.json"
+DOCS_FILE = "docs.json"
+EMBS_FILE = "embs.npy"
+FAISS_FILE = "faiss.index"
+BM25_FILE = "bm25.npz"
+
+
+DELTA_PREFIX = "delta-"
+
+
+@dataclass
+class IndexDelta:
+    added: List[Dict[str, Any]]
+    embs: Optional[np.ndarray]
+    removed: List[int]
+
+
+@dataclass
+class IndexArtifact:
+    docs: List[Dict[str, Any]]
+    embs: np.ndarray
+    faiss_index: faiss.Index
+    bm25: BM25Index
+    # Updates made after the artifact was built, oldest first;
+    # replay them with VetRetriever.add_documents / remove_documents.
+    deltas: List[IndexDelta] = field(default_factory=list)
+
+
+def _file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def index_params(pdf_path: str) -> Dict[str, Any]:
+    """
+    Everything that determines the content of an index artifact.
+    Changing any of these values produces a different index key.
+    """
+    params = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "pdf_sha256": _file_sha256(pdf_path),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "model_name": BGE_MODEL_NAME,
+        "inference_backend": INFERENCE_BACKEND,
+        "faiss_index": [
+            FAISS_INDEX_TYPE, FAISS_NLIST, FAISS_PQ_M, FAISS_PQ_NBITS, FAISS_HNSW_M, EMBEDDING_STORAGE
+        ],
+        "ta_mode": TA_MODE,
+        "ta_limits": [TA_MAX_PAGES, TA_MAX_CHUNKS, TA_MAX_EMBED] if TA_MODE else None,
+    }
+    if TAG_VOCABULARY_PATH is not None:
+        # Chunk tags are stored in the artifact (default vocabulary: no key change).
+        params["tag_vocabulary_sha256"] = _file_sha256(TAG_VOCABULARY_PATH)
+    return params
+
+
+def compute_index_key(params: Dict[str, Any]) -> str:
+    payload = json.dumps(params, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def index_dir_for(params: Dict[str, Any], cache_root: Path) -> Path:
+    """
+    Directory holding the artifact for this PDF + chunking/model parameters.
+    """
+    return Path(cache_root) / compute_index_key(params)
+
+
+def save_index(
+    index_dir: Path,
+    params: Dict[str, Any],
+    docs: List[Dict[str, Any]],
+    embs: np.ndarray,
+    faiss_index: faiss.Index,
+    bm25: BM25Index,
+) -> None:
+    """
+    Write the artifact to a temporary directory and rename it into place,
+    so a crashed run never leaves a half-written index behind.
+    """
+    index_dir = Path(index_dir)
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    with open(tmp_dir / DOCS_FILE, "w", encoding="utf-8") as f:
+        json.dump(docs, f, ensure_ascii=False)
+    np.save(tmp_dir / EMBS_FILE, np.ascontiguousarray(embs, dtype="float32"))
+    faiss.write_index(faiss_index, str(tmp_dir / FAISS_FILE))
+    bm25.save(str(tmp_dir / BM25_FILE))
+
+    manifest = dict(params, num_docs=len(docs), num_embs=int(embs.shape[0]))
+    with open(tmp_dir / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    if index_dir.exists():
+        shutil.rmtree(index_dir)
+    tmp_dir.rename(index_dir)
+
+
+def append_delta(
+    index_dir: Path,
+    added: List[Dict[str, Any]],
+    embs: Optional[np.ndarray],
+    removed: List[int],
+) -> None:
+    """
+    Persist one corpus update next to the artifact: delta-NNNNN.json holds
+    the added docs and removed doc_ids, delta-NNNNN.npy the new embeddings.
+    """
+    index_dir = Path(index_dir)
+    seq = len(list(index_dir.glob(f"{DELTA_PREFIX}*.json")))
+    stem = index_dir / f"{DELTA_PREFIX}{seq:05d}"
+    if embs is not None and len(embs):
+        np.save(stem.with_suffix(".npy"), np.ascontiguousarray(embs, dtype="float32"))
+    tmp = stem.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"added": added, "removed": [int(r) for r in removed]}, f, ensure_ascii=False)
+    # The .json file marks the delta as complete.
+    tmp.rename(stem.with_suffix(".json"))
+
+
+def _load_deltas(index_dir: Path) -> List[IndexDelta]:
+    deltas = []
+    for path in sorted(index_dir.glob(f"{DELTA_PREFIX}*.json")):
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        emb_path = path.with_suffix(".npy")
+        embs = np.load(emb_path) if emb_path.exists() else None
+        deltas.append(IndexDelta(payload["added"], embs, payload["removed"]))
+    return deltas
+
+
+def load_embeddings(index_dir: Path) -> np.ndarray:
+    """
+    Memory-mapped float32 embeddings of a saved artifact: pages are read
+    on demand (e.g. for exact rescoring) instead of held in RAM.
+    """
+    return np.load(Path(index_dir) / EMBS_FILE, mmap_mode="r")
+
+
+def load_index(
+    index_dir: Path,
+    params: Dict[str, Any],
+    writable: bool = False,
+) -> Optional[IndexArtifact]:
+    """
+    Load a previously saved artifact, or return None if it is missing
+    or was built with different parameters.
+    Embeddings and the FAISS index are memory-mapped where possible; the
+    FAISS index is read into memory instead when it has to be updated
+    (writable=True, or there are deltas to replay).
+    """
+    index_dir = Path(index_dir)
+    manifest_path = index_dir / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if any(manifest.get(key) != value for key, value in params.items()):
+        return None
+
+    deltas = _load_deltas(index_dir)
+    with open(index_dir / DOCS_FILE, encoding="utf-8") as f:
+        docs = json.load(f)
+    embs = load_embeddings(index_dir)
+    io_flags = 0 if (writable or deltas) else faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    faiss_index = faiss.read_index(str(index_dir / FAISS_FILE), io_flags)
+    bm25 = BM25Index.load(str(index_dir / BM25_FILE))
+    return IndexArtifact(
+        docs=docs, embs=embs, faiss_index=faiss_index, bm25=bm25, deltas=deltas
+    )
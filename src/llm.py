@@ -0,0 +1,333 @@
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import hashlib
+import json
+import random
+import threading
+import time
+
+from groq import (
+    Groq,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+
+from .cache import DiskCache, LRUCache, TieredCache
+from .config import (
+    GROQ_REQUESTS_PER_MINUTE,
+    GROQ_TOKENS_PER_MINUTE,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_SECONDS,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_SAMPLING_CALLS,
+    LLM_CACHE_PATH,
+    LLM_CACHE_MAX_MEMORY,
+    LLM_CACHE_MAX_DISK,
+    LLM_CACHE_TTL_SECONDS,
+)
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+class RateLimiter:
+    """
+    Sliding one-minute budget for requests and (estimated) tokens.
+    Thread-safe: acquire() blocks until the call fits in the budget.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, window: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events: Deque[Tuple[float, int]] = deque()
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= self.window:
+                    self._tokens_in_window -= self._events.popleft()[1]
+                fits_requests = len(self._events) < self.requests_per_minute
+                # A single call larger than the whole budget is let through alone.
+                fits_tokens = (
+                    not self._events
+                    or self._tokens_in_window + tokens <= self.tokens_per_minute
+                )
+                if fits_requests and fits_tokens:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                wait = self.window - (now - self._events[0][0])
+            time.sleep(max(wait, 0.01))
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_default_limiter() -> RateLimiter:
+    """
+    Process-wide limiter shared by every Groq call site (they share one API key).
+    """
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter(GROQ_REQUESTS_PER_MINUTE, GROQ_TOKENS_PER_MINUTE)
+        return _default_limiter
+
+
+_llm_cache: Optional[TieredCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> TieredCache:
+    """
+    Process-wide response cache: in-memory LRU in front of a SQLite file.
+    """
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            base_dir = Path(__file__).resolve().parent.parent
+            _llm_cache = TieredCache(
+                LRUCache(LLM_CACHE_MAX_MEMORY, LLM_CACHE_TTL_SECONDS),
+                DiskCache(base_dir / LLM_CACHE_PATH, LLM_CACHE_MAX_DISK, LLM_CACHE_TTL_SECONDS),
+            )
+        return _llm_cache
+
+
+def cache_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: Optional[int],
+    cache_tag: str = "",
+    response_format: Optional[Dict[str, Any]] = None,
+) -> str:
+    request = {
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "messages": messages,
+        "tag": cache_tag,
+    }
+    if response_format is not None:
+        request["response_format"] = response_format
+    payload = json.dumps(
+        request,
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def approx_tokens(text: str) -> int:
+    """
+    Rough token count of a text (~4 characters per token).
+    """
+    return len(text) // 4
+
+
+def prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """
+    Rough token count of a chat prompt.
+    """
+    return sum(approx_tokens(m["content"]) + 4 for m in messages)
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: Optional[int]) -> int:
+    """
+    Rough prompt token count plus the completion budget.
+    """
+    return prompt_tokens(messages) + (max_tokens or 256)
+
+
+@dataclass
+class Usage:
+    """
+    LLM calls and their (estimated) prompt + completion tokens. Cache
+    hits count like any other call and are also counted separately.
+    """
+
+    calls: int = 0
+    cache_hits: int = 0
+    tokens: int = 0
+
+    def add(self, other: "Usage") -> None:
+        self.calls += other.calls
+        self.cache_hits += other.cache_hits
+        self.tokens += other.tokens
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+_usage = threading.local()
+
+
+@contextmanager
+def track_usage() -> Iterator[Usage]:
+    """
+    Count the chat_completion / stream_chat_lines calls this thread makes
+    inside the block (an enclosing block counts them too).
+    """
+    usage = Usage()
+    stack = getattr(_usage, "stack", None)
+    if stack is None:
+        stack = _usage.stack = []
+    stack.append(usage)
+    try:
+        yield usage
+    finally:
+        stack.pop()
+
+
+def _record_usage(messages: List[Dict[str, str]], content: str, cached: bool) -> None:
+    stack = getattr(_usage, "stack", None)
+    if not stack:
+        return
+    tokens = prompt_tokens(messages) + approx_tokens(content)
+    for usage in stack:
+        usage.add(Usage(1, int(cached), tokens))
+
+
+def _retry_delay(err: Exception, attempt: int) -> float:
+    response = getattr(err, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return LLM_BACKOFF_SECONDS * (2 ** attempt) * (1 + random.random())
+
+
+def _cache_key_for(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: Optional[int],
+    cache: Optional[bool],
+    cache_tag: str,
+    response_format: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    if cache is None:
+        cache = LLM_CACHE_ENABLED and (temperature == 0 or LLM_CACHE_SAMPLING_CALLS)
+    if not cache:
+        return None
+    return cache_key(model, messages, temperature, max_tokens, cache_tag, response_format)
+
+
+def _create_with_retry(
+    client: Groq,
+    messages: List[Dict[str, str]],
+    max_tokens: Optional[int],
+    limiter: Optional[RateLimiter],
+    **kwargs: Any,
+) -> Any:
+    limiter = limiter or get_default_limiter()
+    kwargs["messages"] = messages
+    if max_tokens is not None:
+        kwargs["max_tokens"] = max_tokens
+    attempt = 0
+    while True:
+        limiter.acquire(estimate_tokens(messages, max_tokens))
+        try:
+            return client.chat.completions.create(**kwargs)
+        except RETRYABLE_ERRORS as err:
+            if attempt >= LLM_MAX_RETRIES:
+                raise
+            time.sleep(_retry_delay(err, attempt))
+            attempt += 1
+
+
+def chat_completion(
+    client: Groq,
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: Optional[int] = None,
+    limiter: Optional[RateLimiter] = None,
+    cache: Optional[bool] = None,
+    cache_tag: str = "",
+    response_format: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Rate-limited chat completion with exponential backoff on transient
+    errors (rate limits, timeouts, connection and 5xx errors).
+    Returns the message content ("" if the model returned none).
+
+    Responses are cached by (model, temperature, max_tokens, messages,
+    cache_tag, response_format). cache=None follows config (non-zero
+    temperature calls are cached only if LLM_CACHE_SAMPLING_CALLS);
+    True/False forces it. Use distinct cache_tag values for intentionally
+    repeated samples. response_format is passed through to the API,
+    e.g. {"type": "json_object"} for JSON mode.
+    Calls are counted by track_usage.
+    """
+    key = _cache_key_for(model, messages, temperature, max_tokens, cache, cache_tag, response_format)
+    if key is not None:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            _record_usage(messages, cached, cached=True)
+            return cached
+
+    extra = {"response_format": response_format} if response_format is not None else {}
+    resp = _create_with_retry(
+        client, messages, max_tokens, limiter, model=model, temperature=temperature, **extra
+    )
+    content = resp.choices[0].message.content or ""
+    _record_usage(messages, content, cached=False)
+    if key is not None:
+        get_llm_cache().put(key, content)
+    return content
+
+
+def stream_chat_lines(
+    client: Groq,
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: Optional[int] = None,
+    limiter: Optional[RateLimiter] = None,
+    cache: Optional[bool] = None,
+    cache_tag: str = "",
+) -> Iterator[str]:
+    """
+    chat_completion that yields the response line by line while it is
+    being generated (stream=True), so callers can start on early lines.
+    Shares chat_completion's cache entries; cache hits are replayed.
+    Only opening the stream is retried, not a stream that fails midway.
+    """
+    key = _cache_key_for(model, messages, temperature, max_tokens, cache, cache_tag)
+    if key is not None:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            _record_usage(messages, cached, cached=True)
+            yield from cached.splitlines()
+            return
+
+    stream = _create_with_retry(
+        client, messages, max_tokens, limiter, model=model, temperature=temperature, stream=True
+    )
+    parts: List[str] = []
+    pending = ""
+    for chunk in stream:
+        delta = (chunk.choices[0].delta.content or "") if chunk.choices else ""
+        parts.append(delta)
+        pending += delta
+        while "\n" in pending:
+            line, pending = pending.split("\n", 1)
+            yield line
+    if pending:
+        yield pending
+    _record_usage(messages, "".join(parts), cached=False)
+    if key is not None:
+        get_llm_cache().put(key, "".join(parts))
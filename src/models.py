@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import io
+import os
+import threading
+import time
+
+import torch
+from torch.ao.quantization import quantize_dynamic
+from sentence_transformers import SentenceTransformer, CrossEncoder
+
+from .config import INFERENCE_BACKEND, INFERENCE_THREADS
+
+BGE_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+RERANKER_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+MODEL_KINDS = ("embedder", "reranker")
+INFERENCE_BACKENDS = ("fp32", "int8")
+
+
+@dataclass
+class ModelInfo:
+    kind: str
+    name: str
+    backend: str
+    load_seconds: float
+    param_mb: float  # size of the weights
+    # Growth of process RSS across the load; None when another model was
+    # loading at the same time (the growth cannot be attributed).
+    rss_delta_mb: Optional[float]
+
+
+_LOADERS: Dict[str, Callable[..., Any]] = {
+    "embedder": lambda **kwargs: SentenceTransformer(BGE_MODEL_NAME, **kwargs),
+    "reranker": lambda **kwargs: CrossEncoder(RERANKER_MODEL_NAME, **kwargs),
+}
+_MODEL_NAMES = {"embedder": BGE_MODEL_NAME, "reranker": RERANKER_MODEL_NAME}
+
+_models: Dict[Tuple[str, str], Any] = {}
+_info: Dict[Tuple[str, str], ModelInfo] = {}
+_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_locks_lock = threading.Lock()
+_loading: set = set()
+_overlapped_loads: set = set()
+_threads_configured = False
+
+
+def _torch_module(model: Any) -> Any:
+    # CrossEncoder wraps a HF model; SentenceTransformer is the module itself.
+    return model.model if isinstance(model, CrossEncoder) else model
+
+
+def _param_mb(model: Any) -> float:
+    module = _torch_module(model)
+    if not isinstance(module, torch.nn.Module):
+        return 0.0
+    # Serialized state_dict also counts packed int8 weights, which
+    # parameters() does not expose.
+    buf = io.BytesIO()
+    torch.save(module.state_dict(), buf)
+    return buf.tell() / 2 ** 20
+
+
+def quantize_int8(model: Any) -> Any:
+    """
+    Dynamic int8 quantization of every nn.Linear (weights stored as int8,
+    activations quantized on the fly). CPU only.
+    """
+    module = quantize_dynamic(_torch_module(model), {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if isinstance(model, CrossEncoder):
+        model.model = module
+    return model
+
+
+def set_inference_threads(num_threads: Optional[int]) -> None:
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _load(kind: str, backend: str) -> Any:
+    global _threads_configured
+    if not _threads_configured:
+        set_inference_threads(INFERENCE_THREADS)
+        _threads_configured = True
+    if backend == "int8":
+        return quantize_int8(_LOADERS[kind](device="cpu"))
+    return _LOADERS[kind]()
+
+
+def _begin_load(key: Tuple[str, str]) -> None:
+    with _locks_lock:
+        if _loading:
+            _overlapped_loads.update(_loading | {key})
+        _loading.add(key)
+
+
+def _end_load(key: Tuple[str, str]) -> bool:
+    """
+    Finish a load; True if no other load overlapped it.
+    """
+    with _locks_lock:
+        _loading.discard(key)
+        overlapped = key in _overlapped_loads
+        _overlapped_loads.discard(key)
+        return not overlapped
+
+
+def get_model(kind: str, backend: Optional[str] = None) -> Any:
+    """
+    Process-wide instance of the `kind` model for `backend` (default:
+    INFERENCE_BACKEND), loaded on first use. Concurrent first calls for
+    the same model load it only once.
+    """
+    backend = backend or INFERENCE_BACKEND
+    if kind not in _LOADERS:
+        raise ValueError(f"Unknown model kind={kind}, expected one of {MODEL_KINDS}")
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown backend={backend}, expected one of {INFERENCE_BACKENDS}")
+    key = (kind, backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _locks_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _models:
+            _begin_load(key)
+            rss_before = _rss_mb()
+            t0 = time.perf_counter()
+            try:
+                model = _load(kind, backend)
+            finally:
+                load_seconds = time.perf_counter() - t0
+                rss_after = _rss_mb()
+                sequential = _end_load(key)
+            _info[key] = ModelInfo(
+                kind=kind,
+                name=_MODEL_NAMES[kind],
+                backend=backend,
+                load_seconds=load_seconds,
+                param_mb=_param_mb(model),
+                rss_delta_mb=(
+                    rss_after - rss_before
+                    if sequential and rss_before is not None and rss_after is not None
+                    else None
+                ),
+            )
+            _models[key] = model
+        return _models[key]
+
+
+def get_embedder(backend: Optional[str] = None) -> SentenceTransformer:
+    return get_model("embedder", backend)
+
+
+def get_reranker(backend: Optional[str] = None) -> CrossEncoder:
+    return get_model("reranker", backend)
+
+
+def preload_models(
+    kinds: Sequence[str] = MODEL_KINDS,
+    parallel: bool = True,
+    backend: Optional[str] = None,
+) -> Dict[Tuple[str, str], ModelInfo]:
+    """
+    Load the given models now (in parallel threads by default; model
+    loading is mostly file I/O and releases the GIL). Per-model RSS
+    growth is only reported for sequential loads (parallel=False).
+    """
+    if parallel and len(kinds) > 1:
+        with ThreadPoolExecutor(max_workers=len(kinds)) as pool:
+            list(pool.map(lambda kind: get_model(kind, backend), kinds))
+    else:
+        for kind in kinds:
+            get_model(kind, backend)
+    return model_info()
+
+
+def model_info() -> Dict[Tuple[str, str], ModelInfo]:
+    return dict(_info)
+
+
+def print_model_report() -> None:
+    for info in sorted(_info.values(), key=lambda i: (MODEL_KINDS.index(i.kind), i.backend)):
+        rss = f", RSS +{info.rss_delta_mb:.0f} MB" if info.rss_delta_mb is not None else ""
+        print(
+            f"  {info.kind} [{info.backend}]: {info.name} loaded in {info.load_seconds:.1f}s, "
+            f"{info.param_mb:.0f} MB weights{rss}"
+        )
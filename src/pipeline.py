@@ -0,0 +1,553 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import time
+
+import pandas as pd
+from groq import Groq
+
+from .agent import (
+    EvalCase,
+    SYSTEM_NAMES,
+    answer_baseline,
+    answer_gpt_only,
+    answer_improved,
+    eval_row,
+)
+from .checkpoint import CheckpointLog, checkpoint_key
+from .config import (
+    JUDGE_MODE,
+    PIPELINE_CPU_WORKERS,
+    PIPELINE_IO_WORKERS,
+    RELEVANCE_PROXY,
+    SPECULATIVE_RETRIEVAL,
+)
+from .decomposer import decompose_case_query
+from .evaluation import (
+    JUDGE_MODEL,
+    calibrate_relevance_proxy,
+    check_judge_mode,
+    combine_judge_scores,
+    followup_judge_calls,
+    judge_calls,
+    metered,
+    proxy_relevance_calls,
+)
+from .fusion import retrieve_multi_aspect, retrieve_multi_aspect_with_main
+from .prompts import EvidencePack, build_case_query, case_to_free_text, pack_evidence
+from .relevance_proxy import RelevanceProxy
+from .retriever import RetrieverBase
+
+POOLS = ("cpu", "io")
+
+
+@dataclass
+class Task:
+    name: str
+    fn: Callable[..., Any]
+    deps: Tuple[str, ...]
+    pool: str  # "cpu" (retrieval / reranking) or "io" (Groq calls)
+    stage: str  # label for the utilisation report
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    @property
+    def seconds(self) -> float:
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+@dataclass
+class StageStats:
+    stage: str
+    pool: str
+    tasks: int
+    busy_seconds: float
+    utilisation: float  # share of the pool's worker-time spent in this stage
+
+
+@dataclass
+class PipelineReport:
+    wall_seconds: float
+    serial_seconds: float  # sum of all task times (a fully sequential run)
+    critical_path: List[str]
+    critical_path_seconds: float
+    stages: List[StageStats] = field(default_factory=list)
+    workers: Dict[str, int] = field(default_factory=dict)
+    pool_utilisation: Dict[str, float] = field(default_factory=dict)
+    restored: int = 0  # tasks loaded from the checkpoint log
+    skipped: int = 0  # tasks only restored tasks depended on
+
+
+class TaskGraph:
+    """
+    Dependency graph of tasks run on two thread pools. A task starts as
+    soon as all of its dependencies have finished and is called with
+    their results, in the order the dependencies were listed.
+
+    With a checkpoint log, every finished task's result is appended to it
+    under the task name. Tasks already in the log are not run again, nor
+    are tasks whose results only those restored tasks needed.
+    """
+
+    def __init__(self, checkpoint: Optional[CheckpointLog] = None):
+        self.tasks: Dict[str, Task] = {}
+        self.results: Dict[str, Any] = {}
+        self.workers: Dict[str, int] = {}
+        self.wall_seconds = 0.0
+        self.checkpoint = checkpoint
+        self.restored: List[str] = []
+        self.skipped: List[str] = []
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        deps: Sequence[str] = (),
+        pool: str = "io",
+        stage: Optional[str] = None,
+    ) -> str:
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task name={name}")
+        if pool not in POOLS:
+            raise ValueError(f"Unknown pool={pool}, expected one of {POOLS}")
+        missing = [d for d in deps if d not in self.tasks]
+        if missing:
+            # Dependencies must be added first, so insertion order is topological.
+            raise ValueError(f"Task {name} depends on unknown tasks {missing}")
+        self.tasks[name] = Task(name, fn, tuple(deps), pool, stage or name)
+        return name
+
+    def _call(self, task: Task) -> Any:
+        task.start = time.perf_counter()
+        try:
+            result = task.fn(*(self.results[d] for d in task.deps))
+        finally:
+            task.end = time.perf_counter()
+        if self.checkpoint is not None:
+            self.checkpoint.put(task.name, result)
+        return result
+
+    def _plan(self, dependents: Dict[str, List[str]]) -> None:
+        """
+        Restore checkpointed results, then mark as skipped every task whose
+        dependents are all restored or skipped.
+        """
+        log = self.checkpoint
+        self.restored = [name for name in self.tasks if log is not None and name in log]
+        for name in self.restored:
+            self.results[name] = log.get(name)
+        done = set(self.restored)
+        self.skipped = []
+        for name in reversed(list(self.tasks)):
+            if name not in done and dependents[name] and all(d in done for d in dependents[name]):
+                done.add(name)
+                self.skipped.append(name)
+
+    def run(
+        self,
+        cpu_workers: int = PIPELINE_CPU_WORKERS,
+        io_workers: int = PIPELINE_IO_WORKERS,
+    ) -> Dict[str, Any]:
+        """
+        Run every task and return {name: result}. If a task raises, no new
+        tasks are started; running ones finish (and are checkpointed) and
+        the first error is re-raised.
+        """
+        self.workers = {"cpu": cpu_workers, "io": io_workers}
+        dependents: Dict[str, List[str]] = {name: [] for name in self.tasks}
+        for name, task in self.tasks.items():
+            for dep in task.deps:
+                dependents[dep].append(name)
+        self._plan(dependents)
+        done = set(self.restored) | set(self.skipped)
+        waiting = {
+            name: set(task.deps) - done
+            for name, task in self.tasks.items() if name not in done
+        }
+
+        ready = [name for name, deps in waiting.items() if not deps]
+        running: Dict[Future, str] = {}
+        error: Optional[BaseException] = None
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=cpu_workers) as cpu_pool, \
+                ThreadPoolExecutor(max_workers=io_workers) as io_pool:
+            pools = {"cpu": cpu_pool, "io": io_pool}
+            while ready or running:
+                for name in ready:
+                    task = self.tasks[name]
+                    running[pools[task.pool].submit(self._call, task)] = name
+                ready = []
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    try:
+                        self.results[name] = fut.result()
+                    except Exception as err:
+                        error = error or err
+                        continue
+                    if error is not None:
+                        continue
+                    for child in dependents[name]:
+                        if child not in waiting:
+                            continue
+                        waiting[child].discard(name)
+                        if not waiting[child]:
+                            ready.append(child)
+        self.wall_seconds = time.perf_counter() - t0
+        if error is not None:
+            raise error
+        return self.results
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        Longest chain of dependent tasks by measured time: the lower
+        bound on wall-clock time with unlimited workers.
+        """
+        finish: Dict[str, float] = {}
+        prev: Dict[str, Optional[str]] = {}
+        for name, task in self.tasks.items():  # insertion order is topological
+            before = max(task.deps, key=lambda d: finish[d], default=None)
+            finish[name] = task.seconds + (finish[before] if before else 0.0)
+            prev[name] = before
+        if not finish:
+            return [], 0.0
+        last: Optional[str] = max(finish, key=finish.get)
+        total = finish[last]
+        path = []
+        while last is not None:
+            path.append(last)
+            last = prev[last]
+        return path[::-1], total
+
+    def report(self) -> PipelineReport:
+        path, path_seconds = self.critical_path()
+        wall = self.wall_seconds or 1e-9
+        busy: Dict[Tuple[str, str], List[float]] = {}
+        for task in self.tasks.values():
+            busy.setdefault((task.stage, task.pool), []).append(task.seconds)
+        stages = [
+            StageStats(
+                stage=stage,
+                pool=pool,
+                tasks=len(times),
+                busy_seconds=sum(times),
+                utilisation=sum(times) / (wall * self.workers.get(pool, 1)),
+            )
+            for (stage, pool), times in busy.items()
+        ]
+        pool_utilisation = {
+            pool: sum(s.utilisation for s in stages if s.pool == pool) for pool in POOLS
+        }
+        return PipelineReport(
+            wall_seconds=self.wall_seconds,
+            serial_seconds=sum(task.seconds for task in self.tasks.values()),
+            critical_path=path,
+            critical_path_seconds=path_seconds,
+            stages=stages,
+            workers=dict(self.workers),
+            pool_utilisation=pool_utilisation,
+            restored=len(self.restored),
+            skipped=len(self.skipped),
+        )
+
+
+def print_pipeline_report(report: PipelineReport) -> None:
+    print(
+        f"\nPipeline: {report.wall_seconds:.1f}s wall-clock, "
+        f"{report.serial_seconds:.1f}s of task time "
+        f"(x{report.serial_seconds / max(report.wall_seconds, 1e-9):.1f} overlap), "
+        f"critical path {report.critical_path_seconds:.1f}s"
+    )
+    print(f"  critical path: {' -> '.join(report.critical_path)}")
+    if report.restored:
+        print(f"  resumed: {report.restored} tasks restored from checkpoint, {report.skipped} skipped")
+    for pool in POOLS:
+        print(
+            f"  {pool} pool x{report.workers.get(pool, 0)}: "
+            f"{report.pool_utilisation.get(pool, 0.0):.0%} busy"
+        )
+        for s in sorted(report.stages, key=lambda s: -s.busy_seconds):
+            if s.pool == pool:
+                print(
+                    f"    {s.stage:<10} {s.tasks:>4} tasks  {s.busy_seconds:7.1f}s  "
+                    f"{s.utilisation:.0%}"
+                )
+
+
+def _answer_row(
+    ec: EvalCase,
+    system: str,
+    query: str,
+    evidence: pd.DataFrame,
+    answer_fn: Callable[[EvidencePack], str],
+) -> Dict[str, Any]:
+    pack = pack_evidence(evidence)
+    return eval_row(ec, system, {
+        "query": query,
+        "evidence": evidence,
+        "evidence_pack": pack,
+        "answer": answer_fn(pack),
+    })
+
+
+def _add_system_case(
+    graph: TaskGraph,
+    client: Groq,
+    retriever: RetrieverBase,
+    system: str,
+    ec: EvalCase,
+    speculative: bool,
+) -> str:
+    """
+    Tasks producing one eval_row for `system` on `ec`; returns the name of
+    the final task.
+    """
+    task_name = partial(checkpoint_key, system, ec.case_id)
+    case = ec.case
+    if system == "baseline":
+        query = build_case_query(case)
+        retrieve = graph.add(
+            task_name("retrieve"), lambda: retriever.retrieve_with_rerank(query),
+            pool="cpu", stage="retrieve",
+        )
+        return graph.add(
+            task_name("generate"),
+            lambda evidence: _answer_row(
+                ec, system, query, evidence,
+                lambda pack: answer_baseline(client, case, query, evidence, pack),
+            ),
+            deps=[retrieve], stage="generate",
+        )
+
+    if system == "improved":
+        main_query = build_case_query(case)
+        decompose = graph.add(
+            task_name("decompose"), lambda: decompose_case_query(client, main_query),
+            stage="decompose",
+        )
+        if speculative:
+            # As decompose_and_retrieve: the main query is retrieved while
+            # decomposition runs, the new sub-queries in one batch after it.
+            main = graph.add(
+                task_name("retrieve-main"), lambda: retriever.retrieve_with_rerank(main_query),
+                pool="cpu", stage="retrieve",
+            )
+            retrieve = graph.add(
+                task_name("retrieve"),
+                lambda main_result, sub_queries: retrieve_multi_aspect_with_main(
+                    retriever, main_query, main_result, sub_queries
+                ),
+                deps=[main, decompose], pool="cpu", stage="retrieve",
+            )
+        else:
+            retrieve = graph.add(
+                task_name("retrieve"),
+                lambda sub_queries: retrieve_multi_aspect(retriever, sub_queries),
+                deps=[decompose], pool="cpu", stage="retrieve",
+            )
+        return graph.add(
+            task_name("generate"),
+            lambda sub_queries, evidence: _answer_row(
+                ec, system, main_query, evidence,
+                lambda pack: answer_improved(client, case, main_query, sub_queries, evidence, pack),
+            ),
+            deps=[decompose, retrieve], stage="generate",
+        )
+
+    if system == "gpt_only":
+        case_text = case_to_free_text(case)
+        return graph.add(
+            task_name("generate"),
+            lambda: eval_row(ec, system, {
+                "query": case_text,
+                "evidence": pd.DataFrame(),
+                "answer": answer_gpt_only(client, case_text),
+            }),
+            stage="generate",
+        )
+
+    raise ValueError(f"Unknown system_name={system}")
+
+
+# Every judge call judge_calls can make for an answer with evidence, per
+# judge mode. "efficient" adds ("correctness", 2) as a follow-up task.
+JUDGE_SLOTS = {
+    "full": (
+        [("correctness", j) for j in range(3)]
+        + [("hallucination", 0)]
+        + [("relevance", j) for j in range(3)]
+    ),
+    "efficient": [("correctness", 0), ("correctness", 1), ("hallucination", 0), ("relevance_batch", 0)],
+}
+
+
+def _judge(
+    client: Groq, row: Dict[str, Any], key: Tuple[str, int], model: str, mode: str
+) -> Optional[List[Any]]:
+    calls = judge_calls(
+        client, str(row["query"]), str(row["answer"]), str(row["gold_answer"]),
+        row["evidence_texts"], model, mode,
+    )
+    for kind, j, call in calls:
+        if (kind, j) == key:
+            return metered(call)()
+    return None  # e.g. fewer than 3 evidence passages
+
+
+def _judge_followup(
+    client: Groq, row: Dict[str, Any], first: Sequence[Any], model: str, mode: str
+) -> Optional[List[Any]]:
+    """
+    Third correctness draw, only if the first two (first) disagree.
+    """
+    results = {("correctness", j): result for j, result in enumerate(first)}
+    calls = followup_judge_calls(
+        client, str(row["query"]), str(row["answer"]), str(row["gold_answer"]),
+        results, model, mode,
+    )
+    return metered(calls[0][2])() if calls else None
+
+
+def _proxy_relevance(
+    client: Groq, row: Dict[str, Any], proxy: Dict[str, Any], model: str
+) -> List[List[Any]]:
+    """
+    Relevance results of one answer as [kind, slot, result]: LLM grades
+    from the calibration sample, proxy grades, and LLM calls for the
+    passages the proxy is unsure about.
+    """
+    relevance_proxy = RelevanceProxy.from_dict(proxy)
+    results = relevance_proxy.sample_results(row["system"], row["case_id"])
+    calls = proxy_relevance_calls(
+        client, relevance_proxy, row["system"], row["case_id"],
+        str(row["query"]), row["evidence_texts"], model,
+    )
+    for kind, j, call in calls:
+        results[(kind, j)] = metered(call)()
+    return [[kind, j, result] for (kind, j), result in results.items()]
+
+
+def _score(row: Dict[str, Any], slots: Sequence[Tuple[str, int]], results: Sequence[Any]) -> Dict[str, Any]:
+    """
+    Evaluated row from the results of the judge tasks for slots, followed
+    by the [kind, slot, result] list of a proxy relevance task, if any.
+    """
+    scores = {key: result for key, result in zip(slots, results) if result is not None}
+    for relevance in results[len(slots):]:
+        scores.update({(kind, j): result for kind, j, result in relevance})
+    return dict(row, **combine_judge_scores(scores, str(row["query"]), row["evidence_texts"]))
+
+
+def build_experiment_graph(
+    client: Groq,
+    retriever: RetrieverBase,
+    eval_cases: List[EvalCase],
+    systems: Sequence[str] = SYSTEM_NAMES,
+    speculative: bool = SPECULATIVE_RETRIEVAL,
+    judge_model: str = JUDGE_MODEL,
+    checkpoint: Optional[CheckpointLog] = None,
+    judge_mode: str = JUDGE_MODE,
+    relevance_proxy: bool = RELEVANCE_PROXY,
+) -> Tuple[TaskGraph, Dict[str, List[str]]]:
+    """
+    One graph for the whole experiment. Per system and case:
+    retrieval (cpu) -> generation (io) -> one task per judge call (io)
+    -> a task combining the scores into the evaluated row.
+    In "efficient" judge mode the third correctness draw is a task after
+    the first two, which returns None without a call if they agree.
+    With relevance_proxy, one task calibrates the proxy once every answer
+    with evidence exists, and one task per answer grades its relevance.
+    Also returns, per system, the names of its row tasks in case order.
+    """
+    check_judge_mode(judge_mode)
+    graph = TaskGraph(checkpoint)
+    answers = {
+        (system, ec.case_id): _add_system_case(graph, client, retriever, system, ec, speculative)
+        for ec in eval_cases
+        for system in systems
+    }
+    calibration = None
+    if relevance_proxy:
+        calibration = graph.add(
+            "relevance-proxy/calibrate",
+            lambda *rows: calibrate_relevance_proxy(
+                client, retriever.relevance_scores, [pd.DataFrame(rows)], judge_model
+            ).as_dict(),
+            deps=[answer for (system, _), answer in answers.items() if system != "gpt_only"],
+            stage="calibrate",
+        )
+
+    rows: Dict[str, List[str]] = {system: [] for system in systems}
+    for ec in eval_cases:
+        for system in systems:
+            answer = answers[(system, ec.case_id)]
+            task_name = partial(checkpoint_key, system, ec.case_id)
+            slots = list(JUDGE_SLOTS[judge_mode])
+            if system == "gpt_only":
+                slots = [(kind, j) for kind, j in slots if kind == "correctness"]
+            elif calibration is not None:
+                slots = [(kind, j) for kind, j in slots if not kind.startswith("relevance")]
+            judges = [
+                graph.add(
+                    task_name(f"judge-{kind}-{j}"),
+                    lambda row, key=(kind, j): _judge(client, row, key, judge_model, judge_mode),
+                    deps=[answer], stage="judge",
+                )
+                for kind, j in slots
+            ]
+            if judge_mode == "efficient":
+                judges.append(graph.add(
+                    task_name("judge-correctness-2"),
+                    lambda row, *first: _judge_followup(client, row, first, judge_model, judge_mode),
+                    deps=[answer, *judges[:2]], stage="judge",
+                ))
+                slots.append(("correctness", 2))
+            relevance = []
+            if calibration is not None and system != "gpt_only":
+                relevance.append(graph.add(
+                    task_name("judge-relevance-proxy"),
+                    lambda row, proxy: _proxy_relevance(client, row, proxy, judge_model),
+                    deps=[answer, calibration], stage="judge",
+                ))
+            rows[system].append(graph.add(
+                task_name("score"),
+                lambda row, *results, slots=slots: _score(row, slots, results),
+                deps=[answer, *judges, *relevance], stage="score",
+            ))
+    return graph, rows
+
+
+def run_experiment_pipelined(
+    client: Groq,
+    retriever: RetrieverBase,
+    eval_cases: List[EvalCase],
+    systems: Sequence[str] = SYSTEM_NAMES,
+    cpu_workers: int = PIPELINE_CPU_WORKERS,
+    io_workers: int = PIPELINE_IO_WORKERS,
+    checkpoint: Optional[CheckpointLog] = None,
+    relevance_proxy: bool = RELEVANCE_PROXY,
+    judge_mode: str = JUDGE_MODE,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Run and judge all systems concurrently; returns {system: evaluated df}
+    with the same rows and columns as build_eval_df_for_system +
+    evaluate_system, and prints the pipeline report.
+    """
+    graph, rows = build_experiment_graph(
+        client, retriever, eval_cases, systems, checkpoint=checkpoint,
+        judge_mode=judge_mode, relevance_proxy=relevance_proxy,
+    )
+    print(
+        f"Running {', '.join(systems)} on {len(eval_cases)} cases as one pipeline "
+        f"({len(graph.tasks)} tasks, {cpu_workers} cpu / {io_workers} io workers)..."
+    )
+    results = graph.run(cpu_workers=cpu_workers, io_workers=io_workers)
+    print_pipeline_report(graph.report())
+    return {
+        system: pd.DataFrame([results[name] for name in names])
+        for system, names in rows.items()
+    }
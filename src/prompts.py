@@ -1,8 +1,13 @@
-from dataclasses import dataclass
-from typing import Optional, List
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, List
+
+import re
 
 import pandas as pd
 
+from .config import PACK_EVIDENCE, EVIDENCE_TOKEN_BUDGET
+from .llm import approx_tokens
+
 
 @dataclass
 class ClinicalCase:
@@ -35,18 +40,157 @@ def build_case_query(case: ClinicalCase) -> str:
     return base
 
 
+def _location(source: Any, page: Any) -> str:
+    # Multi-source corpora (corpus.py) label each row with its document.
+    if isinstance(source, str) and source:
+        return f"{source}, page {page}"
+    return f"page {page}"
+
+
 def format_sources_for_prompt(df: pd.DataFrame, max_chars_per_source: int = 800) -> str:
     lines = []
     for i, row in df.iterrows():
         text = row["text"]
         text = text.replace("\n", " ").strip()
         text = text[:max_chars_per_source]
-        lines.append(f"[{i+1}] (page {row['page']}, tag: {row['tag']})\n{text}\n")
+        lines.append(f"[{i+1}] ({_location(row.get('source'), row['page'])}, tag: {row['tag']})\n{text}\n")
     return "\n".join(lines)
 
 
-def build_clinical_prompt(case: ClinicalCase, query_str: str, evidence_df: pd.DataFrame) -> str:
-    sources_str = format_sources_for_prompt(evidence_df)
+# Shortest suffix/prefix match treated as chunk overlap rather than chance
+MIN_OVERLAP_CHARS = 20
+# A passage is cut to fit the remaining budget only if this much of it fits
+MIN_TRUNCATED_CHARS = 200
+
+
+@dataclass
+class EvidencePack:
+    text: str  # sources block for the prompt
+    chunks: int  # evidence rows given
+    passages: int  # passages in the prompt after merging / dedup / budget
+    raw_tokens: int  # tokens format_sources_for_prompt would have used
+    tokens: int
+    texts: List[str] = field(default_factory=list)  # passage texts, in prompt order
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.raw_tokens - self.tokens
+
+
+@dataclass
+class _Passage:
+    page: Any
+    doc_ids: List[int]
+    text: str
+    score: float
+    tags: List[str] = field(default_factory=list)
+    source: Optional[str] = None
+
+
+def _join_overlapping(a: str, b: str) -> str:
+    """
+    a followed by b, without the longest suffix of a that b starts with
+    (the CHUNK_OVERLAP characters neighbouring chunks share).
+    """
+    for n in range(min(len(a), len(b)), MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:n]):
+            return a + b[n:]
+    return a + " " + b
+
+
+def _merge_chunks(df: pd.DataFrame) -> List[_Passage]:
+    """
+    One passage per run of consecutive doc_ids on the same page of the same
+    source (chunks are numbered in page order), scored by its best chunk. Rows repeated by
+    several sub-queries count once.
+    """
+    if "combined_score" in df.columns:
+        scores = df["combined_score"].astype(float).tolist()
+    else:
+        scores = [-float(i) for i in range(len(df))]  # keep the given order
+    best: Dict[int, Any] = {}
+    for score, (_, row) in zip(scores, df.iterrows()):
+        doc_id = int(row["doc_id"])
+        if doc_id not in best or score > best[doc_id][0]:
+            best[doc_id] = (score, row)
+
+    def source_of(row) -> Optional[str]:
+        source = row.get("source")
+        return source if isinstance(source, str) else None
+
+    passages: List[_Passage] = []
+    for doc_id in sorted(best, key=lambda d: (source_of(best[d][1]) or "", best[d][1]["page"], d)):
+        score, row = best[doc_id]
+        source = source_of(row)
+        last = passages[-1] if passages else None
+        if (
+            last is not None
+            and last.source == source
+            and last.page == row["page"]
+            and last.doc_ids[-1] == doc_id - 1
+        ):
+            last.text = _join_overlapping(last.text, row["text"])
+            last.doc_ids.append(doc_id)
+            last.score = max(last.score, score)
+            if row["tag"] not in last.tags:
+                last.tags.append(row["tag"])
+        else:
+            passages.append(_Passage(row["page"], [doc_id], row["text"], score, [row["tag"]], source))
+    return passages
+
+
+def _normalize_space(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def pack_evidence(
+    df: pd.DataFrame,
+    token_budget: int = EVIDENCE_TOKEN_BUDGET,
+    pack: bool = PACK_EVIDENCE,
+) -> EvidencePack:
+    """
+    Sources block for a generation prompt: overlapping / adjacent chunks of
+    the same page are merged, passages whose text already appears in a
+    better-scored one are dropped, and passages are added in score order
+    until token_budget is used (the first one that overflows is cut at a
+    word boundary if enough of it fits). pack=False: format every row as is.
+    """
+    raw = format_sources_for_prompt(df)
+    raw_tokens = approx_tokens(raw)
+    if not pack or df.empty:
+        texts = df["text"].tolist() if not df.empty else []
+        return EvidencePack(raw, len(df), len(df), raw_tokens, raw_tokens, texts)
+
+    passages = sorted(_merge_chunks(df), key=lambda p: -p.score)
+    kept: List[str] = []
+    entries: List[str] = []
+    used = 0
+    for p in passages:
+        text = _normalize_space(p.text)
+        if any(text in other for other in kept):
+            continue
+        header = f"[{len(entries) + 1}] ({_location(p.source, p.page)}, tag: {'/'.join(p.tags)})\n"
+        cost = approx_tokens(header + text + "\n\n")
+        if used + cost > token_budget:
+            room = (token_budget - used) * 4 - len(header) - 2
+            if room < MIN_TRUNCATED_CHARS:
+                continue  # a shorter passage may still fit
+            text = text[:room].rsplit(" ", 1)[0] + " ..."
+            cost = approx_tokens(header + text + "\n\n")
+        kept.append(text)
+        entries.append(f"{header}{text}\n")
+        used += cost
+    packed = "\n".join(entries)
+    return EvidencePack(packed, len(df), len(entries), raw_tokens, approx_tokens(packed), kept)
+
+
+def build_clinical_prompt(
+    case: ClinicalCase,
+    query_str: str,
+    evidence_df: pd.DataFrame,
+    pack: Optional[EvidencePack] = None,
+) -> str:
+    sources_str = (pack or pack_evidence(evidence_df)).text
     case_str = f"Problem: {case.problem_title or ''}\n\nMain query:\n{query_str}"
     return f"""You are reading a veterinary internal medicine textbook.
 
@@ -72,10 +216,10 @@ def build_clinical_prompt_improved(
     case: ClinicalCase,
     main_query: str,
     sub_queries: List[str],
-    evidence_df: pd.DataFrame
+    evidence_df: pd.DataFrame,
+    pack: Optional[EvidencePack] = None,
 ) -> str:
-    from .prompts import format_sources_for_prompt  # safe self-import for static checkers
-    sources_str = format_sources_for_prompt(evidence_df)
+    sources_str = (pack or pack_evidence(evidence_df)).text
     subq_str = "\n".join(f"- {sq}" for sq in sub_queries)
     case_str = f"Problem: {case.problem_title or ''}\n\nMain query:\n{main_query}"
     return f"""You are reading a veterinary internal medicine textbook.
@@ -0,0 +1,186 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .checkpoint import checkpoint_key
+from .config import (
+    RELEVANCE_PROXY_MIN_AGREEMENT,
+    RELEVANCE_PROXY_MIN_SAMPLE,
+    RELEVANCE_PROXY_NEIGHBOURS,
+    RELEVANCE_PROXY_SAMPLE_FRACTION,
+)
+
+
+def _isotonic(y: np.ndarray) -> np.ndarray:
+    """
+    Non-decreasing least-squares fit of y (pool adjacent violators).
+    """
+    values: List[float] = []
+    weights: List[int] = []
+    for v in y.tolist():
+        values.append(float(v))
+        weights.append(1)
+        while len(values) > 1 and values[-2] > values[-1]:
+            w = weights[-2] + weights[-1]
+            values[-2] = (values[-2] * weights[-2] + values[-1] * weights[-1]) / w
+            weights[-2] = w
+            values.pop()
+            weights.pop()
+    return np.repeat(values, weights)
+
+
+def calibration_sample_size(
+    n: int,
+    fraction: float = RELEVANCE_PROXY_SAMPLE_FRACTION,
+    min_size: int = RELEVANCE_PROXY_MIN_SAMPLE,
+) -> int:
+    """
+    Number of the n passages the LLM grades for calibration: `fraction`
+    of them, at least min_size (all of them if n is smaller).
+    """
+    return min(n, max(min_size, int(np.ceil(fraction * n))))
+
+
+def calibration_sample(scores: np.ndarray, size: int) -> np.ndarray:
+    """
+    Indices of at most size scores at evenly spaced ranks, so the sample
+    covers the whole score range.
+    """
+    order = np.argsort(scores, kind="stable")
+    if size >= len(order):
+        return order
+    picks = np.linspace(0, len(order) - 1, size).round().astype(int)
+    return order[np.unique(picks)]
+
+
+@dataclass
+class RelevanceCalibration:
+    """
+    Maps cross-encoder scores to the LLM judge's 0–5 relevance grades,
+    fitted on a sample of passages graded by both.
+
+    The grade is a monotone (isotonic) fit of the LLM grades on the
+    cross-encoder score, rounded. Its agreement is the share of the
+    `neighbours` calibration passages closest in cross-encoder score
+    whose LLM grade equals it: low agreement means the cross-encoder does
+    not separate the grades well around that score.
+    """
+
+    ce_scores: List[float]
+    llm_scores: List[int]
+    neighbours: int = RELEVANCE_PROXY_NEIGHBOURS
+
+    def __post_init__(self):
+        order = np.argsort(self.ce_scores, kind="stable")
+        self._x = np.asarray(self.ce_scores, dtype=np.float64)[order]
+        self._y = np.asarray(self.llm_scores, dtype=np.int64)[order]
+        self._fit = _isotonic(self._y)
+
+    def predict(self, scores: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (grades, agreement) for cross-encoder scores. Without calibration
+        data every grade is 2 with agreement 0.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        if not len(self._x):
+            return np.full(len(scores), 2), np.zeros(len(scores))
+        grades = np.clip(np.rint(np.interp(scores, self._x, self._fit)), 0, 5).astype(np.int64)
+        k = min(self.neighbours, len(self._x))
+        dist = np.abs(scores[:, None] - self._x[None, :])
+        nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        agreement = (self._y[nearest] == grades[:, None]).mean(axis=1)
+        return grades, agreement
+
+    def agreement_stats(self, min_agreement: float = RELEVANCE_PROXY_MIN_AGREEMENT) -> Dict[str, Any]:
+        """
+        Leave-one-out agreement with the LLM on the calibration sample:
+        each passage is graded by a calibration fitted without it.
+        Spearman is None if the scores or grades are constant.
+        "accepted" is the share the proxy would grade itself
+        (agreement >= min_agreement), "accepted_exact" its exact agreement.
+        """
+        n = len(self._x)
+        if n < 2:
+            return {"sample": n}
+        grades = np.empty(n, dtype=np.int64)
+        agreement = np.empty(n)
+        for i in range(n):
+            keep = np.arange(n) != i
+            rest = RelevanceCalibration(self._x[keep].tolist(), self._y[keep].tolist(), self.neighbours)
+            g, a = rest.predict(self._x[i:i + 1])
+            grades[i], agreement[i] = g[0], a[0]
+        diff = np.abs(grades - self._y)
+        accepted = agreement >= min_agreement
+        spearman = None
+        if np.ptp(self._x) > 0 and np.ptp(self._y) > 0:
+            spearman = float(pd.Series(self._x).rank().corr(pd.Series(self._y).rank()))
+        return {
+            "sample": n,
+            "spearman": spearman,
+            "exact": float(np.mean(diff == 0)),
+            "within_1": float(np.mean(diff <= 1)),
+            "mae": float(diff.mean()),
+            "accepted": float(accepted.mean()),
+            "accepted_exact": float(np.mean(diff[accepted] == 0)) if accepted.any() else None,
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"ce_scores": self.ce_scores, "llm_scores": self.llm_scores, "neighbours": self.neighbours}
+
+
+@dataclass
+class RelevanceProxy:
+    """
+    A calibration plus, per evidence slot (checkpoint key of its
+    "judge-relevance-{j}" call): the cross-encoder score, and for the
+    calibration sample the metered LLM result.
+    """
+
+    calibration: RelevanceCalibration
+    scores: Dict[str, float] = field(default_factory=dict)
+    sample: Dict[str, Any] = field(default_factory=dict)
+    min_agreement: float = RELEVANCE_PROXY_MIN_AGREEMENT
+
+    @staticmethod
+    def slot_key(system: str, case_id: str, j: int) -> str:
+        return checkpoint_key(system, case_id, f"judge-relevance-{j}")
+
+    def sample_results(self, system: str, case_id: str) -> Dict[Tuple[str, int], Any]:
+        """
+        LLM results of the row's slots that were in the calibration sample.
+        """
+        results = {}
+        for j in range(3):
+            key = self.slot_key(system, case_id, j)
+            if key in self.sample:
+                results[("relevance", j)] = self.sample[key]
+        return results
+
+    def grade(self, system: str, case_id: str, j: int) -> Optional[int]:
+        """
+        Proxy grade of a slot, or None if it should go to the LLM judge.
+        """
+        key = self.slot_key(system, case_id, j)
+        if key not in self.scores:
+            return None
+        grades, agreement = self.calibration.predict([self.scores[key]])
+        return int(grades[0]) if agreement[0] >= self.min_agreement else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calibration": self.calibration.as_dict(),
+            "scores": self.scores,
+            "sample": self.sample,
+            "min_agreement": self.min_agreement,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "RelevanceProxy":
+        return cls(
+            RelevanceCalibration(**d["calibration"]),
+            d["scores"],
+            d["sample"],
+            d["min_agreement"],
+        )
@@ -1,12 +1,12 @@
 import os
-from pathlib import Path
+from typing import List
 
 from dotenv import load_dotenv
 from groq import Groq
 
-from .chunks import load_pdf_text, build_chunks
-from .embeddings import build_bge_embeddings, build_faiss_index
 from .retriever import VetRetriever
+from .corpus import BASE_DIR, load_source_retriever, build_corpus
+from .models import preload_models, print_model_report
 
 from .agent import run_full_experiment
 from .plotting import (
@@ -17,34 +17,52 @@ from .plotting import (
 )
 
 
-from .config import TA_MODE
+from .config import (
+    TA_MODE,
+    USE_INDEX_CACHE,
+    PRELOAD_MODELS,
+    PERSIST_RETRIEVER_CACHES,
+    CORPUS_PDFS,
+)
 
 if TA_MODE:
     print("Quick Running in TA quick-test mode (CPU-friendly)")
 else:
     print("Quick Running in full experiment mode")
 
-def init_vetrag_pipeline(pdf_path: str | None = None):
-    base_dir = Path(__file__).resolve().parent.parent
-    if pdf_path is None:
-        pdf_path = str(base_dir / "data" / "databook.pdf")
-
-    print("Loading PDF...")
-    pages = load_pdf_text(pdf_path)
-    print(f"  Loaded {len(pages)} pages.")
-
-    print("Building chunks...")
-    docs = build_chunks(pages)
-    print(f"  Built {len(docs)} chunks.")
+def _preload_models():
+    if PRELOAD_MODELS:
+        print("Loading embedder and reranker...")
+        preload_models(parallel=True)
+        print_model_report()
 
-    print("Building BGE embeddings...")
-    embs = build_bge_embeddings(docs)
 
-    print("Building FAISS index...")
-    faiss_index = build_faiss_index(embs)
-
-    print("Initializing retriever...")
-    retriever = VetRetriever(docs, embs, faiss_index)
+def build_retriever(
+    pdf_path: str | None = None,
+    use_index_cache: bool = USE_INDEX_CACHE,
+    writable_index: bool = False,
+) -> VetRetriever:
+    if pdf_path is None:
+        pdf_path = str(BASE_DIR / "data" / "databook.pdf")
+    _preload_models()
+    return load_source_retriever(pdf_path, use_index_cache, writable_index)
+
+
+def init_vetrag_pipeline(
+    pdf_path: str | None = None,
+    use_index_cache: bool = USE_INDEX_CACHE,
+    writable_index: bool = False,
+    pdf_paths: List[str] | None = CORPUS_PDFS,
+):
+    """
+    pdf_paths (default: CORPUS_PDFS) serves several PDFs as one sharded
+    corpus (see corpus.py) instead of the single pdf_path.
+    """
+    if pdf_paths:
+        _preload_models()
+        retriever = build_corpus(pdf_paths, use_index_cache, writable_index)
+    else:
+        retriever = build_retriever(pdf_path, use_index_cache, writable_index)
 
     print("Initializing Groq client...")
     api_key = os.getenv("GROQ_API_KEY")
@@ -71,6 +89,8 @@ def main():
         df_improved_eval,
         df_gpt_eval,
     ) = run_full_experiment(client, retriever)
+    if PERSIST_RETRIEVER_CACHES:
+        retriever.save_caches()
 
     # Bar charts
     plot_correctness_bar(systems, correctness_vals)
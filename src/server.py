@@ -0,0 +1,400 @@
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import argparse
+import asyncio
+import json
+
+import pandas as pd
+from dotenv import load_dotenv
+from groq import Groq
+
+from .agent import generate_answer_with_groq
+from .config import (
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_MAX_BATCH_SIZE,
+    SERVER_MAX_WAIT_MS,
+    SERVER_IO_WORKERS,
+    SERVER_MAX_BODY_BYTES,
+    SPECULATIVE_RETRIEVAL,
+)
+from .decomposer import decompose_case_query
+from .fusion import merge_sub_query_results, merge_with_main_query, new_sub_queries
+from .prompts import (
+    ClinicalCase,
+    SYSTEM_PROMPT,
+    build_case_query,
+    build_clinical_prompt,
+    build_clinical_prompt_improved,
+    pack_evidence,
+)
+from .retriever import RetrieverBase, SearchFilter
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent submit() calls into one fn(items) call.
+    A batch closes at max_batch_size items or max_wait_ms after its first
+    item; fn runs in `executor`, one batch at a time, so requests that
+    arrive while a batch is running form the next one.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = SERVER_MAX_BATCH_SIZE,
+        max_wait_ms: float = SERVER_MAX_WAIT_MS,
+        executor: Optional[Executor] = None,
+    ):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _next_batch(self) -> List[Tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            # Clients that disconnected while queued
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.fn, [item for item, _ in batch]
+                )
+            except Exception as err:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(err)
+                continue
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    return json.loads(df.to_json(orient="records")) if not df.empty else []
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class VetRAGServer:
+    """
+    Minimal asyncio HTTP/1.1 service around one loaded retriever.
+
+    POST /retrieve          {"query": str, "filter"?}  -> JSON evidence
+    POST /answer/baseline   {"case": {ClinicalCase}}   -> NDJSON stream
+    POST /answer/improved   {"case": {ClinicalCase}}   -> NDJSON stream
+    GET  /health                                       -> batching stats
+
+    Queries from concurrent requests (including every sub-query of the
+    improved system) are micro-batched into retrieve_many calls; Groq
+    calls run in a separate I/O thread pool. The optional "filter"
+    (SearchFilter.from_dict) restricts retrieval to matching chunks.
+    """
+
+    def __init__(
+        self,
+        client: Groq,
+        retriever: RetrieverBase,
+        max_batch_size: int = SERVER_MAX_BATCH_SIZE,
+        max_wait_ms: float = SERVER_MAX_WAIT_MS,
+        io_workers: int = SERVER_IO_WORKERS,
+    ):
+        self.client = client
+        self.retriever = retriever
+        # Retrieval is CPU-bound and not re-entrant: one batch at a time.
+        self.cpu_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval")
+        self.io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="groq")
+        self.batcher = MicroBatcher(self._retrieve_batch, max_batch_size, max_wait_ms, self.cpu_pool)
+        self.routes: Dict[Tuple[str, str], Callable[..., Awaitable[None]]] = {
+            ("GET", "/health"): self._health,
+            ("POST", "/retrieve"): self._retrieve,
+            ("POST", "/answer/baseline"): self._answer_baseline,
+            ("POST", "/answer/improved"): self._answer_improved,
+        }
+
+    async def serve_forever(self, host: str = SERVER_HOST, port: int = SERVER_PORT) -> None:
+        self.batcher.start()
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"VetRAG server listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+            self.cpu_pool.shutdown(wait=False)
+            self.io_pool.shutdown(wait=False)
+
+    # ----- HTTP plumbing -----
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            method, path, body = await self._read_request(reader)
+            handler = self.routes.get((method, path))
+            if handler is None:
+                raise HTTPError(404, f"no route for {method} {path}")
+            await handler(body, writer)
+        except HTTPError as err:
+            await self._send_json(writer, err.status, {"error": str(err)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as err:
+            await self._send_json(writer, 500, {"error": repr(err)})
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, Any]]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) < 2:
+            raise HTTPError(400, "malformed request line")
+        method, path = request_line[0].upper(), request_line[1].split("?", 1)[0]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "invalid Content-Length")
+        if length > SERVER_MAX_BODY_BYTES:
+            raise HTTPError(413, f"request body exceeds {SERVER_MAX_BODY_BYTES} bytes")
+        raw = await reader.readexactly(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else {}
+        except json.JSONDecodeError as err:
+            raise HTTPError(400, f"invalid JSON body: {err}")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "JSON body must be an object")
+        return method, path, body
+
+    @staticmethod
+    async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    @staticmethod
+    async def _start_stream(writer: asyncio.StreamWriter) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        await writer.drain()
+
+    @staticmethod
+    async def _send_event(writer: asyncio.StreamWriter, event: str, **payload: Any) -> None:
+        line = json.dumps(dict(event=event, **payload), ensure_ascii=False).encode("utf-8") + b"\n"
+        writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def _end_stream(writer: asyncio.StreamWriter) -> None:
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    # ----- endpoints -----
+
+    async def _io(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.io_pool, fn, *args)
+
+    def _retrieve_batch(self, items: List[Tuple[str, Optional[SearchFilter]]]) -> List[pd.DataFrame]:
+        """
+        One retrieve_many call per distinct filter in the batch.
+        """
+        groups: Dict[Optional[SearchFilter], List[int]] = {}
+        for pos, (_, filters) in enumerate(items):
+            groups.setdefault(filters, []).append(pos)
+        results: List[Any] = [None] * len(items)
+        for filters, positions in groups.items():
+            queries = [items[pos][0] for pos in positions]
+            for pos, evidence in zip(positions, self.retriever.retrieve_many(queries, filters=filters)):
+                results[pos] = evidence
+        return results
+
+    def _search(self, query: str, filters: Optional[SearchFilter] = None) -> Awaitable[pd.DataFrame]:
+        return self.batcher.submit((query, filters))
+
+    @staticmethod
+    def _parse_case(body: Dict[str, Any]) -> ClinicalCase:
+        try:
+            return ClinicalCase(**body["case"])
+        except (KeyError, TypeError) as err:
+            raise HTTPError(400, f"expected {{\"case\": {{ClinicalCase fields}}}}: {err}")
+
+    async def _health(self, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        await self._send_json(writer, 200, {
+            "status": "ok",
+            "batching": self.batcher.stats(),
+            "caches": self.retriever.cache_stats(),
+        })
+
+    async def _retrieve(self, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, "expected {\"query\": str}")
+        filters = None
+        if body.get("filter") is not None:
+            try:
+                filters = SearchFilter.from_dict(body["filter"])
+            except (AttributeError, TypeError, ValueError, IndexError) as err:
+                raise HTTPError(400, f"invalid filter: {err}")
+        evidence = await self._search(query, filters)
+        await self._send_json(writer, 200, {"query": query, "evidence": _records(evidence)})
+
+    async def _answer_baseline(self, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        case = self._parse_case(body)
+        query_str = build_case_query(case)
+        await self._start_stream(writer)
+        try:
+            await self._send_event(writer, "query", query=query_str)
+            evidence = await self._search(query_str)
+            await self._send_event(writer, "evidence", evidence=_records(evidence))
+            user_prompt = build_clinical_prompt(case, query_str, evidence, pack_evidence(evidence))
+            answer = await self._io(generate_answer_with_groq, self.client, SYSTEM_PROMPT, user_prompt)
+            await self._send_event(writer, "answer", answer=answer)
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as err:
+            await self._send_event(writer, "error", message=repr(err))
+        await self._end_stream(writer)
+
+    async def _answer_improved(self, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        case = self._parse_case(body)
+        main_query = build_case_query(case)
+        await self._start_stream(writer)
+        tasks: List[asyncio.Future] = []
+        try:
+            await self._send_event(writer, "query", query=main_query)
+            if SPECULATIVE_RETRIEVAL:
+                # Main-query retrieval overlaps the decomposition call; the
+                # evidence is the same as without speculation.
+                tasks.append(asyncio.ensure_future(self._search(main_query)))
+            sub_queries = await self._io(decompose_case_query, self.client, main_query)
+            await self._send_event(writer, "sub_queries", sub_queries=sub_queries)
+            if SPECULATIVE_RETRIEVAL:
+                tasks += [asyncio.ensure_future(self._search(q)) for q in new_sub_queries(main_query, sub_queries)]
+                main_result, *new_results = await asyncio.gather(*tasks)
+                evidence = merge_with_main_query(main_query, main_result, sub_queries, new_results)
+            else:
+                per_query = await asyncio.gather(*(self._search(q) for q in sub_queries))
+                evidence = merge_sub_query_results(sub_queries, per_query)
+            await self._send_event(writer, "evidence", evidence=_records(evidence))
+            user_prompt = build_clinical_prompt_improved(
+                case, main_query, sub_queries, evidence, pack_evidence(evidence)
+            )
+            answer = await self._io(generate_answer_with_groq, self.client, SYSTEM_PROMPT, user_prompt)
+            await self._send_event(writer, "answer", answer=answer)
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as err:
+            await self._send_event(writer, "error", message=repr(err))
+        finally:
+            # Searches still queued when decomposition or the client failed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await self._end_stream(writer)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve VetRAG over HTTP")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=SERVER_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=SERVER_MAX_WAIT_MS)
+    parser.add_argument("--io-workers", type=int, default=SERVER_IO_WORKERS)
+    args = parser.parse_args(argv)
+
+    from .run import init_vetrag_pipeline
+
+    load_dotenv()
+    client, retriever = init_vetrag_pipeline()
+    server = VetRAGServer(
+        client, retriever,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        io_workers=args.io_workers,
+    )
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+import json
+
+import numpy as np
+
+from .config import TAG_VOCABULARY_PATH, TAG_BATCH_SIZE
+
+# label -> terms, matched as case-insensitive substrings. The first two
+# labels are the coarse tags simple_tag_from_text has always produced.
+DEFAULT_TAG_VOCABULARY: Dict[str, List[str]] = {
+    "respiratory": ["respiratory", "nasal"],
+    "gastrointestinal": ["gastro", "vomit", "diarrhea"],
+    "cardiovascular": ["cardi", "heart", "murmur", "arrhythm"],
+    "urinary": ["renal", "kidney", "urin", "azotem", "nephr", "bladder"],
+    "endocrine": ["thyroid", "diabet", "insulin", "adrenal", "cushing", "addison"],
+    "neurologic": ["neurolog", "seizure", "epilep", "ataxia", "paresis"],
+    "dermatologic": ["dermat", "prurit", "alopecia", "pyoderma"],
+    "musculoskeletal": ["lameness", "fracture", "arthr", "cruciate", "muscul"],
+    "ophthalmic": ["ocular", "ophthalm", "cornea", "conjunctiv", "uveitis", "retina"],
+    "hepatic": ["hepat", "liver", "bilirubin", "icter"],
+    "hematologic": ["anemi", "anaemi", "thrombocyt", "platelet", "coagul"],
+    "oncologic": ["neoplas", "tumor", "tumour", "lymphoma", "carcinoma", "sarcoma"],
+    "infectious": ["infect", "virus", "viral", "bacteri", "parasit", "fung"],
+}
+# Labels that can become the single "tag" of a chunk, in priority order.
+PRIMARY_TAGS = ("respiratory", "gastrointestinal")
+FALLBACK_TAG = "general"
+
+# Character classes are looked up in a table over all code points.
+_UNICODE = 0x110000
+
+
+class Tagger:
+    """
+    Multi-label keyword tagger for a {label: [terms]} vocabulary.
+
+    All terms are compiled once into an Aho–Corasick automaton with the
+    failure links folded into a dense (state x character class) transition
+    table, so a text is tagged in one pass of one table lookup per
+    character, whatever the number of labels and terms. tag_batch() steps
+    a whole batch of texts through the table together with numpy.
+
+    Tags are bitsets: uint64 words, bit j of a row set if label j matched.
+    """
+
+    def __init__(
+        self,
+        vocabulary: Dict[str, Sequence[str]],
+        primary_tags: Sequence[str] = PRIMARY_TAGS,
+    ):
+        self.labels = list(vocabulary)
+        self.label_ids = {label: j for j, label in enumerate(self.labels)}
+        self.primary_tags = [label for label in primary_tags if label in self.label_ids]
+        self.n_words = max(1, (len(self.labels) + 63) // 64)
+
+        terms = [(term.lower(), j) for j, label in enumerate(self.labels) for term in vocabulary[label] if term]
+        alphabet = sorted({ch for term, _ in terms for ch in term})
+        # Class 0: every character that appears in no term (and padding).
+        self._classes = {ch: c for c, ch in enumerate(alphabet, start=1)}
+        self._class_table = np.zeros(_UNICODE, dtype=np.uint8 if len(alphabet) < 255 else np.int32)
+        for ch, c in self._classes.items():
+            self._class_table[ord(ch)] = c
+
+        # Trie
+        goto: List[Dict[int, int]] = [{}]
+        out: List[int] = [0]
+        for term, j in terms:
+            state = 0
+            for ch in term:
+                c = self._classes[ch]
+                if c not in goto[state]:
+                    goto[state][c] = len(goto)
+                    goto.append({})
+                    out.append(0)
+                state = goto[state][c]
+            out[state] |= 1 << j
+
+        # Failure links in BFS order, folded into a complete transition table.
+        n_classes = len(alphabet) + 1
+        delta = np.zeros((len(goto), n_classes), dtype=np.int32)
+        fail = [0] * len(goto)
+        for c, nxt in goto[0].items():
+            delta[0, c] = nxt
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            out[state] |= out[fail[state]]
+            delta[state] = delta[fail[state]]
+            for c, nxt in goto[state].items():
+                delta[state, c] = nxt
+                fail[nxt] = delta[fail[state], c]
+                queue.append(nxt)
+        self.num_states = len(goto)
+        self._n_classes = n_classes
+        self._delta_rows = delta.tolist()
+        # Flat table over state * n_classes + class, holding next state * n_classes,
+        # so one batched step is a single gather.
+        self._delta_flat = (delta * n_classes).ravel()
+        self._out_int = out
+        self._out = np.stack([self._to_words(bits) for bits in out])
+        self._has_out_flat = np.zeros(len(self._delta_flat), dtype=bool)
+        self._has_out_flat[np.arange(len(goto)) * n_classes] = [bits != 0 for bits in out]
+
+    # ----- matching -----
+
+    def tag_text(self, text: str) -> np.ndarray:
+        """
+        Bitset of one text, stepping the automaton in pure Python (cheaper
+        than tag_batch for a single short text).
+        """
+        classes, rows, out = self._classes, self._delta_rows, self._out_int
+        state = 0
+        bits = 0
+        for ch in text.lower():
+            state = rows[state][classes.get(ch, 0)]
+            bits |= out[state]
+        return self._to_words(bits)
+
+    def _to_words(self, bits: int) -> np.ndarray:
+        return np.array(
+            [(bits >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for w in range(self.n_words)], dtype=np.uint64
+        )
+
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        (max length, len(texts)) character classes, padded with class 0.
+        Position-major, so each automaton step reads one contiguous row.
+        """
+        lowered = [t.lower() for t in texts]
+        width = max((len(t) for t in lowered), default=0)
+        padded = "".join(t.ljust(width, "\0") for t in lowered).encode("utf-32-le")
+        codes = np.frombuffer(padded, dtype=np.uint32).reshape(len(texts), width)
+        return np.ascontiguousarray(self._class_table[codes.T])
+
+    def tag_batch(self, texts: Sequence[str], batch_size: int = TAG_BATCH_SIZE) -> np.ndarray:
+        """
+        Bitsets of all texts, shape (len(texts), n_words). Texts are grouped
+        by length into batches of batch_size that advance through the
+        automaton together, one character position per numpy step; states
+        with output are collected and OR-ed into the bitsets once at the end.
+        """
+        bits = np.zeros((len(texts), self.n_words), dtype=np.uint64)
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            states = np.zeros(len(rows), dtype=np.int64)
+            hit_rows, hit_states = [], []
+            for step in self._encode([texts[i] for i in rows]):
+                states = self._delta_flat[states + step]
+                hit = np.flatnonzero(self._has_out_flat[states])
+                if len(hit):
+                    hit_rows.append(hit)
+                    hit_states.append(states[hit])
+            if hit_rows:
+                # Each (text, state) pair once, then one scatter-OR.
+                pairs = np.unique(
+                    np.concatenate(hit_rows) * self.num_states
+                    + np.concatenate(hit_states) // self._n_classes
+                )
+                acc = np.zeros((len(rows), self.n_words), dtype=np.uint64)
+                np.bitwise_or.at(acc, pairs // self.num_states, self._out[pairs % self.num_states])
+                bits[rows] = acc
+        return bits
+
+    # ----- bitsets -----
+
+    def has_label(self, bits: np.ndarray, label: str) -> np.ndarray:
+        """
+        Bool per row of a (n, n_words) bitset array (or a single bitset).
+        """
+        j = self.label_ids[label]
+        word = np.asarray(bits)[..., j // 64]
+        return (word >> np.uint64(j % 64)) & np.uint64(1) == 1
+
+    @staticmethod
+    def _as_int(bits: np.ndarray) -> int:
+        return sum(int(word) << (64 * w) for w, word in enumerate(np.asarray(bits).tolist()))
+
+    def labels_of(self, bits: np.ndarray) -> List[str]:
+        value = self._as_int(bits)
+        return [label for j, label in enumerate(self.labels) if value >> j & 1]
+
+    def primary_tag(self, bits: np.ndarray) -> str:
+        value = self._as_int(bits)
+        for label in self.primary_tags:
+            if value >> self.label_ids[label] & 1:
+                return label
+        return FALLBACK_TAG
+
+
+def load_tag_vocabulary(path: Optional[str] = TAG_VOCABULARY_PATH) -> Dict[str, List[str]]:
+    """
+    {label: [terms]} from a JSON file (labels in file order), or the
+    built-in DEFAULT_TAG_VOCABULARY when path is None.
+    """
+    if path is None:
+        return DEFAULT_TAG_VOCABULARY
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+_tagger: Optional[Tagger] = None
+
+
+def get_tagger() -> Tagger:
+    """
+    Shared tagger for the configured vocabulary, compiled on first use.
+    """
+    global _tagger
+    if _tagger is None:
+        _tagger = Tagger(load_tag_vocabulary())
+    return _tagger
+
+
+def tag_chunks(chunks: List[Dict[str, Any]], tagger: Optional[Tagger] = None) -> List[Dict[str, Any]]:
+    """
+    Set "tag" (single coarse label, as simple_tag_from_text) and "tags"
+    (every matched label) on chunk dicts in place, in one batched pass.
+    """
+    tagger = tagger or get_tagger()
+    bits = tagger.tag_batch([c["text"] for c in chunks])
+    for chunk, row in zip(chunks, bits):
+        chunk["tag"] = tagger.primary_tag(row)
+        chunk["tags"] = tagger.labels_of(row)
+    return chunks
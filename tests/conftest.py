@@ -0,0 +1,143 @@
+import hashlib
+import re
+import threading
+import types
+
+import numpy as np
+import pytest
+
+from src.embeddings import build_faiss_index
+from src.retriever import VetRetriever
+
+WORDS = (
+    "cat dog feline canine vomiting diarrhea nasal discharge sneezing cough wheeze "
+    "asthma kidney renal thyroid seizure epilepsy lameness dermatitis pruritus fever "
+    "lethargy anorexia polyuria radiograph cytology antibiotic diagnosis treatment"
+).split()
+
+
+class FakeEmbedder:
+    """
+    Deterministic bag-of-words embedder with the encode() signature used
+    by VetRetriever.
+    """
+
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, normalize_embeddings=True, **kwargs):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                out[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1, norms)
+
+
+class FakeReranker:
+    """
+    Word-overlap cross-encoder; counts the pairs it scores.
+    """
+
+    def __init__(self):
+        self.pairs = 0
+
+    def predict(self, pairs, **kwargs):
+        self.pairs += len(pairs)
+        return np.array(
+            [len(set(q.lower().split()) & set(t.lower().split())) / 3.0 for q, t in pairs],
+            dtype="float32",
+        )
+
+
+class FakeClient:
+    """
+    Groq client stand-in: replies are derived from the prompt, so equal
+    prompts get equal replies. stream=True yields the reply line by line.
+    """
+
+    def __init__(self, reply=None):
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._reply = reply
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def reply(self, system: str, user: str) -> str:
+        if self._reply is not None:
+            return self._reply(system, user)
+        h = sum(map(ord, user))
+        if "Return ONLY: A" in system:
+            return "ABCDF"[h % 5]
+        if "JSON" in system:
+            return '{"scores": [3, 4, 2]}'
+        if "score" in system:
+            return f"score: {h % 6}"
+        return "1. feline asthma cough\n2. nasal discharge sneezing\n3. kidney renal diagnosis"
+
+    def create(self, model, messages, temperature, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        content = self.reply(messages[0]["content"], messages[-1]["content"])
+        if stream:
+            lines = content.split("\n")
+            return iter([
+                types.SimpleNamespace(choices=[types.SimpleNamespace(
+                    delta=types.SimpleNamespace(content=line + ("\n" if i < len(lines) - 1 else ""))
+                )])
+                for i, line in enumerate(lines)
+            ])
+        usage = types.SimpleNamespace(prompt_tokens=len(content), completion_tokens=5, total_tokens=len(content) + 5)
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+
+def make_docs(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"doc_id": i, "page": i // 3 + 1, "text": " ".join(rng.choice(WORDS, rng.integers(10, 40))), "tag": "general"}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def embedder():
+    return FakeEmbedder()
+
+
+@pytest.fixture
+def reranker():
+    return FakeReranker()
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def make_retriever(embedder, reranker):
+    """
+    Factory: VetRetriever over n synthetic docs with the fake models.
+    """
+
+    def make(n: int = 60, seed: int = 0, index_type: str = "flat", **kwargs):
+        docs = make_docs(n, seed)
+        embs = embedder.encode([d["text"] for d in docs])
+        return VetRetriever(
+            docs, embs, build_faiss_index(embs, index_type=index_type),
+            query_embedder=embedder, reranker=reranker, **kwargs,
+        )
+
+    return make
+
+
+@pytest.fixture(autouse=True)
+def _offline_llm(monkeypatch):
+    # Tests never read or write the on-disk LLM response cache, and the
+    # fake client is not rate limited.
+    import src.llm as llm
+    monkeypatch.setattr(llm, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(llm, "_default_limiter", llm.RateLimiter(10**6, 10**12))
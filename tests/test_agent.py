@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from src.agent import EvalCase, decompose_and_retrieve, rag_answer_case_improved
+from src.checkpoint import checkpoint_key
+from src.decomposer import decompose_case_query
+from src.fusion import retrieve_multi_aspect
+from src.pipeline import build_experiment_graph
+from src.prompts import ClinicalCase, build_case_query
+
+from conftest import FakeClient
+
+CASE = ClinicalCase(species="cat", age_years=6, chronicity="chronic", key_signs=["cough", "wheeze"])
+
+
+def _decomposition(kind):
+    def reply(system, user):
+        if "Original query:" not in user:
+            return FakeClient().reply(system, user)
+        main_query = user.split("Original query:\n", 1)[1].split("\n\n", 1)[0]
+        return {
+            "new": "1. feline asthma cough\n2. nasal discharge sneezing\n3. FELINE  asthma cough",
+            "repeats_main": f"1. {main_query.upper()}\n2. kidney renal diagnosis",
+            "empty": "",
+        }[kind]
+    return reply
+
+
+@pytest.mark.parametrize("kind", ["new", "repeats_main", "empty"])
+def test_speculative_retrieval_matches_sequential(make_retriever, kind):
+    client = FakeClient(_decomposition(kind))
+    main_query = build_case_query(CASE)
+
+    sequential = make_retriever()
+    sub_queries = decompose_case_query(client, main_query)
+    expected = retrieve_multi_aspect(sequential, sub_queries)
+
+    speculative = make_retriever()
+    got_sub_queries, got = decompose_and_retrieve(client, speculative, main_query)
+    assert got_sub_queries == sub_queries
+    pd.testing.assert_frame_equal(got, expected)
+
+
+def test_speculative_retrieval_batches_new_sub_queries(make_retriever, monkeypatch):
+    retriever = make_retriever()
+    calls = []
+    retrieve_many = retriever.retrieve_many
+    monkeypatch.setattr(retriever, "retrieve_many", lambda queries, **kw: calls.append(list(queries))
+                        or retrieve_many(queries, **kw))
+    decompose_and_retrieve(FakeClient(_decomposition("new")), retriever, build_case_query(CASE))
+    # Main query early, then both new sub-queries in one call
+    assert [len(c) for c in calls] == [1, 2]
+
+
+def test_improved_answer_same_with_and_without_speculation(make_retriever):
+    client = FakeClient()
+    off = rag_answer_case_improved(client, make_retriever(), CASE, speculative=False)
+    on = rag_answer_case_improved(client, make_retriever(), CASE, speculative=True)
+    assert on["sub_queries"] == off["sub_queries"]
+    pd.testing.assert_frame_equal(on["evidence"], off["evidence"])
+    assert on["answer"] == off["answer"]
+
+
+@pytest.mark.parametrize("kind", ["new", "repeats_main"])
+def test_pipeline_speculative_retrieval_matches_sequential(make_retriever, kind):
+    cases = [EvalCase("c1", CASE, "gold"), EvalCase("c2", ClinicalCase(species="dog", key_signs=["vomiting"]), "gold")]
+    rows = {}
+    for speculative in (False, True):
+        graph, _ = build_experiment_graph(
+            FakeClient(_decomposition(kind)), make_retriever(), cases, systems=["improved"],
+            speculative=speculative, relevance_proxy=False,
+        )
+        results = graph.run(cpu_workers=2, io_workers=4)
+        rows[speculative] = [results[checkpoint_key("improved", ec.case_id, "generate")] for ec in cases]
+    assert rows[True] == rows[False]
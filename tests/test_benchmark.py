@@ -0,0 +1,55 @@
+import json
+
+import numpy as np
+
+from src.benchmark import (
+    RETRIEVAL_STAGES,
+    HashingEmbedder,
+    benchmark_retrieval,
+    compare_results,
+    main,
+    synthetic_corpus,
+    synthetic_embeddings,
+    synthetic_queries,
+)
+
+
+def test_synthetic_data_is_deterministic():
+    docs = synthetic_corpus(30, words_per_chunk=20, n_rare_terms=100, seed=3)
+    assert docs == synthetic_corpus(30, words_per_chunk=20, n_rare_terms=100, seed=3)
+    assert [d["doc_id"] for d in docs] == list(range(30))
+    assert docs[5]["page"] == 2 and "tag" in docs[5]
+    embs = synthetic_embeddings(50, dim=16, seed=1)
+    assert embs.shape == (50, 16) and embs.dtype == np.float32
+    assert np.allclose(np.linalg.norm(embs, axis=1), 1.0)
+    assert synthetic_queries(4, seed=2) == synthetic_queries(4, seed=2)
+
+
+def test_hashing_embedder_normalises():
+    embs = HashingEmbedder(dim=32).encode(["cat cough", "", "cat cough"])
+    assert np.allclose(embs[0], embs[2])
+    assert np.isclose(np.linalg.norm(embs[0]), 1.0)
+    assert not embs[1].any()
+
+
+def test_benchmark_retrieval_rows():
+    df = benchmark_retrieval([200], num_queries=6, dim=32, index_type="flat", warmup=1)
+    assert df["stage"].tolist() == RETRIEVAL_STAGES
+    per_stage = dict(zip(df["stage"], df["calls"]))
+    assert per_stage["rerank"] == 6
+    assert per_stage["retrieve_multi_aspect"] == 2
+    assert (df["p50_ms"] <= df["p99_ms"]).all()
+
+
+def test_compare_flags_regressions(tmp_path):
+    baseline = [{"num_chunks": 1000, "stage": s, "p50_ms": 1.0} for s in ("rerank", "bm25_scoring")]
+    current = [{"num_chunks": 1000, "stage": "rerank", "p50_ms": 1.5},
+               {"num_chunks": 1000, "stage": "bm25_scoring", "p50_ms": 1.05}]
+    df = compare_results(baseline, current)
+    assert dict(zip(df["stage"], df["regression"])) == {"rerank": True, "bm25_scoring": False}
+
+    for name, rows in (("old.json", baseline), ("new.json", current)):
+        (tmp_path / name).write_text(json.dumps(rows))
+    out = tmp_path / "cmp.json"
+    main(["--out", str(out), "compare", str(tmp_path / "old.json"), str(tmp_path / "new.json")])
+    assert [r["regression"] for r in json.loads(out.read_text())] == [True, False]
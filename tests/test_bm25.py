@@ -0,0 +1,123 @@
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from src.bm25 import BM25Index, collection_stats
+
+DOCS = [
+    "dog kidney failure".split(),
+    "cat kidney disease renal".split(),
+    "dog vomiting".split(),
+    "cat sneezing nasal discharge".split(),
+    "horse colic".split(),
+]
+
+
+def test_matches_bm25okapi_after_updates():
+    index = BM25Index(DOCS[:2])
+    index.add_documents(DOCS[2:])
+    index.remove_documents([1], [DOCS[1]])
+    live = [0, 2, 3, 4]
+    expected = BM25Okapi([DOCS[i] for i in live]).get_scores(["dog", "kidney"])
+    assert np.array_equal(index.get_scores(["dog", "kidney"])[live], expected)
+    docs, scores = index.top_k(["dog", "kidney"], 2)
+    assert docs.tolist() == [0, 2]
+    assert np.array_equal(scores, expected[[0, 1]])
+
+
+def test_removing_every_document():
+    index = BM25Index(DOCS)
+    index.remove_documents(range(len(DOCS)), DOCS)
+    assert index.corpus_size == 0
+    assert index.avgdl == 0.0
+    scores = index.get_scores(["dog", "cat"])
+    assert not np.isnan(scores).any()
+    assert not scores.any()
+    docs, scores = index.top_k(["dog"], 3)
+    assert len(docs) == 0 and len(scores) == 0
+
+    index.add_documents([DOCS[0]])
+    expected = BM25Okapi([DOCS[0]]).get_scores(["dog"])
+    assert np.array_equal(index.get_scores(["dog"])[-1:], expected)
+
+
+def test_collection_stats_follow_updates():
+    first, second = BM25Index(DOCS[:2]), BM25Index(DOCS[2:4])
+    stats = collection_stats([first, second])
+    first.set_collection_stats(stats)
+    second.set_collection_stats(stats)
+    second.add_documents([DOCS[4]])
+    first.remove_documents([0], [DOCS[0]])
+    expected = BM25Okapi(DOCS[1:]).get_scores(["cat", "kidney"])
+    scores = np.concatenate([first.get_scores(["cat", "kidney"])[1:], second.get_scores(["cat", "kidney"])])
+    assert np.allclose(scores, expected)
+
+
+def _random_docs(n=300, vocab=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return [[f"w{t}" for t in rng.zipf(1.5, rng.integers(0, 30)) % vocab] for _ in range(n)]
+
+
+def _reference_top_k(scores, rows, k):
+    # Highest score first, ties to the higher doc index
+    order = sorted(rows, key=lambda r: (-scores[r], -r))[:k]
+    return np.array(order), scores[order]
+
+
+def test_top_k_matches_full_sort():
+    docs = _random_docs()
+    index = BM25Index(docs)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        query = [f"w{t}" for t in rng.integers(0, 60, rng.integers(1, 6))]
+        scores = index.get_scores(query)
+        for k in (1, 10, 300):
+            got_docs, got_scores = index.top_k(query, k)
+            ref_docs, ref_scores = _reference_top_k(scores, range(len(docs)), k)
+            assert got_docs.tolist() == ref_docs.tolist()
+            assert np.array_equal(got_scores, ref_scores)
+
+
+def test_top_k_ties_go_to_higher_doc_index():
+    index = BM25Index([["dog"], ["cat"], ["dog"], ["dog"], ["cat"]])
+    docs, scores = index.top_k(["dog"], 2)
+    assert docs.tolist() == [3, 2]
+    assert scores[0] == scores[1]
+
+
+def test_top_k_empty_query_and_unknown_terms():
+    index = BM25Index(DOCS)
+    for query in ([], ["zebra"]):
+        docs, scores = index.top_k(query, 3)
+        assert docs.tolist() == [4, 3, 2]
+        assert not scores.any()
+    docs, scores = index.top_k(["zebra", "horse"], 2)
+    assert docs[0] == 4 and scores[0] > 0 and scores[1] == 0
+
+
+def test_top_k_mask():
+    docs = _random_docs()
+    index = BM25Index(docs)
+    mask = np.zeros(len(docs), dtype=bool)
+    mask[::7] = True
+    query = ["w1", "w2", "w5"]
+    got_docs, got_scores = index.top_k(query, 10, mask=mask)
+    ref_docs, ref_scores = _reference_top_k(index.get_scores(query), np.flatnonzero(mask), 10)
+    assert got_docs.tolist() == ref_docs.tolist()
+    assert np.array_equal(got_scores, ref_scores)
+    # Fewer live documents in the partition than k
+    small = np.zeros(len(docs), dtype=bool)
+    small[[3, 9]] = True
+    assert sorted(index.top_k(query, 10, mask=small)[0].tolist()) == [3, 9]
+
+
+def test_save_and_load(tmp_path):
+    index = BM25Index(DOCS[:3])
+    index.add_documents(DOCS[3:])
+    index.remove_documents([2], [DOCS[2]])
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.live.tolist() == index.live.tolist()
+    for query in (["dog", "kidney"], ["cat"], ["horse", "colic"]):
+        assert np.array_equal(loaded.get_scores(query), index.get_scores(query))
+        assert loaded.top_k(query, 3)[0].tolist() == index.top_k(query, 3)[0].tolist()
@@ -0,0 +1,84 @@
+import time
+
+import src.cache as cache
+from src.cache import DiskCache, LRUCache, TieredCache
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_size=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert "b" not in lru
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.get("b", "missing") == "missing"
+    assert lru.stats()["hits"] == 3 and lru.stats()["misses"] == 1
+
+
+def test_lru_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    lru = LRUCache(max_size=10, ttl_seconds=5)
+    lru.put("a", 1)
+    now[0] += 4
+    assert lru.get("a") == 1
+    now[0] += 2
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+
+def test_disk_cache_persists(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    DiskCache(path).put("k", {"answer": [1, 2]})
+    assert DiskCache(path).get("k") == {"answer": [1, 2]}
+    assert DiskCache(path).get("other") is None
+
+
+def test_disk_cache_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    disk = DiskCache(tmp_path / "cache.sqlite", ttl_seconds=5)
+    disk.put("old", 1)
+    now[0] += 6
+    assert disk.get("old") is None
+    disk.put("new", 2)
+    assert len(disk) == 1
+
+
+def test_disk_cache_reads_do_not_write(tmp_path):
+    disk = DiskCache(tmp_path / "cache.sqlite", access_batch=100)
+    disk.put("k", 1)
+    writes = disk._conn.total_changes
+    for _ in range(50):
+        assert disk.get("k") == 1
+    assert disk._conn.total_changes == writes
+
+
+def test_disk_cache_evicts_least_recently_read(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    disk = DiskCache(tmp_path / "cache.sqlite", max_entries=2)
+    disk.put("a", 1)
+    now[0] += 1
+    disk.put("b", 2)
+    now[0] += 1
+    assert disk.get("a") == 1  # buffered access time, written before eviction
+    now[0] += 1
+    disk.put("c", 3)
+    assert disk.get("b") is None
+    assert disk.get("a") == 1 and disk.get("c") == 3
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    disk = DiskCache(tmp_path / "cache.sqlite")
+    disk.put("k", "v")
+    tiered = TieredCache(LRUCache(10), disk)
+    assert tiered.get("k") == "v"
+    assert "k" in tiered.memory
+    assert tiered.get("k") == "v"
+    assert tiered.get("missing") is None
+    stats = tiered.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    tiered.put("new", "x")
+    assert disk.get("new") == "x"
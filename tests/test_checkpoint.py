@@ -0,0 +1,101 @@
+import json
+
+import pandas as pd
+
+import src.agent as agent
+from src.agent import build_default_eval_cases, experiment_fingerprint
+from src.checkpoint import CheckpointLog
+
+FINGERPRINT = {"judge_mode": "full", "models": {"judge": "small"}}
+
+
+def _log(tmp_path, **kwargs):
+    return CheckpointLog(str(tmp_path / "run.jsonl"), **kwargs)
+
+
+def test_put_get_round_trip(tmp_path):
+    frame = pd.DataFrame({"doc_id": [3, 1], "text": ["a", "b"], "score": [0.5, 0.25]})
+    log = _log(tmp_path)
+    log.put("improved/c1/retrieve", frame)
+    log.put("improved/c1/generate", {"answer": "x", "scores": (1, 2)})
+    log.close()
+
+    log = _log(tmp_path, resume=True)
+    assert log.resumed == 2 and "improved/c1/retrieve" in log
+    pd.testing.assert_frame_equal(log.get("improved/c1/retrieve"), frame)
+    assert log.get("improved/c1/generate") == {"answer": "x", "scores": [1, 2]}
+    assert log.get("missing", "default") == "default"
+    log.close()
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    log = _log(tmp_path)
+    log.put("a", 1)
+    log.close()
+    with open(tmp_path / "run.jsonl", "a") as f:
+        f.write('{"key": "b", "val')  # interrupted mid-write
+
+    log = _log(tmp_path, resume=True)
+    assert log.resumed == 1 and "b" not in log
+    log.put("b", 2)
+    log.close()
+    log = _log(tmp_path, resume=True)
+    assert log.get("a") == 1 and log.get("b") == 2
+    log.close()
+
+
+def test_without_resume_old_log_is_moved_aside(tmp_path):
+    log = _log(tmp_path)
+    log.put("a", 1)
+    log.close()
+    log = _log(tmp_path)
+    assert len(log) == 0
+    log.close()
+    assert (tmp_path / "run.prev.jsonl").exists()
+
+
+def test_resume_requires_matching_fingerprint(tmp_path):
+    log = _log(tmp_path, fingerprint=FINGERPRINT)
+    log.put("a", 1)
+    log.close()
+    first = (tmp_path / "run.jsonl").read_text().splitlines()[0]
+    assert json.loads(first) == {"fingerprint": FINGERPRINT}
+
+    log = _log(tmp_path, resume=True, fingerprint=dict(FINGERPRINT))
+    assert log.resumed == 1 and not log.stale
+    log.close()
+
+    log = _log(tmp_path, resume=True, fingerprint=dict(FINGERPRINT, judge_mode="efficient"))
+    assert log.stale and log.resumed == 0 and "a" not in log
+    log.close()
+    assert (tmp_path / "run.prev.jsonl").exists()
+    header = json.loads((tmp_path / "run.jsonl").read_text().splitlines()[0])
+    assert header["fingerprint"]["judge_mode"] == "efficient"
+
+
+def test_log_without_fingerprint_is_not_resumed(tmp_path):
+    log = _log(tmp_path)
+    log.put("a", 1)
+    log.close()
+    log = _log(tmp_path, resume=True, fingerprint=FINGERPRINT)
+    assert log.stale and len(log) == 0
+    log.close()
+
+
+def test_experiment_fingerprint_follows_settings(monkeypatch):
+    cases = build_default_eval_cases()
+    base = experiment_fingerprint(cases)
+    assert base == experiment_fingerprint(build_default_eval_cases())
+    assert experiment_fingerprint(cases[:-1]) != base
+    assert experiment_fingerprint(cases, relevance_proxy=True) != experiment_fingerprint(cases, relevance_proxy=False)
+    for name, value in (("JUDGE_MODE", "efficient"), ("PACK_EVIDENCE", not agent.PACK_EVIDENCE),
+                        ("GENERATOR_MODEL", "other-model"), ("SYSTEM_PROMPT", "Be brief.")):
+        with monkeypatch.context() as m:
+            m.setattr(agent, name, value)
+            assert experiment_fingerprint(cases) != base
+    proxy_base = experiment_fingerprint(cases, relevance_proxy=True)
+    for name, value in (("RELEVANCE_PROXY_SAMPLE_FRACTION", 0.5), ("RELEVANCE_PROXY_MIN_SAMPLE", 30)):
+        with monkeypatch.context() as m:
+            m.setattr(agent, name, value)
+            assert experiment_fingerprint(cases, relevance_proxy=True) != proxy_base
+            assert experiment_fingerprint(cases) == base
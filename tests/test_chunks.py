@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+import src.chunks as chunks
+import src.embeddings as embeddings
+from src.chunks import build_chunks, iter_chunks, iter_pdf_pages
+from src.embeddings import embed_chunk_stream, iter_embedding_batches
+
+from conftest import FakeEmbedder, make_docs
+
+NUM_PAGES = 11
+
+
+class _FakeReader:
+    def __init__(self, path):
+        self.pages = [None] * NUM_PAGES
+
+
+def _fake_range(pdf_path, start, stop):
+    # Module level so the process pool can pickle it
+    return [f"page {i + 1} text" for i in range(start, stop)]
+
+
+@pytest.fixture
+def fake_pdf(monkeypatch):
+    monkeypatch.setattr(chunks, "PdfReader", _FakeReader)
+    monkeypatch.setattr(chunks, "_extract_page_range", _fake_range)
+    monkeypatch.setattr(chunks, "TA_MODE", False)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_pdf_pages_in_order(fake_pdf, workers):
+    pages = list(iter_pdf_pages("book.pdf", workers=workers, pages_per_task=2))
+    assert [p["page"] for p in pages] == list(range(1, NUM_PAGES + 1))
+    assert pages[4]["text"] == "page 5 text"
+
+
+def test_pdf_pages_ta_limit(fake_pdf, monkeypatch):
+    monkeypatch.setattr(chunks, "TA_MODE", True)
+    monkeypatch.setattr(chunks, "TA_MAX_PAGES", 4)
+    assert len(list(iter_pdf_pages("book.pdf", workers=1))) == 4
+
+
+def test_iter_chunks_is_lazy_build_chunks(monkeypatch):
+    monkeypatch.setattr(chunks, "TA_MODE", False)
+    pages = [
+        {"page": 1, "text": "Feline asthma causes cough and wheeze. " * 40},
+        {"page": 2, "text": "   "},
+        {"page": 3, "text": "Canine kidney disease and vomiting."},
+    ]
+    eager = build_chunks(pages)
+    assert list(iter_chunks(iter(pages))) == eager
+    assert [c["doc_id"] for c in eager] == list(range(len(eager)))
+    assert {c["page"] for c in eager} == {1, 3}
+    assert all(len(c["text"]) <= chunks.CHUNK_SIZE for c in eager)
+    assert all("tag" in c and "tags" in c for c in eager)
+
+
+def test_iter_chunks_ta_limit(monkeypatch):
+    monkeypatch.setattr(chunks, "TA_MODE", True)
+    monkeypatch.setattr(chunks, "TA_MAX_CHUNKS", 3)
+    pages = [{"page": i, "text": f"cat dog text {i}"} for i in range(1, 10)]
+    assert len(build_chunks(pages)) == 3
+
+
+def test_embedding_batches():
+    docs = make_docs(10)
+    consumed = []
+
+    def stream():
+        for d in docs:
+            consumed.append(d["doc_id"])
+            yield d
+
+    batches = iter_embedding_batches(stream(), FakeEmbedder(), batch_size=4)
+    batch, embs = next(batches)
+    # Only the first batch has been pulled from the stream
+    assert consumed == [0, 1, 2, 3]
+    assert embs.shape == (4, 32) and embs.dtype == np.float32
+    assert [len(b) for b, _ in batches] == [4, 2]
+
+
+@pytest.mark.parametrize("ta_mode", [False, True])
+def test_embed_chunk_stream(monkeypatch, ta_mode):
+    embedder = FakeEmbedder()
+    monkeypatch.setattr(embeddings, "get_embedder", lambda: embedder)
+    monkeypatch.setattr(embeddings, "TA_MODE", ta_mode)
+    monkeypatch.setattr(embeddings, "TA_MAX_EMBED", 7)
+    docs = make_docs(23)
+    out_docs, embs = embed_chunk_stream(iter(docs), batch_size=5)
+    assert out_docs == docs
+    n = 7 if ta_mode else 23
+    assert np.allclose(embs, embedder.encode([d["text"] for d in docs[:n]]))
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from src.corpus import CorpusManager, Shard
+from src.embeddings import build_faiss_index
+from src.retriever import RetrieverBase, SearchFilter, VetRetriever
+
+from conftest import make_docs
+
+QUERIES = ["cat asthma cough", "dog kidney renal failure", "feline fever lethargy"]
+
+
+@pytest.fixture
+def corpus(make_retriever, embedder, reranker):
+    # Shard docs carry no "source", as for indexes built without one
+    corpus = CorpusManager(
+        [Shard("a", make_retriever(40, seed=0)), Shard("b", make_retriever(30, seed=1))],
+        query_embedder=embedder, reranker=reranker,
+    )
+    yield corpus
+    corpus.close()
+
+
+def test_retriever_base_is_abstract():
+    with pytest.raises(TypeError):
+        RetrieverBase()
+
+
+def test_matches_single_retriever_over_all_docs(corpus, embedder, reranker):
+    docs = make_docs(40, seed=0) + make_docs(30, seed=1)
+    docs = [dict(d, doc_id=i) for i, d in enumerate(docs)]
+    embs = embedder.encode([d["text"] for d in docs])
+    single = VetRetriever(docs, embs, build_faiss_index(embs), query_embedder=embedder, reranker=reranker)
+    for got, ref in zip(corpus.retrieve_many(QUERIES, adaptive=False),
+                        single.retrieve_many(QUERIES, adaptive=False)):
+        assert np.allclose(got["dense_score"], ref["dense_score"])
+        assert np.allclose(got["bm25_score"], ref["bm25_score"])
+        assert np.allclose(got["combined_score"], ref["combined_score"])
+
+
+def test_source_filter_on_shards_without_source(corpus):
+    mask = corpus.filter_mask(SearchFilter(sources=("b",)))
+    assert mask.sum() == 30 and mask[40:].all()
+    frames = corpus.retrieve_many(QUERIES, adaptive=False, filters=SearchFilter(sources=("b",)))
+    for frame in frames:
+        assert len(frame) > 0
+        assert frame["doc_id"].between(40, 69).all()
+        assert (frame["source"] == "b").all()
+
+    # Other constraints still apply inside the selected shard
+    pages = SearchFilter(sources=("b",), pages=(1, 2))
+    assert corpus.filter_mask(pages).sum() == 6
+    for frame in corpus.retrieve_many(QUERIES, adaptive=False, filters=pages):
+        assert frame["page"].between(1, 2).all()
+        assert frame["doc_id"].between(40, 69).all()
+
+
+def test_updates_use_global_doc_ids(corpus, make_retriever):
+    new_ids = corpus.add_documents(make_docs(2, seed=5), source="a")
+    assert new_ids == [70, 71]
+    assert corpus.docs[70]["source"] == "a" and corpus.docs[70]["shard_doc_id"] == 40
+
+    assert corpus.remove_documents([3, 71]) == [3, 71]
+    assert not corpus.filter_mask(SearchFilter(sources=("a",)))[[3, 71]].any()
+    with pytest.raises(KeyError):
+        corpus.remove_documents([500])
+
+    corpus.drop_shard("b")
+    assert corpus.docs[40] is None
+    # Dropped ids are not reused when the shard comes back
+    assert corpus.add_shard(Shard("b", make_retriever(3))).doc_ids.tolist() == [72, 73, 74]
@@ -0,0 +1,91 @@
+import faiss
+import numpy as np
+import pytest
+
+from src.embeddings import (
+    add_to_faiss_index,
+    build_faiss_index,
+    faiss_factory_string,
+    is_compressed_index,
+    remove_from_faiss_index,
+    search_params,
+)
+
+
+def _vectors(n=2000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    embs = rng.standard_normal((n, dim)).astype("float32")
+    return embs / np.linalg.norm(embs, axis=1, keepdims=True)
+
+
+def test_factory_strings():
+    assert faiss_factory_string(5000, 64, "flat") == "Flat"
+    assert faiss_factory_string(5000, 64, "hnsw", hnsw_m=16) == "HNSW16"
+    # nlist clamped to n // 39
+    assert faiss_factory_string(1000, 64, "ivf_flat", nlist=256) == "IVF25,Flat"
+    assert faiss_factory_string(5000, 64, "ivf_pq", nlist=64, pq_m=48, pq_nbits=8) == "IVF64,PQ32x8"
+    # Too few vectors for PQ codebooks
+    assert faiss_factory_string(100, 64, "ivf_pq", pq_nbits=8).endswith(",Flat")
+    with pytest.raises(ValueError):
+        faiss_factory_string(100, 64, "annoy")
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "ivf_pq", "hnsw"])
+def test_index_types_recall(index_type):
+    embs = _vectors()
+    queries = embs[:50] + 0.05 * _vectors(50, seed=1)
+    _, truth = build_faiss_index(embs, "flat").search(queries, 10)
+    index = build_faiss_index(embs, index_type, nlist=16, pq_m=8)
+    _, found = index.search(queries, 10, params=search_params(index, nprobe=16, ef_search=128))
+    recall = np.mean([len(set(t) & set(f)) / 10 for t, f in zip(truth, found)])
+    assert recall >= (0.99 if index_type != "ivf_pq" else 0.3)
+    assert is_compressed_index(index) == (index_type == "ivf_pq")
+
+
+def test_search_params():
+    embs = _vectors(500)
+    assert search_params(build_faiss_index(embs, "flat")) is None
+    ivf = build_faiss_index(embs, "ivf_flat", nlist=8)
+    assert search_params(ivf, nprobe=4).nprobe == 4
+    hnsw = build_faiss_index(embs, "hnsw")
+    assert search_params(hnsw, ef_search=77).efSearch == 77
+    sel = faiss.IDSelectorRange(0, 10)
+    assert search_params(build_faiss_index(embs, "flat"), sel=sel) is not None
+
+
+def test_add_and_remove():
+    embs = _vectors(600)
+    flat = build_faiss_index(embs[:500], "flat")
+    with pytest.raises(ValueError):
+        add_to_faiss_index(flat, embs[500:], np.arange(0, 100))
+    add_to_faiss_index(flat, embs[500:], np.arange(500, 600))
+    assert flat.ntotal == 600
+    assert remove_from_faiss_index(flat, np.array([3])) is False
+
+    ivf = build_faiss_index(embs[:500], "ivf_flat", nlist=8)
+    add_to_faiss_index(ivf, embs[500:], np.arange(1000, 1100))
+    _, found = ivf.search(embs[550:551], 1, params=search_params(ivf, nprobe=8))
+    assert found[0, 0] == 1050
+    assert remove_from_faiss_index(ivf, np.array([1050])) is True
+    _, found = ivf.search(embs[550:551], 1, params=search_params(ivf, nprobe=8))
+    assert found[0, 0] != 1050
+
+
+@pytest.mark.parametrize("storage,codes", [("float32", "Flat"), ("float16", "SQfp16"), ("int8", "SQ8")])
+def test_storage_codes(storage, codes):
+    assert faiss_factory_string(5000, 64, "flat", storage=storage) == codes
+    assert faiss_factory_string(5000, 64, "ivf_flat", nlist=64, storage=storage) == f"IVF64,{codes}"
+    assert faiss_factory_string(5000, 64, "hnsw", hnsw_m=16, storage=storage).startswith("HNSW16")
+    with pytest.raises(ValueError):
+        faiss_factory_string(5000, 64, "flat", storage="bfloat16")
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+def test_compressed_storage_is_smaller(index_type):
+    embs = _vectors(1000, dim=64)
+    sizes = {}
+    for storage in ("float32", "float16", "int8"):
+        index = build_faiss_index(embs, index_type, nlist=8, storage=storage)
+        assert is_compressed_index(index) == (storage != "float32")
+        sizes[storage] = len(faiss.serialize_index(index))
+    assert sizes["int8"] < sizes["float16"] < sizes["float32"]
@@ -0,0 +1,131 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from src.evaluation import evaluate_system
+
+from conftest import FakeClient
+
+
+def _rows(n=6):
+    return pd.DataFrame([
+        {
+            "system": "improved",
+            "case_id": f"case-{i}",
+            "query": f"question {i} about feline asthma",
+            "answer": f"answer {i}",
+            "gold_answer": f"gold {i}",
+            "evidence_texts": [f"passage {i}.{j} cough" for j in range(3)],
+        }
+        for i in range(n)
+    ])
+
+
+def test_concurrent_judging_matches_sequential():
+    df = _rows()
+    sequential = evaluate_system(FakeClient(), df, max_workers=1, mode="full")
+    concurrent = evaluate_system(FakeClient(), df, max_workers=8, mode="full")
+    pd.testing.assert_frame_equal(sequential, concurrent)
+    assert sequential["correctness_score"].notna().all()
+    assert (sequential["judge_llm_calls"] == 3 + 1 + 3).all()
+
+
+def _grading_client(grades):
+    """
+    Correctness grades from `grades` in call order (per question), the
+    default fake replies otherwise.
+    """
+    seen = {}
+
+    def reply(system, user):
+        if "Return ONLY: A" not in system:
+            return FakeClient().reply(system, user)
+        with lock:
+            n = seen[user] = seen.get(user, -1) + 1
+        return grades[n]
+
+    lock = threading.Lock()
+    return FakeClient(reply=reply)
+
+
+def test_correctness_early_stop():
+    from src.evaluation import judge_correctness
+
+    client = _grading_client("AAF")
+    assert judge_correctness(client, "q", "a", "g", early_stop=True) == 10.0
+    assert client.calls == 2
+    client = _grading_client("AAF")
+    assert judge_correctness(client, "q", "a", "g") == 10.0
+    assert client.calls == 3
+    # Disagreeing draws: the third grade decides
+    client = _grading_client("AFB")
+    assert judge_correctness(client, "q", "a", "g", early_stop=True) == 8.0
+    assert client.calls == 3
+
+
+def test_efficient_mode_calls_and_usage():
+    df = _rows(4)
+    agree = evaluate_system(_grading_client("AAF"), df, max_workers=4, mode="efficient")
+    # Two grades, hallucination and one batched relevance call
+    assert (agree["judge_llm_calls"] == 4).all()
+    assert (agree["full_judge_llm_calls"] == 3 + 1 + 3).all()
+    assert (agree["correctness_score"] == 10.0).all()
+    assert (agree["evidence_relevance"] == 3.0).all()
+    assert (agree["judge_tokens"] < agree["full_judge_tokens"]).all()
+
+    disagree = evaluate_system(_grading_client("AFB"), df, max_workers=4, mode="efficient")
+    assert (disagree["judge_llm_calls"] == 5).all()
+    assert (disagree["correctness_score"] == 8.0).all()
+
+    full = evaluate_system(_grading_client("AAF"), df, max_workers=4, mode="full")
+    assert (full["judge_llm_calls"] == full["full_judge_llm_calls"]).all()
+    assert (full["correctness_score"] == 10.0).all()
+
+
+def test_efficient_mode_without_evidence():
+    df = _rows(2).assign(evidence_texts=[[], None])
+    out = evaluate_system(FakeClient(), df, mode="efficient")
+    assert out["evidence_relevance"].isna().all()
+    assert (out["hallucination_score"] == 10.0).all()
+
+
+def test_unknown_judge_mode():
+    with pytest.raises(ValueError):
+        evaluate_system(FakeClient(), _rows(1), mode="fast")
+
+
+def test_parse_relevance_scores():
+    from src.evaluation import _parse_relevance_scores
+
+    assert _parse_relevance_scores('{"scores": [5, 0, 3]}', 3) == [5, 0, 3]
+    assert _parse_relevance_scores('{"scores": ["4", 1]}', 2) == [4, 1]
+    # Missing, out-of-range and non-numeric scores fall back to 2
+    assert _parse_relevance_scores('{"scores": [4]}', 3) == [4, 2, 2]
+    assert _parse_relevance_scores('{"scores": [9, -1, "high"]}', 3) == [2, 2, 2]
+    assert _parse_relevance_scores('{"scores": [1, 2, 3, 4]}', 2) == [1, 2]
+    # Broken JSON: bare digits in order
+    assert _parse_relevance_scores("scores: 4, 5 and 1", 3) == [4, 5, 1]
+    assert _parse_relevance_scores('[3, 4]', 2) == [3, 4]
+    assert _parse_relevance_scores('{"result": "none"}', 2) == [2, 2]
+    assert _parse_relevance_scores("", 2) == [2, 2]
+
+
+def test_batched_relevance_is_one_call():
+    from src.evaluation import judge_evidence_relevance_batch
+
+    client = FakeClient()
+    assert judge_evidence_relevance_batch(client, "q", ["a", "b", "c"]) == [3, 4, 2]
+    assert client.calls == 1
+
+
+def test_combine_bare_checkpoint_scores():
+    from src.evaluation import combine_judge_scores
+
+    # Checkpoints written before usage was recorded hold bare scores
+    results = {("correctness", 0): 8, ("correctness", 1): 8, ("hallucination", 0): 7,
+               ("relevance_batch", 0): [4, 2, 3]}
+    cols = combine_judge_scores(results, "q", ["a", "b", "c"])
+    assert cols["correctness_score"] == 8.0
+    assert cols["evidence_relevance"] == 3.0
+    assert cols["judge_llm_calls"] is None and cols["full_judge_llm_calls"] is None
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+import src.retriever as retriever_module
+from src.chunks import simple_species_from_text
+from src.embeddings import build_faiss_index
+from src.retriever import SearchFilter, VetRetriever
+
+from conftest import make_docs
+
+QUERIES = ["cat asthma cough", "dog kidney renal failure", "feline fever lethargy"]
+
+
+def test_from_dict():
+    assert SearchFilter.from_dict({"tag": "respiratory", "pages": [10, "40"], "source": "databook",
+                                   "species": "cat"}) == SearchFilter(
+        tags=("respiratory",), pages=(10, 40), sources=("databook",), species="cat")
+    assert SearchFilter.from_dict({"tags": ["a", "b"]}).tags == ("a", "b")
+    assert SearchFilter.from_dict({}) == SearchFilter()
+    with pytest.raises(ValueError):
+        SearchFilter.from_dict({"colour": "red"})
+
+
+def test_species_from_text():
+    assert simple_species_from_text("Feline asthma in two cats") == ["cat"]
+    assert simple_species_from_text("Canine and feline patients") == ["cat", "dog"]
+    assert simple_species_from_text("Catheter placement") == []
+
+
+@pytest.fixture
+def retriever(embedder, reranker):
+    docs = make_docs(90)
+    for d in docs:
+        d["tag"] = "respiratory" if d["doc_id"] % 3 == 0 else "general"
+        d["source"] = "a" if d["doc_id"] < 45 else "b"
+    docs[1]["tags"] = ["respiratory", "renal"]
+    embs = embedder.encode([d["text"] for d in docs])
+    return VetRetriever(docs, embs, build_faiss_index(embs, index_type="flat"),
+                        query_embedder=embedder, reranker=reranker)
+
+
+def _expected_rows(retriever, filters):
+    rows = []
+    for d, text in zip(retriever.docs, retriever.texts):
+        tags = set(d.get("tags") or ()) | {d["tag"]}
+        species = simple_species_from_text(text)
+        if filters.tags is not None and tags.isdisjoint(filters.tags):
+            continue
+        if filters.pages is not None and not filters.pages[0] <= d["page"] <= filters.pages[1]:
+            continue
+        if filters.sources is not None and d["source"] not in filters.sources:
+            continue
+        if filters.species is not None and species and filters.species not in species:
+            continue
+        rows.append(d["doc_id"])
+    return rows
+
+
+FILTERS = [
+    SearchFilter(tags=("respiratory",)),
+    SearchFilter(tags=("renal",)),
+    SearchFilter(pages=(3, 9)),
+    SearchFilter(sources=("b",)),
+    SearchFilter(species="dog"),
+    SearchFilter(tags=("respiratory",), sources=("a",), species="cat"),
+]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filter_mask(retriever, filters):
+    assert np.flatnonzero(retriever.filter_mask(filters)).tolist() == _expected_rows(retriever, filters)
+
+
+def test_filter_mask_follows_updates(retriever):
+    filters = SearchFilter(tags=("respiratory",))
+    before = retriever.filter_mask(filters).sum()
+    retriever.remove_documents([0], persist=False)
+    assert retriever.filter_mask(filters).sum() == before - 1
+    retriever.add_documents([dict(make_docs(1)[0], tag="respiratory")], persist=False)
+    mask = retriever.filter_mask(filters)
+    assert len(mask) == 91 and mask[90] and not mask[0]
+
+
+@pytest.mark.parametrize("exact_max_rows", [4096, 0])
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filtered_dense_hits(retriever, filters, exact_max_rows, monkeypatch):
+    # 0 sends every partition through FAISS with an ID selector
+    monkeypatch.setattr(retriever_module, "FILTER_EXACT_MAX_ROWS", exact_max_rows)
+    rows = _expected_rows(retriever, filters)
+    k = 5
+    for query, (idx, scores) in zip(QUERIES, retriever._dense_hits_many(QUERIES, k, filters=filters)):
+        assert len(idx) == min(k, len(rows))
+        assert set(idx.tolist()) <= set(rows)
+        assert np.all(np.diff(scores) <= 1e-6)
+        # Ties at the k-th score may be broken either way
+        q = retriever.query_embedder.encode([query])[0]
+        kth = np.sort(retriever.embs[rows] @ q)[::-1][len(idx) - 1]
+        assert scores[-1] >= kth - 1e-5
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "hnsw"])
+def test_filtered_dense_hits_approximate_indexes(make_retriever, index_type, monkeypatch):
+    monkeypatch.setattr(retriever_module, "FILTER_EXACT_MAX_ROWS", 0)
+    retriever = make_retriever(n=300, index_type=index_type)
+    filters = SearchFilter(pages=(1, 20))
+    rows = set(np.flatnonzero(retriever.filter_mask(filters)).tolist())
+    for idx, _ in retriever._dense_hits_many(QUERIES, 10, filters=filters):
+        assert len(idx) == 10 and set(idx.tolist()) <= rows
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filtered_bm25_hits(retriever, filters):
+    rows = _expected_rows(retriever, filters)
+    for query, (idx, scores) in zip(QUERIES, retriever._bm25_hits_many(QUERIES, 5, filters=filters)):
+        full = retriever.bm25.get_scores(retriever_module.tokenize(query))
+        ref = sorted(rows, key=lambda r: (-full[r], -r))[:5]
+        assert idx.tolist() == ref
+        assert np.allclose(scores, full[ref])
+
+
+def test_filtered_retrieval_returns_full_top_k(retriever):
+    filters = SearchFilter(tags=("respiratory",), sources=("b",))
+    rows = set(_expected_rows(retriever, filters))
+    for frame in retriever.retrieve_many(QUERIES, top_k_final=5, adaptive=False, filters=filters):
+        assert len(frame) == 5
+        assert set(frame["doc_id"]) <= rows
+    # A filter nothing matches returns no evidence
+    for frame in retriever.retrieve_many(QUERIES, filters=SearchFilter(sources=("missing",))):
+        assert len(frame) == 0
@@ -0,0 +1,61 @@
+import numpy as np
+
+from src.embeddings import build_faiss_index
+from src.index_store import load_index, save_index
+from src.retriever import build_bm25
+
+from conftest import FakeEmbedder, make_docs
+
+PARAMS = {"format_version": 2, "pdf_sha256": "abc", "chunk_size": 800}
+
+
+def _artifact():
+    docs = make_docs(20)
+    embs = FakeEmbedder().encode([d["text"] for d in docs])
+    return docs, embs, build_faiss_index(embs), build_bm25([d["text"] for d in docs])
+
+
+def test_save_and_load_round_trip(tmp_path):
+    docs, embs, faiss_index, bm25 = _artifact()
+    index_dir = tmp_path / "idx"
+    save_index(index_dir, PARAMS, docs, embs, faiss_index, bm25)
+    assert not (tmp_path / "idx.tmp").exists()
+
+    artifact = load_index(index_dir, PARAMS)
+    assert artifact.docs == docs
+    assert np.array_equal(np.asarray(artifact.embs), embs)
+    assert artifact.faiss_index.ntotal == len(docs)
+    assert np.array_equal(artifact.bm25.get_scores(["cat"]), bm25.get_scores(["cat"]))
+    assert artifact.deltas == []
+
+
+def test_missing_or_stale_artifact_is_not_loaded(tmp_path):
+    assert load_index(tmp_path / "missing", PARAMS) is None
+    docs, embs, faiss_index, bm25 = _artifact()
+    save_index(tmp_path / "idx", PARAMS, docs, embs, faiss_index, bm25)
+    assert load_index(tmp_path / "idx", dict(PARAMS, chunk_size=500)) is None
+
+
+def test_save_replaces_previous_artifact(tmp_path):
+    docs, embs, faiss_index, bm25 = _artifact()
+    save_index(tmp_path / "idx", PARAMS, docs, embs, faiss_index, bm25)
+    save_index(tmp_path / "idx", PARAMS, docs[:5], embs[:5], build_faiss_index(embs[:5]),
+               build_bm25([d["text"] for d in docs[:5]]))
+    assert len(load_index(tmp_path / "idx", PARAMS).docs) == 5
+
+
+def test_custom_tag_vocabulary_changes_index_key(tmp_path, monkeypatch):
+    import src.index_store as index_store
+    from src.index_store import compute_index_key, index_params
+
+    pdf = tmp_path / "book.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    default = index_params(str(pdf))
+    assert "tag_vocabulary_sha256" not in default
+    vocab = tmp_path / "vocab.json"
+    vocab.write_text('{"zoonotic": ["rabies"]}')
+    monkeypatch.setattr(index_store, "TAG_VOCABULARY_PATH", str(vocab))
+    custom = index_params(str(pdf))
+    assert compute_index_key(custom) != compute_index_key(default)
+    vocab.write_text('{"zoonotic": ["rabies", "leptospira"]}')
+    assert compute_index_key(index_params(str(pdf))) != compute_index_key(custom)
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import httpx
+import pytest
+from groq import APIConnectionError
+
+import src.llm as llm
+from src.llm import RateLimiter, chat_completion
+
+from conftest import FakeClient
+
+MESSAGES = [{"role": "system", "content": "sys"}, {"role": "user", "content": "hello"}]
+
+
+def _connection_error():
+    return APIConnectionError(request=httpx.Request("POST", "http://groq.test"))
+
+
+def test_rate_limiter_waits_for_the_window():
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=10**6, window=0.2)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(1)
+    assert time.monotonic() - start >= 0.19
+
+
+def test_rate_limiter_token_budget():
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=100, window=0.2)
+    start = time.monotonic()
+    limiter.acquire(80)
+    limiter.acquire(80)
+    assert time.monotonic() - start >= 0.19
+    # A call larger than the whole budget still goes through on its own
+    limiter.acquire(500)
+
+
+def test_rate_limiter_is_shared_across_threads():
+    limiter = RateLimiter(requests_per_minute=4, tokens_per_minute=10**6, window=0.3)
+    done = []
+    threads = [threading.Thread(target=lambda: done.append(limiter.acquire(1) or time.monotonic())) for _ in range(6)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(t - start >= 0.29 for t in done) == 2
+
+
+def test_retry_on_transient_errors(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_BACKOFF_SECONDS", 0.0)
+    client = FakeClient(reply=lambda system, user: "ok")
+    create = client.create
+    failures = [_connection_error(), _connection_error()]
+
+    def flaky(**kwargs):
+        if failures:
+            raise failures.pop()
+        return create(**kwargs)
+
+    client.chat.completions.create = flaky
+    assert chat_completion(client, "m", MESSAGES, temperature=0) == "ok"
+
+
+def test_retry_gives_up(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(llm, "LLM_MAX_RETRIES", 2)
+    client = FakeClient()
+    attempts = []
+
+    def failing(**kwargs):
+        attempts.append(1)
+        raise _connection_error()
+
+    client.chat.completions.create = failing
+    with pytest.raises(APIConnectionError):
+        chat_completion(client, "m", MESSAGES, temperature=0)
+    assert len(attempts) == 3
+
+
+def test_cache_key():
+    key = llm.cache_key("m", MESSAGES, 0, None)
+    assert key == llm.cache_key("m", [dict(m) for m in MESSAGES], 0, None)
+    assert key != llm.cache_key("m", MESSAGES, 0.7, None)
+    assert key != llm.cache_key("m", MESSAGES, 0, None, cache_tag="sample-1")
+    assert key != llm.cache_key("m", MESSAGES, 0, None, response_format={"type": "json_object"})
+    assert key != llm.cache_key("other", MESSAGES, 0, None)
+
+
+def test_responses_are_cached(monkeypatch):
+    memory = llm.TieredCache(llm.LRUCache(10))
+    monkeypatch.setattr(llm, "_llm_cache", memory)
+    monkeypatch.setattr(llm, "LLM_CACHE_ENABLED", True)
+    client = FakeClient()
+    first = chat_completion(client, "m", MESSAGES, temperature=0)
+    assert chat_completion(client, "m", MESSAGES, temperature=0) == first
+    assert client.calls == 1
+    # Sampling calls are not cached unless LLM_CACHE_SAMPLING_CALLS is set
+    chat_completion(client, "m", MESSAGES, temperature=0.7)
+    chat_completion(client, "m", MESSAGES, temperature=0.7)
+    assert client.calls == 3
+    assert list(llm.stream_chat_lines(client, "m", MESSAGES, temperature=0)) == first.splitlines()
+    assert client.calls == 3
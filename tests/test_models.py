@@ -0,0 +1,109 @@
+import threading
+
+import numpy as np
+import pytest
+
+import src.models as models
+
+
+class _Model:
+    def __init__(self, mb=0):
+        # Touch the pages so they count towards RSS
+        self.weights = np.ones(mb * 2 ** 20, dtype=np.uint8)
+
+
+@pytest.fixture
+def fake_loaders(monkeypatch):
+    calls = []
+    monkeypatch.setattr(models, "_models", {})
+    monkeypatch.setattr(models, "_info", {})
+    monkeypatch.setattr(models, "_locks", {})
+    monkeypatch.setattr(models, "_threads_configured", True)
+
+    def loader(kind, mb, barrier=None):
+        def load(**kwargs):
+            calls.append(kind)
+            if barrier is not None:
+                barrier.wait(timeout=5)
+            return _Model(mb)
+        return load
+
+    def install(mb=0, barrier=None):
+        monkeypatch.setattr(models, "_LOADERS", {kind: loader(kind, mb, barrier) for kind in models.MODEL_KINDS})
+        return calls
+
+    return install
+
+
+def test_concurrent_first_calls_load_once(fake_loaders):
+    calls = fake_loaders()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(models.get_model("embedder", "fp32")))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["embedder"]
+    assert all(r is results[0] for r in results)
+    assert models.get_embedder("fp32") is results[0]
+
+
+def test_unknown_kind_or_backend(fake_loaders):
+    fake_loaders()
+    with pytest.raises(ValueError):
+        models.get_model("tokenizer", "fp32")
+    with pytest.raises(ValueError):
+        models.get_model("embedder", "int4")
+
+
+def test_sequential_load_reports_rss_growth(fake_loaders):
+    fake_loaders(mb=64)
+    info = models.preload_models(parallel=False, backend="fp32")
+    for kind in models.MODEL_KINDS:
+        delta = info[(kind, "fp32")].rss_delta_mb
+        if delta is None:
+            pytest.skip("/proc/self/statm not available")
+        assert 48 <= delta < 128
+
+
+def test_overlapping_loads_report_no_rss_growth(fake_loaders):
+    # Both loaders wait for each other, so the loads overlap
+    fake_loaders(barrier=threading.Barrier(2))
+    info = models.preload_models(parallel=True, backend="fp32")
+    assert [i.rss_delta_mb for i in info.values()] == [None, None]
+    assert models._loading == set() and models._overlapped_loads == set()
+
+
+def test_quantize_int8_shrinks_linear_weights():
+    import torch
+
+    torch.manual_seed(0)
+    module = torch.nn.Sequential(torch.nn.Linear(256, 256), torch.nn.ReLU(), torch.nn.Linear(256, 16))
+    x = torch.randn(8, 256)
+    expected = module(x).detach()
+    fp32_mb = models._param_mb(module)
+    quantized = models.quantize_int8(module)
+    assert isinstance(quantized[0], torch.ao.nn.quantized.dynamic.Linear)
+    assert models._param_mb(quantized) < 0.4 * fp32_mb
+    assert torch.allclose(quantized(x), expected, atol=0.05)
+
+
+def test_int8_backend_loads_on_cpu(fake_loaders, monkeypatch):
+    fake_loaders()
+    seen = {}
+    monkeypatch.setitem(models._LOADERS, "reranker", lambda **kwargs: seen.update(kwargs) or _Model())
+    monkeypatch.setattr(models, "quantize_int8", lambda model: setattr(model, "int8", True) or model)
+    model = models.get_reranker("int8")
+    assert seen == {"device": "cpu"} and model.int8
+    assert models.get_reranker("fp32") is not model
+
+
+def test_backend_changes_index_key(tmp_path, monkeypatch):
+    import src.index_store as index_store
+
+    pdf = tmp_path / "book.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    fp32 = index_store.index_params(str(pdf))
+    monkeypatch.setattr(index_store, "INFERENCE_BACKEND", "int8")
+    assert index_store.index_params(str(pdf)) != fp32
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.agent as agent
+from src.checkpoint import CheckpointLog
+from src.pipeline import TaskGraph
+
+from conftest import FakeClient
+
+
+def test_tasks_get_dependency_results_in_order():
+    graph = TaskGraph()
+    graph.add("a", lambda: 2, pool="cpu")
+    graph.add("b", lambda: 3)
+    graph.add("c", lambda b, a: b - a, deps=["b", "a"])
+    graph.add("d", lambda c, a: [c, a], deps=["c", "a"], pool="cpu")
+    assert graph.run(cpu_workers=1, io_workers=2) == {"a": 2, "b": 3, "c": 1, "d": [1, 2]}
+
+
+def test_add_validates_tasks():
+    graph = TaskGraph()
+    graph.add("a", lambda: 1)
+    for kwargs in ({"name": "a"}, {"name": "b", "pool": "gpu"}, {"name": "b", "deps": ["z"]}):
+        with pytest.raises(ValueError):
+            graph.add(fn=lambda *args: None, **kwargs)
+
+
+def test_independent_tasks_overlap():
+    barrier = threading.Barrier(3)
+    graph = TaskGraph()
+    for name in "abc":
+        graph.add(name, lambda: barrier.wait(timeout=5))
+    graph.run(io_workers=3)
+    path, seconds = graph.critical_path()
+    assert len(path) == 1 and seconds <= graph.report().serial_seconds
+
+
+def test_error_stops_dependents():
+    ran = []
+    graph = TaskGraph()
+    graph.add("fail", lambda: 1 / 0)
+    graph.add("after", lambda x: ran.append(x), deps=["fail"])
+    graph.add("other", lambda: ran.append("other"))
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+    assert ran == ["other"]
+
+
+def test_critical_path():
+    graph = TaskGraph()
+    graph.add("slow", lambda: time.sleep(0.05))
+    graph.add("fast", lambda: None)
+    graph.add("end", lambda *_: None, deps=["fast", "slow"])
+    graph.run()
+    path, seconds = graph.critical_path()
+    assert path == ["slow", "end"] and seconds >= 0.05
+
+
+def test_resume_skips_restored_work(tmp_path):
+    calls = []
+
+    def build(log):
+        graph = TaskGraph(log)
+        graph.add("retrieve", lambda: calls.append("retrieve") or "evidence", pool="cpu")
+        graph.add("generate", lambda ev: calls.append("generate") or ev.upper(), deps=["retrieve"])
+        graph.add("judge", lambda answer: calls.append("judge") or len(answer), deps=["generate"])
+        return graph
+
+    path = str(tmp_path / "log.jsonl")
+    log = CheckpointLog(path)
+    graph = build(log)
+    graph.tasks["judge"].fn = lambda answer: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+    log.close()
+
+    calls.clear()
+    log = CheckpointLog(path, resume=True)
+    graph = build(log)
+    results = graph.run()
+    log.close()
+    assert calls == ["judge"]
+    assert results["judge"] == len("EVIDENCE")
+    assert graph.report().restored == 2
+
+    # Work only restored tasks depend on is skipped
+    calls.clear()
+    path = str(tmp_path / "partial.jsonl")
+    log = CheckpointLog(path)
+    log.put("generate", "EVIDENCE")
+    graph = build(log)
+    graph.run()
+    log.close()
+    assert calls == ["judge"]
+    assert graph.skipped == ["retrieve"]
+
+
+@pytest.mark.parametrize("judge_mode", ["full", "efficient"])
+@pytest.mark.parametrize("relevance_proxy", [False, True])
+def test_pipelined_experiment_matches_sequential(make_retriever, monkeypatch, relevance_proxy, judge_mode):
+    monkeypatch.setattr(agent, "EXPERIMENT_CHECKPOINT", False)
+    monkeypatch.setattr(agent, "JUDGE_MODE", judge_mode)
+    out = {}
+    for pipelined in (False, True):
+        out[pipelined] = agent.run_full_experiment(
+            FakeClient(), make_retriever(), pipelined=pipelined, relevance_proxy=relevance_proxy
+        )
+    sequential, pipelined = out[False], out[True]
+    np.testing.assert_equal(pipelined[:4], sequential[:4])
+    for seq_df, pipe_df in zip(sequential[4:], pipelined[4:]):
+        pd.testing.assert_frame_equal(pipe_df.reset_index(drop=True), seq_df.reset_index(drop=True))
+    if judge_mode == "efficient":
+        evaluated = pd.concat(pipelined[4:])
+        with_evidence = evaluated["evidence_texts"].map(bool)
+        assert (evaluated["judge_llm_calls"] <= evaluated["full_judge_llm_calls"]).all()
+        assert (evaluated["judge_llm_calls"][with_evidence] < evaluated["full_judge_llm_calls"][with_evidence]).all()
@@ -0,0 +1,76 @@
+import pandas as pd
+
+from src.agent import EvalCase, eval_row
+from src.prompts import ClinicalCase, build_clinical_prompt, pack_evidence
+
+OVERLAP = "the nasal mucosa is inflamed and swollen"
+FIRST = "Feline herpesvirus causes rhinitis; " + OVERLAP
+SECOND = OVERLAP + " with serous then mucopurulent discharge."
+
+
+def _evidence(rows):
+    return pd.DataFrame([
+        {"doc_id": d, "page": p, "text": t, "tag": "respiratory", "combined_score": s}
+        for d, p, t, s in rows
+    ])
+
+
+def test_adjacent_chunks_are_merged_once():
+    df = _evidence([
+        (10, 4, FIRST, 0.9),
+        (11, 4, SECOND, 0.5),
+        (10, 4, FIRST, 0.7),  # same chunk from another sub-query
+        (30, 9, "Calicivirus causes oral ulcers.", 0.8),
+    ])
+    pack = pack_evidence(df, token_budget=2000)
+    assert pack.chunks == 4 and pack.passages == 2
+    assert pack.texts[0] == "Feline herpesvirus causes rhinitis; " + OVERLAP + " with serous then mucopurulent discharge."
+    assert pack.texts[1] == "Calicivirus causes oral ulcers."
+    assert pack.text.startswith("[1] (page 4, tag: respiratory)\n")
+    assert pack.tokens < pack.raw_tokens and pack.tokens_saved > 0
+
+
+def test_chunks_on_other_pages_or_sources_stay_apart():
+    df = _evidence([(10, 4, FIRST, 0.9), (11, 5, SECOND, 0.5)])
+    assert pack_evidence(df).passages == 2
+    df["source"] = ["book-a", "book-b"]
+    df["page"] = 4
+    assert pack_evidence(df).passages == 2
+
+
+def test_contained_passages_are_dropped():
+    df = _evidence([(1, 1, "Cough and wheeze in feline asthma.", 0.9), (7, 3, "feline   asthma", 0.4)])
+    assert pack_evidence(df).texts == ["Cough and wheeze in feline asthma."]
+
+
+def test_token_budget():
+    words = " ".join(f"word{i}" for i in range(400))
+    pack = pack_evidence(_evidence([(1, 1, words, 0.9)]), token_budget=300)
+    assert pack.tokens <= 300
+    assert pack.texts[0].endswith(" ...") and words.startswith(pack.texts[0][:-4])
+
+    # A passage that fits neither whole nor cut is skipped; a shorter one still fits
+    df = _evidence([(1, 1, words[:1000], 0.9), (5, 2, words, 0.8), (9, 3, "short tail passage", 0.1)])
+    pack = pack_evidence(df, token_budget=300)
+    assert pack.texts == [words[:1000], "short tail passage"]
+    assert pack.tokens <= 300
+
+
+def test_pack_false_keeps_every_row():
+    df = _evidence([(10, 4, FIRST, 0.9), (11, 4, SECOND, 0.5)])
+    pack = pack_evidence(df, pack=False)
+    assert pack.passages == 2 and pack.tokens_saved == 0
+    assert pack.texts == [FIRST, SECOND]
+    empty = pack_evidence(pd.DataFrame())
+    assert empty.texts == [] and empty.passages == 0
+
+
+def test_judges_see_the_packed_passages():
+    df = _evidence([(10, 4, FIRST, 0.9), (11, 4, SECOND, 0.5)])
+    pack = pack_evidence(df)
+    case = ClinicalCase(species="cat", key_signs=["sneezing"])
+    prompt = build_clinical_prompt(case, "cat sneezing", df, pack)
+    row = eval_row(EvalCase("c", case, "gold"), "baseline",
+                   {"query": "q", "answer": "a", "evidence": df, "evidence_pack": pack})
+    assert row["evidence_texts"] == pack.texts
+    assert all(text in prompt for text in row["evidence_texts"])
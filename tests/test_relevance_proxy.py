@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.evaluation import calibrate_relevance_proxy
+from src.relevance_proxy import (
+    RelevanceCalibration,
+    RelevanceProxy,
+    _isotonic,
+    calibration_sample,
+    calibration_sample_size,
+)
+
+from conftest import FakeClient
+
+
+def _reference_isotonic(y):
+    # Minimum over upper sets / maximum over lower sets of block means
+    n = len(y)
+    return np.array([
+        max(min(np.mean(y[i:j + 1]) for j in range(k, n)) for i in range(k + 1))
+        for k in range(n)
+    ])
+
+
+def test_isotonic_known_fit():
+    assert _isotonic(np.array([1, 3, 2, 4])).tolist() == [1, 2.5, 2.5, 4]
+    assert _isotonic(np.array([5, 4, 3])).tolist() == [4, 4, 4]
+    assert _isotonic(np.array([0, 1, 1, 5])).tolist() == [0, 1, 1, 5]
+    assert len(_isotonic(np.array([]))) == 0
+
+
+def test_isotonic_matches_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        y = rng.integers(0, 6, rng.integers(1, 15)).astype(float)
+        fit = _isotonic(y)
+        assert np.all(np.diff(fit) >= 0)
+        assert np.isclose(fit.sum(), y.sum())
+        assert np.allclose(fit, _reference_isotonic(y))
+
+
+def test_calibration_sample_size():
+    assert calibration_sample_size(60, 0.25, 12) == 15
+    assert calibration_sample_size(20, 0.25, 12) == 12
+    assert calibration_sample_size(8, 0.25, 12) == 8
+    assert calibration_sample_size(1000, 0.1, 12) == 100
+    assert calibration_sample_size(0, 0.25, 12) == 0
+
+
+def test_calibration_sample_spans_score_range():
+    scores = np.random.default_rng(1).normal(size=100)
+    picks = calibration_sample(scores, 10)
+    assert len(picks) == 10 and len(set(picks.tolist())) == 10
+    assert scores[picks].min() == scores.min() and scores[picks].max() == scores.max()
+    assert sorted(calibration_sample(scores[:5], 10).tolist()) == list(range(5))
+
+
+def test_predict_and_agreement():
+    ce = [float(x) for x in range(12)]
+    llm = [0, 0, 0, 1, 1, 1, 3, 3, 3, 5, 5, 5]
+    calibration = RelevanceCalibration(ce, llm, neighbours=3)
+    grades, agreement = calibration.predict([1.0, 10.0, 4.0])
+    assert grades.tolist() == [0, 5, 1]
+    assert agreement.tolist() == [1.0, 1.0, 1.0]
+    # Between two grade levels the neighbours disagree
+    _, agreement = calibration.predict([5.5])
+    assert agreement[0] < 1.0
+    grades, agreement = RelevanceCalibration([], []).predict([0.3])
+    assert grades.tolist() == [2] and agreement.tolist() == [0.0]
+
+
+def test_leave_one_out_stats():
+    ce = [float(x) for x in range(12)]
+    llm = [0, 0, 0, 1, 1, 1, 3, 3, 3, 5, 5, 5]
+    calibration = RelevanceCalibration(ce, llm, neighbours=3)
+    stats = calibration.agreement_stats(min_agreement=0.6)
+
+    # Same statistics computed directly
+    grades, agreement = [], []
+    for i in range(len(ce)):
+        rest = RelevanceCalibration(ce[:i] + ce[i + 1:], llm[:i] + llm[i + 1:], neighbours=3)
+        g, a = rest.predict([ce[i]])
+        grades.append(g[0])
+        agreement.append(a[0])
+    diff = np.abs(np.array(grades) - np.array(llm))
+    assert stats["sample"] == 12
+    assert stats["exact"] == pytest.approx(np.mean(diff == 0))
+    assert stats["mae"] == pytest.approx(diff.mean())
+    assert stats["accepted"] == pytest.approx(np.mean(np.array(agreement) >= 0.6))
+    assert stats["spearman"] > 0.9
+    # The fit never sees the held-out grade, so a lone outlier is not reproduced
+    outlier = RelevanceCalibration(ce, llm[:6] + [0] + llm[7:], neighbours=3).agreement_stats()
+    assert outlier["exact"] < 1.0
+    assert RelevanceCalibration([1.0], [3]).agreement_stats() == {"sample": 1}
+    assert RelevanceCalibration([1.0, 2.0, 3.0], [3, 3, 3]).agreement_stats()["spearman"] is None
+
+
+def test_proxy_round_trip_and_grades():
+    calibration = RelevanceCalibration([0.0, 1.0, 2.0, 3.0], [0, 0, 5, 5], neighbours=2)
+    key = RelevanceProxy.slot_key("improved", "case-1", 0)
+    sampled = RelevanceProxy.slot_key("improved", "case-1", 1)
+    proxy = RelevanceProxy(calibration, {key: 3.0, sampled: 0.0}, {sampled: [0, {"calls": 1}]}, 1.0)
+    again = RelevanceProxy.from_dict(proxy.as_dict())
+    for p in (proxy, again):
+        assert p.grade("improved", "case-1", 0) == 5
+        assert p.grade("improved", "case-2", 0) is None
+        assert p.sample_results("improved", "case-1") == {("relevance", 1): [0, {"calls": 1}]}
+
+
+def test_calibrate_grades_a_fraction_of_passages():
+    df = pd.DataFrame([
+        {
+            "system": "improved",
+            "case_id": f"case-{i}",
+            "query": f"question {i}",
+            "evidence_texts": [f"passage {i}.{j}" for j in range(3)],
+        }
+        for i in range(20)
+    ])
+    client = FakeClient()
+    proxy = calibrate_relevance_proxy(
+        client, lambda pairs: np.arange(len(pairs), dtype=float), [df], sample_fraction=0.25, max_workers=2
+    )
+    assert len(proxy.scores) == 60
+    assert len(proxy.sample) == client.calls == calibration_sample_size(60, 0.25)
@@ -0,0 +1,159 @@
+import numpy as np
+
+from src.retriever import Candidates
+
+QUERIES = ["cat asthma cough", "dog kidney renal failure", "feline fever lethargy"]
+
+
+def test_retrieve_many_matches_single_queries(make_retriever):
+    retriever = make_retriever(query_cache_size=0, rerank_cache_size=0)
+    batched = retriever.retrieve_many(QUERIES, adaptive=False)
+    for query, frame in zip(QUERIES, batched):
+        single = retriever.retrieve_with_rerank(query, adaptive=False)
+        assert frame["doc_id"].tolist() == single["doc_id"].tolist()
+        assert np.allclose(frame["combined_score"], single["combined_score"])
+
+
+def test_retrieve_many_batches_model_calls(make_retriever, embedder, monkeypatch):
+    retriever = make_retriever(query_cache_size=0, rerank_cache_size=0)
+    calls = []
+    encode = embedder.encode
+    monkeypatch.setattr(embedder, "encode", lambda texts, **kw: calls.append(len(texts)) or encode(texts, **kw))
+    predicts = []
+    predict = retriever.reranker.predict
+    monkeypatch.setattr(retriever.reranker, "predict", lambda pairs, **kw: predicts.append(len(pairs)) or predict(pairs))
+
+    retriever.retrieve_many(QUERIES, adaptive=False)
+    assert calls == [len(QUERIES)]
+    assert len(predicts) == 1
+
+
+def test_retrieve_many_empty(make_retriever):
+    assert make_retriever().retrieve_many([]) == []
+
+
+def test_candidates_top_k_and_frame():
+    docs = [{"doc_id": i, "page": i, "text": f"t{i}", "tag": "general"} for i in range(5)]
+    cand = Candidates(np.array([4, 1, 3, 0]), {"hybrid_score": np.array([0.1, 0.9, 0.5, 0.7])})
+    top = cand.top_k("hybrid_score", 2)
+    assert top.doc_idx.tolist() == [1, 0]
+    assert top.scores["hybrid_score"].tolist() == [0.9, 0.7]
+    frame = cand.top_k("hybrid_score", 10).to_frame(docs)
+    assert frame["doc_id"].tolist() == [1, 0, 3, 4]
+    assert frame["text"].tolist() == ["t1", "t0", "t3", "t4"]
+    assert Candidates(np.zeros(0, dtype=np.int64)).empty
+
+
+def test_fuse_candidates(make_retriever):
+    retriever = make_retriever()
+    dense = (np.array([3, 1]), np.array([0.9, 0.5]))
+    bm25 = (np.array([1, 7]), np.array([4.0, 2.0]))
+    cand = retriever._fuse_candidates(dense, bm25, alpha=0.5, top_k=3)
+    assert cand.doc_idx.tolist() == [1, 3, 7]
+    by_doc = dict(zip(cand.doc_idx.tolist(), cand.scores["hybrid_score"].tolist()))
+    # doc 1: dense 0.5 -> 5/9 normalised, bm25 4.0 -> 1.0
+    assert np.isclose(by_doc[1], 0.5 * (0.5 / 0.9) + 0.5)
+    assert np.isclose(by_doc[3], 0.5)
+    assert cand.scores["dense_score"][cand.doc_idx.tolist().index(7)] == 0
+
+
+def test_as_frame_false_returns_candidates(make_retriever):
+    retriever = make_retriever()
+    frames = retriever.hybrid_candidates_many(QUERIES, as_frame=True)
+    arrays = retriever.hybrid_candidates_many(QUERIES, as_frame=False)
+    for frame, cand in zip(frames, arrays):
+        assert isinstance(cand, Candidates)
+        assert frame["doc_id"].tolist() == cand.to_frame(retriever.docs)["doc_id"].tolist()
+
+
+def test_compressed_index_rescores_exactly(embedder, reranker):
+    from src.embeddings import build_faiss_index
+    from src.retriever import VetRetriever
+
+    from conftest import make_docs
+
+    docs = make_docs(200)
+    embs = embedder.encode([d["text"] for d in docs])
+    exact = VetRetriever(docs, embs, build_faiss_index(embs), query_embedder=embedder, reranker=reranker)
+    sq8 = VetRetriever(docs, embs, build_faiss_index(embs, storage="int8"),
+                       query_embedder=embedder, reranker=reranker)
+    assert exact.rescore_factor == 1 and sq8.rescore_factor > 1
+    for (idx, scores), (ref_idx, ref_scores) in zip(sq8._dense_hits_many(QUERIES, 10),
+                                                    exact._dense_hits_many(QUERIES, 10)):
+        # Scores are exact inner products with the float32 embeddings
+        assert np.allclose(scores, ref_scores, atol=1e-5)
+        assert set(idx.tolist()) == set(ref_idx.tolist())
+
+
+def test_caches_skip_model_calls(make_retriever, reranker):
+    retriever = make_retriever()
+    first = retriever.retrieve_many(QUERIES, adaptive=False)
+    pairs = reranker.pairs
+    # Same queries up to case and whitespace hit both caches
+    again = retriever.retrieve_many([q.upper() + "  " for q in QUERIES], adaptive=False)
+    assert reranker.pairs == pairs
+    for a, b in zip(first, again):
+        assert a["doc_id"].tolist() == b["doc_id"].tolist()
+    stats = retriever.cache_stats()
+    assert stats["query_embedding"]["hits"] == len(QUERIES)
+    assert stats["rerank"]["hits"] > 0
+
+
+def test_save_and_load_caches(make_retriever, reranker, tmp_path, monkeypatch):
+    import src.retriever as retriever_module
+
+    retriever = make_retriever()
+    expected = retriever.retrieve_many(QUERIES, adaptive=False)
+    path = tmp_path / "caches.npz"
+    retriever.save_caches(path)
+
+    fresh = make_retriever()
+    assert fresh.load_caches(path)
+    assert len(fresh.query_cache) == len(retriever.query_cache)
+    pairs = reranker.pairs
+    got = fresh.retrieve_many(QUERIES, adaptive=False)
+    assert reranker.pairs == pairs
+    for a, b in zip(expected, got):
+        assert a["doc_id"].tolist() == b["doc_id"].tolist()
+        assert np.allclose(a["rerank_score"], b["rerank_score"])
+
+    # Caches written for other models are not loaded
+    monkeypatch.setattr(retriever_module, "INFERENCE_BACKEND", "int8")
+    other = make_retriever()
+    assert not other.load_caches(path)
+    assert len(other.query_cache) == 0
+    assert not make_retriever().load_caches(tmp_path / "missing.npz")
+
+
+def _candidate_sets(retriever, top_k=30):
+    return retriever.hybrid_candidates_many(QUERIES, top_k=top_k, as_frame=False)
+
+
+def test_cascade_with_unbounded_margin_matches_full_rerank(make_retriever):
+    retriever = make_retriever(n=120, rerank_cache_size=0)
+    full = retriever.retrieve_many(QUERIES, top_k_final=5, adaptive=False, as_frame=False)
+    cascade = retriever._cascade_rerank(QUERIES, _candidate_sets(retriever), 5, stage_size=7, margin=np.inf)
+    for a, b in zip(full, cascade):
+        assert a.doc_idx.tolist() == b.doc_idx.tolist()
+        assert np.allclose(a.scores["combined_score"], b.scores["combined_score"])
+
+
+def test_cascade_stops_early(make_retriever, reranker, monkeypatch):
+    retriever = make_retriever(n=120, rerank_cache_size=0)
+    candidate_sets = _candidate_sets(retriever)
+    stage_calls = []
+    # A cross-encoder that scores every pair the same cannot lift a later
+    # candidate past the current top results, so one stage is enough.
+    monkeypatch.setattr(reranker, "predict", lambda pairs, **kw: stage_calls.append(len(pairs)) or np.zeros(len(pairs)))
+    results = retriever._cascade_rerank(QUERIES, candidate_sets, 5, stage_size=10, margin=0.0)
+    # One cross-encoder call covers the first stage of every query
+    assert stage_calls == [10 * len(QUERIES)]
+    for cand, full in zip(results, candidate_sets):
+        assert cand.doc_idx.tolist() == full.top_k("hybrid_score", 5).doc_idx.tolist()
+
+
+def test_small_corpus_drops_faiss_padding(make_retriever):
+    retriever = make_retriever(n=12)
+    for frame in retriever.retrieve_many(QUERIES, k_dense=80, top_k_final=20, adaptive=True):
+        assert frame["doc_id"].between(0, 11).all()
+        assert np.isfinite(frame["dense_score"]).all()
@@ -0,0 +1,178 @@
+import asyncio
+import json
+
+import pytest
+
+import src.server as server_module
+from src.server import MicroBatcher, VetRAGServer
+
+from conftest import FakeClient
+
+CASE = {"case": {"species": "cat", "key_signs": ["sneezing", "nasal discharge"]}}
+
+
+async def _request(port, method, path, body=None, headers=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = b"" if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+    head = f"{method} {path} HTTP/1.1\r\nHost: test\r\n"
+    for name, value in (headers or {"Content-Length": str(len(data))}).items():
+        head += f"{name}: {value}\r\n"
+    writer.write(head.encode() + b"\r\n" + data)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    if b"chunked" in head:
+        events = []
+        while payload:
+            size, _, rest = payload.partition(b"\r\n")
+            n = int(size, 16)
+            if n:
+                events.append(json.loads(rest[:n]))
+            payload = rest[n + 2:]
+        return status, events
+    return status, json.loads(payload)
+
+
+def _serve(service, scenario):
+    async def run():
+        service.batcher.start()
+        tcp = await asyncio.start_server(service._handle, "127.0.0.1", 0)
+        port = tcp.sockets[0].getsockname()[1]
+        try:
+            return await scenario(port)
+        finally:
+            tcp.close()
+            await service.batcher.stop()
+            service.cpu_pool.shutdown(wait=False)
+            service.io_pool.shutdown(wait=False)
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def service(make_retriever):
+    return VetRAGServer(FakeClient(), make_retriever(), max_wait_ms=20)
+
+
+def test_micro_batcher_coalesces_concurrent_submits():
+    calls = []
+
+    async def scenario():
+        batcher = MicroBatcher(lambda items: calls.append(list(items)) or [i * 2 for i in items],
+                               max_batch_size=4, max_wait_ms=50)
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        await batcher.stop()
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [0, 2, 4, 6, 8, 10]
+    assert [len(c) for c in calls] == [4, 2]
+    assert stats["largest_batch"] == 4
+
+
+def test_concurrent_retrieve_requests_share_a_batch(service):
+    queries = ["cat asthma cough", "dog kidney renal", "feline fever"]
+
+    async def scenario(port):
+        return await asyncio.gather(*(_request(port, "POST", "/retrieve", {"query": q}) for q in queries))
+
+    replies = _serve(service, scenario)
+    expected = service.retriever.retrieve_many(queries)
+    for (status, payload), q, frame in zip(replies, queries, expected):
+        assert status == 200 and payload["query"] == q
+        assert [e["doc_id"] for e in payload["evidence"]] == frame["doc_id"].tolist()
+    assert service.batcher.stats()["batches"] < len(queries)
+
+
+def test_bad_requests(service):
+    async def scenario(port):
+        return [
+            await _request(port, "GET", "/nowhere"),
+            await _request(port, "POST", "/retrieve", {"query": ""}),
+            await _request(port, "POST", "/retrieve", b"{not json"),
+            await _request(port, "POST", "/retrieve", {"query": "cat", "filter": {"colour": "red"}}),
+            await _request(port, "POST", "/answer/baseline", {"case": {"age": 3}}),
+            await _request(port, "POST", "/retrieve", headers={"Content-Length": "abc"}),
+        ]
+
+    statuses = [status for status, _ in _serve(service, scenario)]
+    assert statuses == [404, 400, 400, 400, 400, 400]
+
+
+def test_oversized_body_is_rejected_unread(service, monkeypatch):
+    monkeypatch.setattr(server_module, "SERVER_MAX_BODY_BYTES", 100)
+
+    async def scenario(port):
+        # Claims far more than it sends: the server must not wait for it
+        reply = await asyncio.wait_for(
+            _request(port, "POST", "/retrieve", headers={"Content-Length": str(10 ** 9)}), 5
+        )
+        return reply, await _request(port, "POST", "/retrieve", {"query": "cat asthma"})
+
+    (status, payload), (ok, _) = _serve(service, scenario)
+    assert status == 413 and "100 bytes" in payload["error"]
+    assert ok == 200
+
+
+@pytest.mark.parametrize("path", ["/answer/baseline", "/answer/improved"])
+def test_answer_streams_events(service, path):
+    events = _serve(service, lambda port: _request(port, "POST", path, CASE))[1]
+    names = [e["event"] for e in events]
+    expected = ["query", "sub_queries", "evidence", "answer"] if path.endswith("improved") else [
+        "query", "evidence", "answer"]
+    assert names == expected
+    assert events[-2]["evidence"]
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+def test_failed_decomposition_cancels_searches(make_retriever, monkeypatch, speculative):
+    monkeypatch.setattr(server_module, "SPECULATIVE_RETRIEVAL", speculative)
+
+    def failing(system, user):
+        raise RuntimeError("groq down")
+
+    service = VetRAGServer(FakeClient(failing), make_retriever(), max_wait_ms=1000)
+    searched = []
+    service._retrieve_batch = lambda items: searched.extend(items) or [None] * len(items)
+    pending = []
+    search = service._search
+
+    def tracked(query, filters=None):
+        task = asyncio.ensure_future(search(query, filters))
+        pending.append(task)
+        return task
+
+    service._search = tracked
+
+    async def scenario(port):
+        events = (await _request(port, "POST", "/answer/improved", CASE))[1]
+        return events, [task.done() for task in pending]
+
+    events, done = _serve(service, scenario)
+    assert [e["event"] for e in events] == ["query", "error"]
+    assert all(done)
+    assert searched == []
+
+
+def test_speculative_answer_has_same_evidence(make_retriever, monkeypatch):
+    streams = {}
+    for speculative in (False, True):
+        monkeypatch.setattr(server_module, "SPECULATIVE_RETRIEVAL", speculative)
+        service = VetRAGServer(FakeClient(), make_retriever(), max_wait_ms=20)
+        streams[speculative] = _serve(service, lambda port: _request(port, "POST", "/answer/improved", CASE))[1]
+    assert streams[True] == streams[False]
+
+
+@pytest.mark.parametrize("path", ["/answer/baseline", "/answer/improved"])
+def test_answer_prompt_uses_packed_evidence(service, monkeypatch, path):
+    packs = []
+    pack_evidence = server_module.pack_evidence
+    monkeypatch.setattr(server_module, "pack_evidence", lambda df: packs.append(pack_evidence(df)) or packs[-1])
+    prompts = []
+    service.client._reply = lambda system, user: prompts.append(user) or FakeClient().reply(system, user)
+    _serve(service, lambda port: _request(port, "POST", path, CASE))
+    assert len(packs) == 1
+    assert packs[0].text in prompts[-1]
@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.chunks import simple_tag_from_text
+from src.tagger import (
+    DEFAULT_TAG_VOCABULARY,
+    FALLBACK_TAG,
+    Tagger,
+    load_tag_vocabulary,
+    tag_chunks,
+)
+
+
+def _reference_labels(vocabulary, text):
+    t = text.lower()
+    return [label for label, terms in vocabulary.items() if any(term.lower() in t for term in terms if term)]
+
+
+def _old_simple_tag(text):
+    t = text.lower()
+    if "respiratory" in t or "nasal" in t:
+        return "respiratory"
+    if "gastro" in t or "vomit" in t or "diarrhea" in t:
+        return "gastrointestinal"
+    return "general"
+
+
+def _random_texts(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    pieces = [t for terms in DEFAULT_TAG_VOCABULARY.values() for t in terms]
+    pieces += ["the ", "cat ", "dog ", "Nasal", "VOMITING ", "é", "β-blocker ", "\n", "  ", "ab", "xyz"]
+    return [
+        "".join(rng.choice(pieces, rng.integers(0, 25))) for _ in range(n)
+    ] + ["", "anaemia", "ANEMIA", "cardiomyopathy with murmur"]
+
+
+def test_matches_substring_reference():
+    tagger = Tagger(DEFAULT_TAG_VOCABULARY)
+    texts = _random_texts()
+    batch = tagger.tag_batch(texts, batch_size=37)
+    for text, row in zip(texts, batch):
+        expected = _reference_labels(DEFAULT_TAG_VOCABULARY, text)
+        assert tagger.labels_of(row) == expected
+        assert tagger.labels_of(tagger.tag_text(text)) == expected
+
+
+def test_overlapping_and_nested_terms():
+    vocabulary = {"a": ["he"], "b": ["she"], "c": ["hers"], "d": ["his"], "e": ["s"]}
+    tagger = Tagger(vocabulary)
+    for text in ["ushers", "this", "shhe", "h", ""]:
+        assert tagger.labels_of(tagger.tag_text(text)) == _reference_labels(vocabulary, text)
+        assert tagger.labels_of(tagger.tag_batch([text])[0]) == _reference_labels(vocabulary, text)
+
+
+def test_more_than_64_labels():
+    vocabulary = {f"label{j}": [f"term{j}x"] for j in range(130)}
+    tagger = Tagger(vocabulary, primary_tags=["label129", "label3"])
+    assert tagger.n_words == 3
+    texts = ["term3x and term129x", "term64x", "term1x term12x", "nothing"]
+    bits = tagger.tag_batch(texts)
+    assert bits.shape == (4, 3)
+    for text, row in zip(texts, bits):
+        assert tagger.labels_of(row) == _reference_labels(vocabulary, text)
+    assert tagger.has_label(bits, "label64").tolist() == [False, True, False, False]
+    assert [tagger.primary_tag(row) for row in bits] == ["label129", FALLBACK_TAG, FALLBACK_TAG, FALLBACK_TAG]
+
+
+def test_primary_tag_matches_simple_tag_chain():
+    tagger = Tagger(DEFAULT_TAG_VOCABULARY)
+    texts = _random_texts(seed=1)
+    for text, row in zip(texts, tagger.tag_batch(texts)):
+        assert tagger.primary_tag(row) == _old_simple_tag(text)
+        assert simple_tag_from_text(text) == _old_simple_tag(text)
+
+
+def test_tag_chunks():
+    chunks = [{"text": "Nasal discharge and vomiting in a cat with renal disease"}, {"text": "Dosage table"}]
+    tag_chunks(chunks, Tagger(DEFAULT_TAG_VOCABULARY))
+    assert chunks[0]["tag"] == "respiratory"
+    assert chunks[0]["tags"] == ["respiratory", "gastrointestinal", "urinary"]
+    assert chunks[1]["tag"] == "general" and chunks[1]["tags"] == []
+
+
+def test_load_tag_vocabulary(tmp_path):
+    assert load_tag_vocabulary(None) is DEFAULT_TAG_VOCABULARY
+    path = tmp_path / "vocab.json"
+    path.write_text(json.dumps({"zoonotic": ["rabies", "leptospir"], "respiratory": ["cough"]}))
+    vocabulary = load_tag_vocabulary(str(path))
+    assert list(vocabulary) == ["zoonotic", "respiratory"]
+    tagger = Tagger(vocabulary)
+    assert tagger.primary_tags == ["respiratory"]
+    assert tagger.labels_of(tagger.tag_text("Leptospirosis with cough")) == ["zoonotic", "respiratory"]
+
+
+@pytest.mark.parametrize("batch_size", [1, 4, 1024])
+def test_batch_size_does_not_change_tags(batch_size):
+    tagger = Tagger(DEFAULT_TAG_VOCABULARY)
+    texts = _random_texts(n=50, seed=2)
+    assert np.array_equal(tagger.tag_batch(texts, batch_size=batch_size), tagger.tag_batch(texts))
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from src.embeddings import build_faiss_index
+from src.index_store import load_index, save_index
+from src.retriever import VetRetriever
+
+from conftest import make_docs
+
+PARAMS = {"format_version": 2, "pdf_sha256": "abc"}
+QUERY = "horse colic laminitis"
+NEW = [{"page": 99, "text": "horse colic laminitis hoof"}, {"page": 99, "text": "horse colic surgery"}]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_add_and_remove_documents(make_retriever, index_type):
+    retriever = make_retriever(n=80, index_type=index_type, query_cache_size=0, rerank_cache_size=0)
+    ids = retriever.add_documents(NEW)
+    assert ids == [80, 81]
+    assert retriever.docs[80]["tag"]
+    top = retriever.retrieve_with_rerank(QUERY, top_k_final=2, adaptive=False)
+    assert sorted(top["doc_id"].tolist()) == [80, 81]
+
+    assert retriever.remove_documents([80]) == [80]
+    # Already removed ids are skipped
+    assert retriever.remove_documents([80]) == []
+    top = retriever.retrieve_with_rerank(QUERY, top_k_final=5, adaptive=False)
+    assert 80 not in top["doc_id"].tolist()
+    assert 81 in top["doc_id"].tolist()
+
+
+def test_remove_by_source(make_retriever):
+    retriever = make_retriever()
+    ids = retriever.add_documents(NEW, source="notes")
+    assert retriever.remove_documents(source="notes") == ids
+
+
+@pytest.mark.parametrize("doc_id", [60, -1])
+def test_remove_unknown_doc_id(make_retriever, doc_id):
+    retriever = make_retriever(n=60)
+    with pytest.raises(KeyError):
+        retriever.remove_documents([doc_id])
+    assert retriever.bm25.live.all()
+
+
+def test_deltas_replay_after_reload(tmp_path, embedder, reranker):
+    docs = make_docs(40)
+    embs = embedder.encode([d["text"] for d in docs])
+    retriever = VetRetriever(docs, embs, build_faiss_index(embs), query_embedder=embedder, reranker=reranker)
+    save_index(tmp_path, PARAMS, docs, embs, retriever.faiss_index, retriever.bm25)
+    retriever.store_dir = tmp_path
+    retriever.add_documents(NEW)
+    retriever.remove_documents([3, 40])
+
+    artifact = load_index(tmp_path, PARAMS)
+    assert [len(d.added) for d in artifact.deltas] == [2, 0]
+    replayed = VetRetriever(
+        artifact.docs, artifact.embs, artifact.faiss_index, bm25=artifact.bm25,
+        query_embedder=embedder, reranker=reranker,
+    )
+    for delta in artifact.deltas:
+        replayed.add_documents(delta.added, embs=delta.embs, persist=False)
+        replayed.remove_documents(delta.removed, persist=False)
+    assert replayed.bm25.live.tolist() == retriever.bm25.live.tolist()
+    expected = retriever.retrieve_with_rerank(QUERY, adaptive=False)
+    got = replayed.retrieve_with_rerank(QUERY, adaptive=False)
+    assert got["doc_id"].tolist() == expected["doc_id"].tolist()